@@ -1,14 +1,38 @@
-from .config import AzureOpenAIConfig
-from .document_processor import DocumentProcessor
-from .vector_store import PineconeManager
-from .conversation import Conversation, ConversationalAgent
-from .retrieval_system import RetrievalSystem
-
-__all__ = [
-    'AzureOpenAIConfig',
-    'DocumentProcessor',
-    'PineconeManager',
-    'Conversation',
-    'ConversationalAgent',
-    'RetrievalSystem'
-]
\ No newline at end of file
+import importlib
+
+# Submodules are imported on first attribute access, so importing one module
+# (e.g. LLMres.embed) does not pull in every SDK the package can use
+_EXPORTS = {
+    'AzureOpenAIConfig': 'config',
+    'VectorStoreConfig': 'config',
+    'ConversationStoreConfig': 'config',
+    'RetrieverConfig': 'config',
+    'DocumentProcessor': 'document_processor',
+    'PineconeManager': 'vector_store',
+    'LocalVectorStore': 'local_vector_store',
+    'LocalVectorStoreManager': 'local_vector_store',
+    'IVFIndex': 'ann_index',
+    'BM25Index': 'bm25',
+    'HybridRetriever': 'hybrid_retriever',
+    'ContextSelector': 'rerank',
+    'RerankingRetriever': 'rerank',
+    'InMemoryConversationStore': 'conversation_store',
+    'SQLiteConversationStore': 'conversation_store',
+    'Conversation': 'conversation',
+    'ConversationalAgent': 'conversation',
+    'RetrievalSystem': 'retrieval_system'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,183 @@
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a LocalVectorStore matrix.
+
+    Vectors are clustered with spherical k-means; a query is only scored
+    against the rows in its ``nprobe`` closest clusters. The index keeps just
+    the centroids and one cluster assignment per row, aligned with the store's
+    row order, so it never duplicates the embeddings themselves.
+
+    Until ``train_threshold`` rows exist the index stays untrained and callers
+    fall back to exact search. It retrains once the store has grown by
+    ``retrain_growth`` since the last training so clusters stay balanced;
+    in between, new rows are assigned to their nearest existing centroid.
+    """
+
+    INDEX_FILE = "ivf.npz"
+
+    def __init__(self,
+                 nprobe: int = 8,
+                 train_threshold: int = 1024,
+                 retrain_growth: float = 4.0,
+                 n_lists: Optional[int] = None,
+                 kmeans_iterations: int = 15,
+                 seed: int = 0):
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.retrain_growth = retrain_growth
+        self.fixed_n_lists = n_lists
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def n_lists(self) -> int:
+        return 0 if self.centroids is None else self.centroids.shape[0]
+
+    def _choose_n_lists(self, n: int) -> int:
+        if self.fixed_n_lists:
+            return min(self.fixed_n_lists, n)
+        return max(1, min(n, int(4 * np.sqrt(n))))
+
+    def _kmeans(self, vectors: np.ndarray, n_lists: int) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        # Train on a sample; ~32 points per list is plenty for stable centroids
+        sample_size = min(len(vectors), n_lists * 32)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            order = np.argsort(labels, kind="stable")
+            present = np.flatnonzero(counts)
+            starts = np.concatenate([[0], np.cumsum(counts)])[present]
+            sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+        return centroids.astype(np.float32)
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            block = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            labels[start:start + batch_size] = np.argmax(block @ self.centroids.T, axis=1)
+        return labels
+
+    def _rebuild_lists(self):
+        # CSR layout: rows sorted by cluster, offsets[c]:offsets[c + 1] is cluster c
+        self._order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(self.assignments, minlength=self.n_lists)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def train(self, matrix: np.ndarray):
+        vectors = np.asarray(matrix, dtype=np.float32)
+        self.centroids = self._kmeans(vectors, self._choose_n_lists(len(vectors)))
+        self.assignments = self._assign(vectors)
+        self.trained_size = len(vectors)
+        self._rebuild_lists()
+
+    def keep(self, rows: List[int]):
+        """Drop every row not in ``rows`` (the rows the store kept, in order)."""
+        if self.is_trained:
+            self.assignments = self.assignments[np.asarray(rows, dtype=np.int64)]
+            self._rebuild_lists()
+
+    def add(self, vectors: np.ndarray):
+        """Assign rows appended to the end of the store's matrix."""
+        if self.is_trained and len(vectors):
+            self.assignments = np.concatenate([self.assignments, self._assign(vectors)])
+            self._rebuild_lists()
+
+    def needs_training(self, n: int) -> bool:
+        """Whether a store of ``n`` rows should (re)train the index."""
+        return n >= self.train_threshold and (not self.is_trained or n >= self.trained_size * self.retrain_growth)
+
+    def maybe_train(self, matrix: np.ndarray) -> bool:
+        n = 0 if matrix is None else len(matrix)
+        if n < self.train_threshold:
+            if self.is_trained:
+                self.reset()
+            return False
+        if self.needs_training(n):
+            self.train(matrix)
+            return True
+        return False
+
+    def reset(self):
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._order = None
+        self._offsets = None
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.n_lists)
+        return np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probes])
+
+    def search(self,
+               matrix: np.ndarray,
+               query: np.ndarray,
+               k: int,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self.candidates(query, nprobe)
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+        rows.sort()  # sequential reads from the memory-mapped matrix
+        scores = np.asarray(matrix[rows], dtype=np.float32) @ query
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def save(self, directory: str):
+        path = os.path.join(directory, self.INDEX_FILE)
+        if not self.is_trained:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path,
+                 centroids=self.centroids,
+                 assignments=self.assignments,
+                 trained_size=np.array(self.trained_size))
+        os.replace(tmp_path, path)
+
+    def load(self, directory: str, n_rows: int) -> bool:
+        path = os.path.join(directory, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            assignments = data["assignments"]
+            if len(assignments) != n_rows:
+                # Out of step with the store (e.g. written by an older run); rebuild instead
+                return False
+            self.centroids = data["centroids"]
+            self.assignments = assignments
+            self.trained_size = int(data["trained_size"])
+        self._rebuild_lists()
+        return True
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_VERSION_PATH = "data/index_version"
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r"[\s\?\!\.\,]+", " ", text.strip().lower()).strip()
+
+
+def read_index_version(path: str = None) -> str:
+    path = path or os.getenv("INDEX_VERSION_PATH", DEFAULT_INDEX_VERSION_PATH)
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_index_version(path: str = None) -> str:
+    """Mark the vector index as changed so cached answers built on the old one are dropped."""
+    path = path or os.getenv("INDEX_VERSION_PATH", DEFAULT_INDEX_VERSION_PATH)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    version = uuid.uuid4().hex
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+
+class AnswerCache:
+    """Semantic cache of answers to first-turn questions.
+
+    A question is answered from the cache when it matches a stored one exactly
+    (after normalisation) or its embedding has cosine similarity of at least
+    ``threshold`` with one. Entries expire after ``ttl_seconds``, the least
+    recently used are evicted past ``max_entries``, and everything is dropped
+    when the index version stamp written by ``bump_index_version`` changes.
+    """
+
+    def __init__(self,
+                 embedding_model,
+                 threshold: Optional[float] = None,
+                 ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None,
+                 version_path: Optional[str] = None):
+        self.embedding_model = embedding_model
+        # 0.0 is a valid threshold (match any question), so only None falls back
+        self.threshold = threshold if threshold is not None else float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl_seconds = ttl_seconds or float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+        self.max_entries = max_entries or int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+        self.version_path = version_path or os.getenv("INDEX_VERSION_PATH", DEFAULT_INDEX_VERSION_PATH)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._version = read_index_version(self.version_path)
+        self._version_mtime = self._stat_version()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0,
+                         "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _stat_version(self) -> float:
+        try:
+            return os.stat(self.version_path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def _check_version(self):
+        mtime = self._stat_version()
+        if mtime == self._version_mtime:
+            return
+        self._version_mtime = mtime
+        version = read_index_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            if self._entries:
+                logger.info("Index re-built, dropping cached answers")
+                self.counters["invalidations"] += 1
+            self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    async def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(await self.embedding_model.aembed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _similar(self, vector: np.ndarray) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = (np.stack([self._entries[k]["vector"] for k in self._matrix_keys])
+                            if self._matrix_keys else None)
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return self._matrix_keys[best]
+        return None
+
+    def _fresh(self, key: str) -> bool:
+        if time.time() - self._entries[key]["created"] > self.ttl_seconds:
+            self._remove(key)
+            self.counters["expirations"] += 1
+            return False
+        return True
+
+    async def lookup(self, question: str) -> Optional[str]:
+        self._check_version()
+        key = normalize_question(question)
+        if key in self._entries and self._fresh(key):
+            self._entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return self._entries[key]["answer"]
+
+        if self._entries:
+            match = self._similar(await self._embed(question))
+            if match is not None and self._fresh(match):
+                self._entries.move_to_end(match)
+                self.counters["semantic_hits"] += 1
+                return self._entries[match]["answer"]
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, question: str, answer: str):
+        if not answer:
+            return
+        self._check_version()
+        key = normalize_question(question)
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {"answer": answer, "vector": await self._embed(question), "created": time.time()}
+        self._matrix = None
+        self.counters["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "index_version": self._version,
+        }
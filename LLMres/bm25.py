@@ -0,0 +1,185 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+try:
+    from pythainlp.tokenize import word_tokenize as thai_word_tokenize
+except ImportError:  # pythainlp is optional; Thai falls back to character bigrams
+    thai_word_tokenize = None
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# Digit groups joined by at most one space, dot or hyphen, so "2019 - 2023" or
+# "1, 2, 3" never run together into one number
+PHONE_PATTERN = re.compile(r"\+?\(?\d+\)?(?:[ .-]?\(?\d+\)?)*")
+PHONE_MIN_DIGITS = 9
+PHONE_MAX_DIGITS = 15
+THAI_RUN_PATTERN = re.compile(r"[\u0e00-\u0e7f]+")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+# Thai combining vowels and tone marks never start a bigram on their own
+THAI_COMBINING = set("ัิีึืฺุู็่้๊๋์ํ๎")
+
+# Bumped whenever tokenize() changes, so saved indexes are re-tokenised on load
+TOKENIZER_VERSION = 2
+
+
+def tokenizer_name() -> str:
+    name = "pythainlp" if thai_word_tokenize is not None else "bigram"
+    return f"{name}-v{TOKENIZER_VERSION}"
+
+
+def _phone_digits(candidate: str) -> Optional[str]:
+    groups = re.findall(r"\d+", candidate)
+    digits = "".join(groups)
+    if not PHONE_MIN_DIGITS <= len(digits) <= PHONE_MAX_DIGITS:
+        return None
+    # "2019 2020 2021": lists of years are not phone numbers
+    if len(groups) > 1 and all(len(group) == 4 for group in groups):
+        return None
+    return digits
+
+
+def _thai_tokens(run: str) -> List[str]:
+    if thai_word_tokenize is not None:
+        return [token for token in thai_word_tokenize(run, engine="newmm", keep_whitespace=False) if token.strip()]
+    # Thai has no spaces between words; overlapping bigrams of base characters
+    # match a query word wherever it appears inside a run
+    chars = [c for c in run if c not in THAI_COMBINING]
+    if len(chars) < 2:
+        return chars
+    return [chars[i] + chars[i + 1] for i in range(len(chars) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Split Thai/English text into BM25 terms.
+
+    English is lower-cased and split on anything that is not a letter or
+    digit. Email addresses are also kept whole and phone numbers as their bare
+    digits, so "+66 625545554" and "0625545554"-style queries still hit.
+    """
+    text = text.lower()
+    tokens = [match.group(0) for match in EMAIL_PATTERN.finditer(text)]
+    for match in PHONE_PATTERN.finditer(text):
+        digits = _phone_digits(match.group(0))
+        if digits is None:
+            continue
+        tokens.append(digits)
+        if len(digits) > 9:
+            # Local form without the country code
+            tokens.append(digits[-9:])
+    for run in THAI_RUN_PATTERN.findall(text):
+        tokens.extend(_thai_tokens(run))
+    tokens.extend(WORD_PATTERN.findall(text))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the chunks in the vector store.
+
+    Chunks are keyed by the same content-derived IDs as the vectors, so they
+    are added and removed alongside them during ingestion. The index is a
+    JSON file of per-chunk term counts, text and metadata; postings and
+    document frequencies are rebuilt from it on load.
+    """
+
+    def __init__(self, path: str, k1: Optional[float] = None, b: Optional[float] = None):
+        self.path = path
+        self.k1 = k1 or float(os.getenv("BM25_K1", "1.5"))
+        self.b = b or float(os.getenv("BM25_B", "0.75"))
+        self._lock = threading.Lock()
+        self.docs: Dict[str, Dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        retokenize = data.get("tokenizer") != tokenizer_name()
+        for chunk_id, doc in data.get("docs", {}).items():
+            terms = Counter(tokenize(doc["text"])) if retokenize else doc["terms"]
+            self._index(chunk_id, doc["text"], doc.get("metadata", {}), terms)
+        self.dirty = retokenize
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"tokenizer": tokenizer_name(), "docs": self.docs}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+
+    def _index(self, chunk_id: str, text: str, metadata: Dict, terms: Dict[str, int]):
+        self.docs[chunk_id] = {"text": text, "metadata": metadata, "terms": dict(terms)}
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        length = sum(terms.values())
+        self.doc_lengths[chunk_id] = length
+        self.total_length += length
+
+    def _unindex(self, chunk_id: str):
+        doc = self.docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        for term in doc["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id, 0)
+
+    def add(self, documents: List[Document], ids: List[str]):
+        with self._lock:
+            for doc, chunk_id in zip(documents, ids):
+                self._unindex(chunk_id)
+                self._index(chunk_id, doc.page_content, dict(doc.metadata), Counter(tokenize(doc.page_content)))
+            self.dirty = self.dirty or bool(ids)
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                if chunk_id in self.docs:
+                    self._unindex(chunk_id)
+                    self.dirty = True
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.docs)
+            if not n_docs or not terms:
+                return []
+            avg_length = self.total_length / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [
+                (Document(page_content=self.docs[chunk_id]["text"],
+                          metadata={**self.docs[chunk_id]["metadata"], "id": chunk_id}),
+                 score)
+                for chunk_id, score in top
+            ]
+
+    def __len__(self) -> int:
+        return len(self.docs)
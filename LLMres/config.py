@@ -1,6 +1,5 @@
 import os
 from dotenv import load_dotenv
-from langchain_openai import AzureChatOpenAI
 
 class AzureOpenAIConfig:
     
@@ -11,9 +10,125 @@ class AzureOpenAIConfig:
         self.deployment = os.getenv("MODEL_NAME")
         self.api_version = "2024-05-01-preview"
 
-    def create_llm(self) -> AzureChatOpenAI:
-        return AzureChatOpenAI(
+    def create_llm(self):
+        # Shared instance: one connection pool and one concurrency limit for every caller
+        from llm_pool import get_llm_pool
+        return get_llm_pool().get_llm(
             azure_endpoint=self.endpoint,
             azure_deployment=self.deployment,
-            openai_api_version=self.api_version,
-        )
\ No newline at end of file
+            api_version=self.api_version,
+        )
+
+class VectorStoreConfig:
+
+    def __init__(self):
+        load_dotenv()
+        self.backend = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+        self.local_dir = os.getenv("LOCAL_VECTOR_DIR", "data/vector_store")
+        self.local_dtype = os.getenv("LOCAL_VECTOR_DTYPE", "float32")
+        self.ann_index = os.getenv("LOCAL_ANN_INDEX", "ivf").lower()
+        self.ann_nprobe = int(os.getenv("ANN_NPROBE", "8"))
+        self.ann_train_threshold = int(os.getenv("ANN_TRAIN_THRESHOLD", "1024"))
+
+    def create_manager(self, pinecone_api_key: str = None, pinecone_environment: str = None):
+        if self.backend == "local":
+            from local_vector_store import LocalVectorStoreManager
+            return LocalVectorStoreManager(
+                base_dir=self.local_dir,
+                dtype=self.local_dtype,
+                ann=self.ann_index,
+                ann_nprobe=self.ann_nprobe,
+                ann_train_threshold=self.ann_train_threshold
+            )
+        if self.backend == "pinecone":
+            from vector_store import PineconeManager
+            return PineconeManager(api_key=pinecone_api_key, environment=pinecone_environment)
+        raise ValueError(f"Unknown VECTOR_BACKEND '{self.backend}'. Use 'pinecone' or 'local'.")
+
+class ConversationStoreConfig:
+
+    def __init__(self):
+        load_dotenv()
+        self.workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+        # Worker processes only see each other's conversations through the SQLite store
+        self.backend = os.getenv("CONVERSATION_STORE", "sqlite" if self.workers > 1 else "memory").lower()
+        self.db_path = os.getenv("CONVERSATION_DB_PATH", "data/conversations.sqlite3")
+        self.max_threads = int(os.getenv("CONVERSATION_MAX_THREADS", "10000"))
+        self.ttl_seconds = float(os.getenv("CONVERSATION_TTL_SECONDS", "86400"))
+        self.max_messages = int(os.getenv("CONVERSATION_MAX_MESSAGES", "50"))
+
+    def create_store(self):
+        from conversation_store import InMemoryConversationStore, SQLiteConversationStore
+        options = dict(
+            max_threads=self.max_threads,
+            ttl_seconds=self.ttl_seconds,
+            max_messages=self.max_messages
+        )
+        if self.backend == "memory":
+            if self.workers > 1:
+                print(f"Warning: CONVERSATION_STORE=memory with {self.workers} workers; "
+                      "each worker keeps its own history. Use CONVERSATION_STORE=sqlite.")
+            return InMemoryConversationStore(**options)
+        if self.backend == "sqlite":
+            return SQLiteConversationStore(path=self.db_path, **options)
+        raise ValueError(f"Unknown CONVERSATION_STORE '{self.backend}'. Use 'memory' or 'sqlite'.")
+
+    def create_recent_keys(self):
+        """Webhook event IDs already queued; in the conversation database when workers share it."""
+        from singleflight import RecentKeys, SQLiteRecentKeys
+        if self.backend == "sqlite":
+            return SQLiteRecentKeys(path=self.db_path)
+        return RecentKeys()
+
+class RetrieverConfig:
+
+    def __init__(self):
+        load_dotenv()
+        self.mode = os.getenv("RETRIEVER_MODE", "hybrid").lower()
+        self.k = int(os.getenv("RETRIEVER_K", "4"))
+        self.fetch_k = int(os.getenv("RETRIEVER_FETCH_K", "20"))
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        self.vector_weight = float(os.getenv("RRF_VECTOR_WEIGHT", "1.0"))
+        self.lexical_weight = float(os.getenv("RRF_LEXICAL_WEIGHT", "1.0"))
+        self.rerank = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+        self.rerank_candidates = int(os.getenv("RERANK_CANDIDATES", "20"))
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+    def create_selector(self, embedding_model, vector_lookup=None):
+        if not self.rerank:
+            return None
+        from rerank import ContextSelector
+        return ContextSelector(
+            embedding_model,
+            k=self.k,
+            lambda_mult=self.mmr_lambda,
+            token_budget=self.token_budget,
+            vector_lookup=vector_lookup
+        )
+
+    def _create_base_retriever(self, vector_store, lexical_index, k: int):
+        if self.mode == "vector" or (self.mode == "hybrid" and (lexical_index is None or not len(lexical_index))):
+            return vector_store.as_retriever(search_kwargs={"k": k})
+        if self.mode == "hybrid":
+            from hybrid_retriever import HybridRetriever
+            return HybridRetriever(
+                vector_store=vector_store,
+                lexical_index=lexical_index,
+                k=k,
+                fetch_k=max(self.fetch_k, k),
+                rrf_k=self.rrf_k,
+                vector_weight=self.vector_weight,
+                lexical_weight=self.lexical_weight
+            )
+        raise ValueError(f"Unknown RETRIEVER_MODE '{self.mode}'. Use 'hybrid' or 'vector'.")
+
+    def create_retriever(self, vector_store, lexical_index=None, selector=None):
+        if selector is None:
+            return self._create_base_retriever(vector_store, lexical_index, self.k)
+        from rerank import RerankingRetriever
+        # Over-fetch so MMR and the token budget have something to choose from
+        return RerankingRetriever(
+            base_retriever=self._create_base_retriever(vector_store, lexical_index, self.rerank_candidates),
+            selector=selector
+        )
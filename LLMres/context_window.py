@@ -0,0 +1,74 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from tokens import count_tokens
+
+# Rough per-message cost of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ContextWindowBuilder:
+    """Builds the prompt for one turn from the stored conversation.
+
+    The system prompt is sent once, followed by as many of the most recent
+    turns as fit in ``max_history_tokens``. Older turns are represented by the
+    conversation's running summary (appended to the system prompt) instead of
+    being re-sent, so prompt size stays flat however long the thread gets.
+    """
+
+    def __init__(self,
+                 max_history_tokens: Optional[int] = None,
+                 max_summary_tokens: Optional[int] = None):
+        self.max_history_tokens = max_history_tokens or int(os.getenv("CONTEXT_HISTORY_TOKENS", "2000"))
+        self.max_summary_tokens = max_summary_tokens or int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))
+
+    @staticmethod
+    def message_tokens(message: Dict[str, Any]) -> int:
+        return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+    def split_history(self,
+                      messages: List[Dict[str, Any]],
+                      budget: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Return (older, recent): the newest messages that fit in ``budget`` and everything before them."""
+        budget = self.max_history_tokens if budget is None else budget
+        used = 0
+        start = len(messages)
+        while start > 0:
+            cost = self.message_tokens(messages[start - 1])
+            if used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        # Never open the window on an assistant reply whose question was cut off
+        while start < len(messages) and messages[start]["role"] != "human":
+            start += 1
+        return messages[:start], messages[start:]
+
+    def system_message(self, system_prompt: str, summary: str = "") -> SystemMessage:
+        if summary:
+            system_prompt = f"{system_prompt}\n\nSummary of the earlier conversation:\n{summary}"
+        return SystemMessage(content=system_prompt)
+
+    def build(self, system_prompt: str, conversation, query: str) -> List[BaseMessage]:
+        _, recent = self.split_history(conversation.messages)
+        messages: List[BaseMessage] = [self.system_message(system_prompt, conversation.summary)]
+        for msg in recent:
+            if msg["role"] == "human":
+                messages.append(HumanMessage(content=msg["content"]))
+            else:
+                messages.append(AIMessage(content=msg["content"]))
+        messages.append(HumanMessage(content=query))
+        return messages
+
+    def truncate_summary(self, summary: str) -> str:
+        if count_tokens(summary) <= self.max_summary_tokens:
+            return summary
+        # Token counts are close enough to proportional to length for a cut-off
+        ratio = self.max_summary_tokens / count_tokens(summary)
+        return summary[:int(len(summary) * ratio)].rsplit(" ", 1)[0]
+
+    @staticmethod
+    def prompt_tokens(messages: List[BaseMessage]) -> int:
+        return sum(count_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
@@ -1,71 +1,143 @@
-from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
 import os
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_openai import AzureChatOpenAI
+import time
+import logging
+from langchain_core.messages import HumanMessage, AIMessageChunk, SystemMessage
 from prompt import PromptBot
+from intent import ClearIntentDetector
+from conversation_store import Conversation, ConversationStore, InMemoryConversationStore
+from context_window import ContextWindowBuilder
+from metrics import timed
 
-@dataclass
-class Conversation:
-    thread_id: str
-    messages: List[Dict[str, Any]] = None
-    
-    def __post_init__(self):
-        self.messages = []
-    
-    def add_message(self, role: str, content: str):
-        self.messages.append({"role": role, "content": content})
-    
-    def get_context(self, last_n: int = 5) -> List[Dict[str, Any]]:
-        return self.messages[-last_n:] if len(self.messages) > 0 else []
-    
-    def clear_history(self):
-        self.messages = []
+logger = logging.getLogger(__name__)
 
 class ConversationalAgent:
     
-    def __init__(self, agent):
+    def __init__(self, agent, llm=None, timeout: Optional[float] = None,
+                 intent_detector: Optional[ClearIntentDetector] = None,
+                 conversation_store: Optional[ConversationStore] = None,
+                 context_builder: Optional[ContextWindowBuilder] = None,
+                 summarize: Optional[bool] = None):
         self.agent = agent
-        self.conversations: Dict[str, Conversation] = {}
+        self.conversations = conversation_store or InMemoryConversationStore()
         self.system_prompt = PromptBot
-        self.llm = AzureChatOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            azure_deployment=os.getenv("MODEL_NAME"),
-            openai_api_version="2024-05-01-preview",
-        )
+        self._llm = llm
+        # Upper bound for one agent run (LLM + tool calls) before it is cancelled
+        self.timeout = timeout or float(os.getenv("AGENT_TIMEOUT_SECONDS", "60"))
+        self.intent_detector = intent_detector or ClearIntentDetector()
+        # The conversation store is the only copy of history; this decides how much of it is sent
+        self.context_builder = context_builder or ContextWindowBuilder()
+        if summarize is None:
+            summarize = os.getenv("CONTEXT_SUMMARIZE", "true").lower() == "true"
+        self.summarize = summarize
+        # thread_id -> compaction running in the background; at most one per thread
+        self._compactions: Dict[str, asyncio.Task] = {}
     
+    @property
+    def llm(self):
+        # Only needed for summaries and intent fallbacks, so built on first use
+        if self._llm is None:
+            from config import AzureOpenAIConfig
+            self._llm = AzureOpenAIConfig().create_llm()
+        return self._llm
+
     def create_conversation(self, thread_id: str) -> Conversation:
-        conversation = Conversation(thread_id=thread_id)
-        self.conversations[thread_id] = conversation
-        return conversation
+        return self.conversations.create(thread_id)
     
     def get_conversation(self, thread_id: str) -> Conversation:
-        if thread_id not in self.conversations:
-            return self.create_conversation(thread_id)
-        return self.conversations[thread_id]
+        return self.conversations.get(thread_id) or self.create_conversation(thread_id)
     
     def clear_conversation(self, thread_id: str) -> bool:
-        if thread_id in self.conversations:
-            del self.conversations[thread_id]
+        if self.conversations.delete(thread_id):
             self.create_conversation(thread_id)
             return True
         return False
+
+    async def aget_conversation(self, thread_id: str) -> Conversation:
+        return await self.conversations.aget(thread_id) or await self.conversations.acreate(thread_id)
+
+    async def aclear_conversation(self, thread_id: str) -> bool:
+        if await self.conversations.adelete(thread_id):
+            await self.conversations.acreate(thread_id)
+            return True
+        return False
     
     def prepare_messages(self, conversation: Conversation, query: str) -> List[dict]:
-        messages = [
-            SystemMessage(content=self.system_prompt),
-        ]
+        return self.context_builder.build(self.system_prompt, conversation, query)
+    
+    async def summarize_history(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        system_message = f"""Summarize this conversation between a user and an assistant in at most {self.context_builder.max_summary_tokens} tokens.
+        Keep names, facts and open questions the user may refer back to. Write in the language of the conversation."""
+        human_message = f"""Existing summary:
+        {summary or "(none)"}
         
-        for msg in conversation.get_context():
-            if msg["role"] == "human":
-                messages.append(HumanMessage(content=msg["content"]))
-            else:
-                messages.append(AIMessage(content=msg["content"]))
+        New messages:
+        {transcript}"""
         
-        messages.append(HumanMessage(content=query))
-        return messages
+        response = await self.llm.ainvoke([
+            SystemMessage(content=system_message),
+            HumanMessage(content=human_message)
+        ])
+        return self.context_builder.truncate_summary(response.content.strip())
+    
+    async def _compact_history(self, thread_id: str):
+        conversation = await self.conversations.aget(thread_id)
+        if conversation is None:
+            return
+        older, _ = self.context_builder.split_history(conversation.messages)
+        if not older:
+            return
+        # Compact down to half the budget so the summary isn't rewritten every turn
+        older, _ = self.context_builder.split_history(
+            conversation.messages,
+            budget=self.context_builder.max_history_tokens // 2
+        )
+        previous_summary = summary = conversation.summary
+        if self.summarize:
+            try:
+                summary = await self.summarize_history(summary, older)
+            except Exception as e:
+                logger.warning(f"History summary failed, dropping old turns instead: {str(e)}")
+        async with self.conversations.turn_lock(thread_id):
+            # The summary was written without the lock; apply it only if the
+            # turns it covers are still the oldest ones (not cleared or trimmed)
+            current = await self.conversations.aget(thread_id)
+            if (current is None or current.summary != previous_summary
+                    or current.messages[:len(older)] != older):
+                logger.info(f"Thread {thread_id} changed while it was being compacted; will retry next turn")
+                return
+            await self.conversations.acompact(thread_id, len(older), summary)
+
+    def _schedule_compaction(self, thread_id: str):
+        if thread_id in self._compactions:
+            return
+        task = asyncio.ensure_future(self._compact_history(thread_id))
+        self._compactions[thread_id] = task
+
+        def done(finished: asyncio.Task):
+            self._compactions.pop(thread_id, None)
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.warning(f"History compaction failed for {thread_id}: {str(finished.exception())}")
+
+        task.add_done_callback(done)
+
+    async def _store_turn(self, thread_id: str, query: str, answer: str):
+        await self.conversations.aadd_message(thread_id, "human", query)
+        await self.conversations.aadd_message(thread_id, "assistant", answer)
+        # Summarising is an LLM call: it runs after the reply, not under the turn lock.
+        # Until it lands, the window builder still sends only what fits the budget.
+        # The task returns at once when the history still fits.
+        self._schedule_compaction(thread_id)
+    
     
     async def detect_clear_intent(self, message: str) -> bool:
+        # Local rules/exemplars first; the LLM only sees messages they can't settle
+        with timed("intent_detection"):
+            return await self.intent_detector.detect(message, llm_fallback=self.classify_clear_intent_with_llm)
+
+    async def classify_clear_intent_with_llm(self, message: str) -> bool:
         system_message = """You are a message intent classifier. 
         Your task is to determine if a message expresses an intent to clear chat history, memory, or start a new conversation.
         Respond with just 'true' if the intent is to clear memory/chat, or 'false' otherwise.
@@ -82,21 +154,9 @@ class ConversationalAgent:
         response = await self.llm.ainvoke(messages)
         return response.content.strip().lower() == 'true'
 
-    async def stream_response(self, thread_id: str, query: str):
-        if await self.detect_clear_intent(query):
-            if self.clear_conversation(thread_id):
-                return "Memory cleared. Starting a new conversation."
-            return "No conversation history found to clear."
-        
-        if thread_id not in self.conversations:
-            self.create_conversation(thread_id)
-        conversation = self.conversations[thread_id]
-        
-        messages = self.prepare_messages(conversation, query)
-        config = {"configurable": {"thread_id": thread_id}}
-        
+    async def _run_agent(self, messages: List[dict], config: dict) -> str:
         final_response = ""
-        for event in self.agent.stream(
+        async for event in self.agent.astream(
             {"messages": messages},
             config=config,
             stream_mode="values"
@@ -104,11 +164,76 @@ class ConversationalAgent:
             if "messages" in event and event["messages"]:
                 last_message = event["messages"][-1]
                 final_response = last_message.content
+        return final_response
+
+    async def _handle_clear_intent(self, thread_id: str, query: str) -> Optional[str]:
+        if await self.detect_clear_intent(query):
+            if await self.aclear_conversation(thread_id):
+                return "Memory cleared. Starting a new conversation."
+            return "No conversation history found to clear."
+        return None
+
+    async def stream_response(self, thread_id: str, query: str):
+        # One turn per thread at a time (across workers too), so history is read and written in order
+        async with self.conversations.turn_lock(thread_id):
+            clear_reply = await self._handle_clear_intent(thread_id, query)
+            if clear_reply is not None:
+                return clear_reply
         
-        # Store the conversation history
-        conversation.add_message("human", query)
-        conversation.add_message("assistant", final_response)
+            conversation = await self.aget_conversation(thread_id)
         
-        # Return only the final response
-        return final_response
-        
\ No newline at end of file
+            messages = self.prepare_messages(conversation, query)
+            config = {"configurable": {"thread_id": thread_id}}
+        
+            try:
+                final_response = await asyncio.wait_for(
+                    self._run_agent(messages, config),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Agent did not respond within {self.timeout:.0f} seconds")
+        
+            # Store the conversation history
+            await self._store_turn(thread_id, query, final_response)
+        
+            # Return only the final response
+            return final_response
+
+    async def stream_tokens(self, thread_id: str, query: str) -> AsyncIterator[str]:
+        """Yield the final answer token by token as the LLM produces it."""
+        async with self.conversations.turn_lock(thread_id):
+            clear_reply = await self._handle_clear_intent(thread_id, query)
+            if clear_reply is not None:
+                yield clear_reply
+                return
+
+            conversation = await self.aget_conversation(thread_id)
+            messages = self.prepare_messages(conversation, query)
+            config = {"configurable": {"thread_id": thread_id}}
+
+            deadline = time.monotonic() + self.timeout
+            stream = self.agent.astream(
+                {"messages": messages},
+                config=config,
+                stream_mode="messages"
+            ).__aiter__()
+            parts = []
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        chunk, metadata = await asyncio.wait_for(stream.__anext__(), timeout=max(remaining, 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"Agent did not respond within {self.timeout:.0f} seconds")
+                    # Only the agent's own text; skip tool-call arguments and tool output
+                    if (isinstance(chunk, AIMessageChunk) and chunk.content
+                            and not chunk.tool_call_chunks
+                            and metadata.get("langgraph_node") == "agent"):
+                        parts.append(chunk.content)
+                        yield chunk.content
+            finally:
+                await stream.aclose()
+
+            await self._store_turn(thread_id, query, "".join(parts))
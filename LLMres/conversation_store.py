@@ -0,0 +1,456 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: turns are only serialised within one process
+    fcntl = None
+
+
+@dataclass
+class Conversation:
+    thread_id: str
+    messages: List[Dict[str, Any]] = None
+    summary: str = ""
+
+    def __post_init__(self):
+        if self.messages is None:
+            self.messages = []
+
+    def add_message(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+
+    def get_context(self, last_n: int = 5) -> List[Dict[str, Any]]:
+        return self.messages[-last_n:] if len(self.messages) > 0 else []
+
+    def clear_history(self):
+        self.messages = []
+        self.summary = ""
+
+
+class ConversationStore(ABC):
+    """Bounded conversation storage shared by every ConversationalAgent.
+
+    Keeps at most ``max_threads`` threads (least recently used are evicted),
+    drops threads idle for longer than ``ttl_seconds`` and keeps only the last
+    ``max_messages`` messages of each thread. This is the only copy of chat
+    history; older turns can be folded into a per-thread summary with
+    ``compact``. Eviction listeners are told about every thread that goes away.
+    Async code uses the ``a``-prefixed methods, which keep disk-backed stores
+    off the event loop.
+    """
+
+    def __init__(self,
+                 max_threads: int = 10000,
+                 ttl_seconds: float = 86400,
+                 max_messages: int = 50,
+                 sweep_interval: float = 60.0):
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._listeners: List[Callable[[str], None]] = []
+        self._turn_locks: Dict[str, list] = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.turn_lock_waits = 0
+
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, thread_id: str):
+        for listener in self._listeners:
+            listener(thread_id)
+
+    def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            self.evict_expired()
+
+    @asynccontextmanager
+    async def turn_lock(self, thread_id: str):
+        """Held for a whole chat turn, so two turns of one thread never read and
+        write its history at the same time."""
+        entry = self._turn_locks.setdefault(thread_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.turn_lock_waits += 1
+            async with entry[0]:
+                await self._acquire_turn(thread_id)
+                try:
+                    yield
+                finally:
+                    self._release_turn(thread_id)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._turn_locks[thread_id]
+
+    async def _acquire_turn(self, thread_id: str):
+        """Hook for stores shared between processes; the in-process lock is already held."""
+
+    def _release_turn(self, thread_id: str):
+        pass
+
+    @abstractmethod
+    def get(self, thread_id: str) -> Optional[Conversation]:
+        pass
+
+    @abstractmethod
+    def create(self, thread_id: str) -> Conversation:
+        pass
+
+    @abstractmethod
+    def add_message(self, thread_id: str, role: str, content: str):
+        pass
+
+    @abstractmethod
+    def compact(self, thread_id: str, drop: int, summary: str):
+        """Replace the thread's oldest ``drop`` messages with ``summary``."""
+
+    @abstractmethod
+    def delete(self, thread_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def evict_expired(self) -> int:
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        pass
+
+    def __contains__(self, thread_id: str) -> bool:
+        return self.get(thread_id) is not None
+
+    async def _offload(self, fn: Callable, *args):
+        """Stores that block on I/O override this to run ``fn`` in a thread."""
+        return fn(*args)
+
+    async def aget(self, thread_id: str) -> Optional[Conversation]:
+        return await self._offload(self.get, thread_id)
+
+    async def acreate(self, thread_id: str) -> Conversation:
+        return await self._offload(self.create, thread_id)
+
+    async def aadd_message(self, thread_id: str, role: str, content: str):
+        await self._offload(self.add_message, thread_id, role, content)
+
+    async def acompact(self, thread_id: str, drop: int, summary: str):
+        await self._offload(self.compact, thread_id, drop, summary)
+
+    async def adelete(self, thread_id: str) -> bool:
+        return await self._offload(self.delete, thread_id)
+
+
+class InMemoryConversationStore(ConversationStore):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._threads: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+
+    def _expired(self, thread_id: str, now: float) -> bool:
+        return now - self._last_access[thread_id] > self.ttl_seconds
+
+    def get(self, thread_id: str) -> Optional[Conversation]:
+        conversation = self._threads.get(thread_id)
+        if conversation is None:
+            return None
+        now = time.time()
+        if self._expired(thread_id, now):
+            self._remove(thread_id)
+            self.expirations += 1
+            return None
+        self._threads.move_to_end(thread_id)
+        self._last_access[thread_id] = now
+        return conversation
+
+    def create(self, thread_id: str) -> Conversation:
+        self._maybe_sweep()
+        if thread_id in self._threads:
+            self._remove(thread_id)
+        conversation = Conversation(thread_id=thread_id)
+        self._threads[thread_id] = conversation
+        self._last_access[thread_id] = time.time()
+        while len(self._threads) > self.max_threads:
+            oldest = next(iter(self._threads))
+            self._remove(oldest)
+            self.evictions += 1
+        return conversation
+
+    def add_message(self, thread_id: str, role: str, content: str):
+        conversation = self.get(thread_id) or self.create(thread_id)
+        conversation.add_message(role, content)
+        if len(conversation.messages) > self.max_messages:
+            del conversation.messages[:-self.max_messages]
+
+    def compact(self, thread_id: str, drop: int, summary: str):
+        conversation = self.get(thread_id)
+        if conversation is not None:
+            del conversation.messages[:drop]
+            conversation.summary = summary
+
+    def _remove(self, thread_id: str):
+        del self._threads[thread_id]
+        del self._last_access[thread_id]
+        self._notify(thread_id)
+
+    def delete(self, thread_id: str) -> bool:
+        if thread_id in self._threads:
+            self._remove(thread_id)
+            return True
+        return False
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        expired = [thread_id for thread_id in self._threads if self._expired(thread_id, now)]
+        for thread_id in expired:
+            self._remove(thread_id)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        messages = sum(len(c.messages) for c in self._threads.values())
+        approx_bytes = sum(
+            sys.getsizeof(m["content"]) + sys.getsizeof(m)
+            for c in self._threads.values() for m in c.messages
+        ) + sum(sys.getsizeof(c.summary) for c in self._threads.values())
+        return {
+            "backend": "memory",
+            "threads": len(self._threads),
+            "messages": messages,
+            "approx_bytes": approx_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "turn_lock_waits": self.turn_lock_waits,
+        }
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation store on disk, so threads survive restarts without living in RAM.
+
+    Several worker processes can share one database: it runs in WAL mode so
+    readers never wait for a writer, and each thread's turns are serialised
+    across processes with a one-byte ``fcntl`` lock in ``<path>.locks`` at an
+    offset derived from the thread ID. Reads don't write: access times are
+    buffered and saved at most every ``touch_interval`` seconds, or with the
+    thread's next write. The async methods run in a thread.
+    """
+
+    LOCK_OFFSETS = 1 << 40
+
+    def __init__(self, path: str = "data/conversations.sqlite3", touch_interval: float = None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.touch_interval = touch_interval or float(os.getenv("CONVERSATION_TOUCH_INTERVAL_SECONDS", "60"))
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        # WAL: workers read while another one writes; NORMAL sync is safe with WAL
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # POSIX record locks are dropped when any descriptor of the file closes, so keep this one open
+        self._lock_fd = os.open(path + ".locks", os.O_RDWR | os.O_CREAT, 0o644) if fcntl else None
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS threads (
+                thread_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL,
+                summary TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_threads_last_access ON threads (last_access);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                thread_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages (thread_id, id);
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(threads)")]
+        if "summary" not in columns:
+            self._conn.execute("ALTER TABLE threads ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def _lock_offset(self, thread_id: str) -> int:
+        return int.from_bytes(hashlib.sha1(thread_id.encode("utf-8")).digest()[:8], "big") % self.LOCK_OFFSETS
+
+    async def _acquire_turn(self, thread_id: str):
+        if self._lock_fd is None:
+            return
+        offset = self._lock_offset(thread_id)
+        delay = 0.005
+        waited = False
+        # Poll without blocking so a cancelled turn never leaves a thread stuck in lockf
+        while True:
+            try:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                return
+            except (BlockingIOError, PermissionError):
+                if not waited:
+                    waited = True
+                    self.turn_lock_waits += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    def _release_turn(self, thread_id: str):
+        if self._lock_fd is not None:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, self._lock_offset(thread_id))
+
+    async def _offload(self, fn: Callable, *args):
+        return await asyncio.to_thread(fn, *args)
+
+    def _flush_touches(self):
+        """Write buffered access times; the caller holds the lock and commits."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE threads SET last_access = MAX(last_access, ?) WHERE thread_id = ?",
+                [(at, thread_id) for thread_id, at in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def _delete_rows(self, thread_ids: List[str]):
+        for thread_id in thread_ids:
+            self._touched.pop(thread_id, None)
+        self._conn.executemany("DELETE FROM messages WHERE thread_id = ?", [(t,) for t in thread_ids])
+        self._conn.executemany("DELETE FROM threads WHERE thread_id = ?", [(t,) for t in thread_ids])
+
+    def get(self, thread_id: str) -> Optional[Conversation]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_access, summary FROM threads WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            if row is None:
+                self._touched.pop(thread_id, None)
+                return None
+            if now - max(row[0], self._touched.get(thread_id, 0.0)) > self.ttl_seconds:
+                self._delete_rows([thread_id])
+                self._conn.commit()
+                self.expirations += 1
+                expired = True
+            else:
+                self._touched[thread_id] = now
+                messages = self._conn.execute(
+                    "SELECT role, content FROM messages WHERE thread_id = ? ORDER BY id", (thread_id,)
+                ).fetchall()
+                if time.monotonic() - self._last_flush >= self.touch_interval:
+                    self._flush_touches()
+                    self._conn.commit()
+                expired = False
+        if expired:
+            self._notify(thread_id)
+            return None
+        return Conversation(thread_id=thread_id,
+                            messages=[{"role": role, "content": content} for role, content in messages],
+                            summary=row[1])
+
+    def create(self, thread_id: str) -> Conversation:
+        self._maybe_sweep()
+        with self._lock:
+            self._delete_rows([thread_id])
+            self._conn.execute(
+                "INSERT INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, time.time())
+            )
+            evicted = self._evict_over_capacity()
+            self._conn.commit()
+        for evicted_id in evicted:
+            self._notify(evicted_id)
+        return Conversation(thread_id=thread_id)
+
+    def _evict_over_capacity(self) -> List[str]:
+        # Recent reads land before eviction picks the least recently used threads
+        self._flush_touches()
+        count = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        if count <= self.max_threads:
+            return []
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT thread_id FROM threads ORDER BY last_access ASC LIMIT ?", (count - self.max_threads,)
+        )]
+        self._delete_rows(evicted)
+        self.evictions += len(evicted)
+        return evicted
+
+    def add_message(self, thread_id: str, role: str, content: str):
+        if self.get(thread_id) is None:
+            self.create(thread_id)
+        with self._lock:
+            self._touched.pop(thread_id, None)
+            self._conn.execute(
+                "INSERT INTO messages (thread_id, role, content) VALUES (?, ?, ?)", (thread_id, role, content)
+            )
+            self._conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = ?", (time.time(), thread_id))
+            self._conn.execute(
+                "DELETE FROM messages WHERE thread_id = ? AND id NOT IN "
+                "(SELECT id FROM messages WHERE thread_id = ? ORDER BY id DESC LIMIT ?)",
+                (thread_id, thread_id, self.max_messages)
+            )
+            self._conn.commit()
+
+    def compact(self, thread_id: str, drop: int, summary: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM messages WHERE id IN "
+                "(SELECT id FROM messages WHERE thread_id = ? ORDER BY id LIMIT ?)",
+                (thread_id, drop)
+            )
+            self._conn.execute("UPDATE threads SET summary = ? WHERE thread_id = ?", (summary, thread_id))
+            self._conn.commit()
+
+    def delete(self, thread_id: str) -> bool:
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,)
+            ).fetchone() is not None
+            self._delete_rows([thread_id])
+            self._conn.commit()
+        if existed:
+            self._notify(thread_id)
+        return existed
+
+    def evict_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._flush_touches()
+            expired = [row[0] for row in self._conn.execute(
+                "SELECT thread_id FROM threads WHERE last_access < ?", (cutoff,)
+            )]
+            self._delete_rows(expired)
+            self._conn.commit()
+        self.expirations += len(expired)
+        for thread_id in expired:
+            self._notify(thread_id)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            threads = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "threads": threads,
+            "messages": messages,
+            "disk_bytes": sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p)),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "turn_lock_waits": self.turn_lock_waits,
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class KeyedDispatcher:
+    """Bounded asyncio worker pool that keeps events for the same key in order.
+
+    Events for different keys (LINE user ids) are handled concurrently by up to
+    ``num_workers`` workers, while a key is only ever held by one worker at a
+    time, so each user's messages are answered in the order they were sent.
+    At most ``max_queue`` events may wait; ``submit`` blocks for up to
+    ``enqueue_timeout`` seconds for room and then rejects the event.
+    ``submit_many`` does the same for a batch, all or nothing.
+    """
+
+    def __init__(self,
+                 handler: Callable[[Any], Awaitable[None]],
+                 num_workers: int = 8,
+                 max_queue: int = 256,
+                 enqueue_timeout: float = 1.0):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+
+        self._pending: Dict[str, Deque[Any]] = {}
+        self._scheduled: Set[str] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._workers = []
+
+        self.depth = 0
+        self.max_depth = 0
+        self.in_progress = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"dispatcher-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        logger.info(f"Started dispatcher with {self.num_workers} workers (queue size {self.max_queue})")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        if not self.running:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while (self.depth or self.in_progress) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.depth:
+            logger.warning(f"Dispatcher stopped with {self.depth} events still queued")
+
+    async def submit(self, key: str, event: Any) -> bool:
+        """Queue an event for ``key``; returns False if the queue stayed full."""
+        return await self.submit_many([(key, event)])
+
+    async def submit_many(self, items: List[Tuple[str, Any]]) -> bool:
+        """Queue every (key, event) pair or none of them.
+
+        Returns False, having queued nothing, if room for the whole batch did
+        not free up within ``enqueue_timeout``; a webhook can then be
+        redelivered as a whole without any of its events running twice.
+        """
+        if not self.running:
+            raise RuntimeError("Dispatcher has not been started")
+        deadline = time.monotonic() + self.enqueue_timeout
+        acquired = 0
+        try:
+            for _ in items:
+                if self._slots.locked():
+                    await asyncio.wait_for(self._slots.acquire(), timeout=max(deadline - time.monotonic(), 0.001))
+                else:
+                    await self._slots.acquire()
+                acquired += 1
+        except asyncio.TimeoutError:
+            for _ in range(acquired):
+                self._slots.release()
+            self.rejected += len(items)
+            logger.warning(f"Dispatcher queue full ({self.depth} events); rejecting {len(items)} events")
+            return False
+
+        for key, event in items:
+            self._enqueue(key, event)
+        return True
+
+    def _enqueue(self, key: str, event: Any):
+        self._pending.setdefault(key, deque()).append((time.monotonic(), event))
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.enqueued += 1
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            key = await self._ready.get()
+            queued_at, event = self._pending[key].popleft()
+            self.depth -= 1
+            self._slots.release()
+            waited = time.monotonic() - queued_at
+            self.total_wait_seconds += waited
+            registry.histogram("stage_seconds", "Time spent per chat-turn stage", stage="queue_wait").observe(waited)
+
+            self.in_progress += 1
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error handling event for {key}: {str(e)}")
+            finally:
+                self.in_progress -= 1
+                # Hand the key back only once this event is done, so the next
+                # event for the same key can't overtake it.
+                if self._pending[key]:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    self._scheduled.discard(key)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.processed + self.failed + self.in_progress
+        return {
+            "workers": self.num_workers,
+            "queue_size": self.max_queue,
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "in_progress": self.in_progress,
+            "keys_waiting": len(self._scheduled),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_seconds": self.total_wait_seconds / started if started else 0.0,
+        }
@@ -1,35 +1,65 @@
-from typing import List
-import bs4
+import asyncio
+import hashlib
+import os
+from typing import Dict, Iterator, List, Optional
 from langchain_core.documents import Document
-from langchain_community.document_loaders import WebBaseLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.formrecognizer import DocumentAnalysisClient
+import pdf_text
+from pdf_text import OCRPageCache, PdfPage, read_pdf_pages
+from text_stream import DEFAULT_BLOCK_SIZE, StreamingLineSplitter, iter_lines
 
 class DocumentProcessor:
     
     def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        self.char_splitter = CharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            length_function=len,
-            separator="\n"
-        )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._text_splitter = None
+        self._char_splitter = None
         self.document_client = None
+        # auto: text layer first, OCR only pages without one; local: never OCR; azure: always OCR
+        self.pdf_text_mode = os.getenv("PDF_TEXT_MODE", "auto").lower()
+        self.pdf_min_text_chars = int(os.getenv("PDF_MIN_TEXT_CHARS", "20"))
+        self._ocr_cache = None
+        # Caps Document Intelligence calls in flight across every PDF being loaded
+        self.ocr_max_concurrency = int(os.getenv("OCR_MAX_CONCURRENCY", "4"))
+        self._ocr_slots = None
+        self.pdf_stats = {"text_layer_pages": 0, "ocr_pages": 0, "ocr_cache_hits": 0, "skipped_pages": 0}
+
+    # Splitters and SDK clients are imported on first use to keep startup fast
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+                separators=["\n\n", "\n", " ", ""]
+            )
+        return self._text_splitter
+
+    @property
+    def char_splitter(self):
+        if self._char_splitter is None:
+            from langchain_text_splitters import CharacterTextSplitter
+            self._char_splitter = CharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+                separator="\n"
+            )
+        return self._char_splitter
 
     def initialize_document_client(self, endpoint: str, key: str):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.ai.formrecognizer import DocumentAnalysisClient
         self.document_client = DocumentAnalysisClient(
             endpoint=endpoint,
             credential=AzureKeyCredential(key)
         )
 
     def load_web_content(self, url: str) -> List[Document]:
+        import bs4
+        from langchain_community.document_loaders import WebBaseLoader
         loader = WebBaseLoader(
             web_paths=(url,),
             bs_kwargs=dict(
@@ -47,7 +77,7 @@ class DocumentProcessor:
                 with open(file_path, 'r', encoding='utf-8') as file:
                     text = file.read()
                     if text.strip():
-                        documents.append(Document(page_content=text))
+                        documents.append(Document(page_content=text, metadata={"source": file_path}))
                         print(f"Successfully loaded {file_path}: {len(text)} characters")
                     else:
                         print(f"Warning: {file_path} is empty")
@@ -55,6 +85,15 @@ class DocumentProcessor:
                 print(f"Error loading {file_path}: {str(e)}")
         return documents
 
+    def iter_text_chunks(self, file_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[Document]:
+        """Read a text file in blocks and yield char-splitter chunks lazily, with source offsets."""
+        splitter = StreamingLineSplitter(self.chunk_size, self.chunk_overlap)
+        for text, start, end in splitter.split(iter_lines(file_path, block_size)):
+            yield Document(
+                page_content=text,
+                metadata={"source": file_path, "start_index": start, "end_index": end}
+            )
+
     async def load_pdf_url(self, url: str) -> List[Document]:
         if not self.document_client:
             raise ValueError("Document client not initialized. Call initialize_document_client first.")
@@ -63,7 +102,8 @@ class DocumentProcessor:
             poller = self.document_client.begin_analyze_document_from_url(
                 "prebuilt-read", url
             )
-            result = poller.result()
+            # Polling blocks until the remote analysis finishes
+            result = await asyncio.to_thread(poller.result)
             
             documents = []
             for page in result.pages:
@@ -87,31 +127,93 @@ class DocumentProcessor:
             print(f"Error loading PDF from URL {url}: {str(e)}")
             return []
 
-    async def load_pdf_file(self, file_path: str) -> List[Document]:
+    def _analyze_bytes(self, data: bytes):
+        poller = self.document_client.begin_analyze_document("prebuilt-read", data)
+        return poller.result()
+
+    @property
+    def ocr_cache(self) -> OCRPageCache:
+        if self._ocr_cache is None:
+            self._ocr_cache = OCRPageCache()
+        return self._ocr_cache
+
+    async def _ocr_pdf(self, data: bytes, source: str) -> List[Document]:
         if not self.document_client:
             raise ValueError("Document client not initialized. Call initialize_document_client first.")
-        
+
+        result = await asyncio.to_thread(self._analyze_bytes, data)
+        documents = []
+        for page in result.pages:
+            page_text = "\n".join([line.content for line in page.lines])
+            metadata = {
+                "source": source,
+                "page_number": page.page_number,
+                "width": page.width,
+                "height": page.height,
+                "unit": page.unit
+            }
+            documents.append(Document(
+                page_content=page_text,
+                metadata=metadata
+            ))
+        self.pdf_stats["ocr_pages"] += len(documents)
+        return documents
+
+    async def _ocr_page(self, page: PdfPage, source: str) -> str:
+        cached = self.ocr_cache.get(page.page_hash)
+        if cached is not None:
+            self.pdf_stats["ocr_cache_hits"] += 1
+            return cached
+        if self.pdf_text_mode == "local" or not self.document_client:
+            print(f"Skipping page {page.page_number} of {source}: no text layer and OCR is not available")
+            self.pdf_stats["skipped_pages"] += 1
+            return ""
+        if self._ocr_slots is None:
+            self._ocr_slots = asyncio.Semaphore(self.ocr_max_concurrency)
+        async with self._ocr_slots:
+            result = await asyncio.to_thread(self._analyze_bytes, page.data)
+        text = "\n".join(line.content for ocr_page in result.pages for line in ocr_page.lines)
+        self.ocr_cache.put(page.page_hash, text)
+        self.pdf_stats["ocr_pages"] += 1
+        return text
+
+    async def load_pdf_bytes(self, data: bytes, source: str) -> List[Document]:
+        """Load an in-memory PDF; unlike load_pdf_file, errors are raised to the caller.
+
+        Pages with an embedded text layer are read locally. Only pages without
+        one are sent to Document Intelligence, one page per request with at most
+        ``OCR_MAX_CONCURRENCY`` requests at once, and their OCR text is cached
+        by page hash.
+        """
+        if self.pdf_text_mode == "azure" or pdf_text.pypdf is None:
+            return await self._ocr_pdf(data, source)
+
         try:
-            with open(file_path, "rb") as file:
-                poller = self.document_client.begin_analyze_document(
-                    "prebuilt-read", file
-                )
-                result = poller.result()
+            pages = await asyncio.to_thread(read_pdf_pages, data)
+        except Exception as e:
+            if self.pdf_text_mode == "local":
+                raise
+            print(f"Could not read the text layer of {source}, using OCR instead: {str(e)}")
+            return await self._ocr_pdf(data, source)
 
-            documents = []
-            for page in result.pages:
-                page_text = "\n".join([line.content for line in page.lines])
-                metadata = {
-                    "source": file_path,
-                    "page_number": page.page_number,
-                    "width": page.width,
-                    "height": page.height,
-                    "unit": page.unit
-                }
-                documents.append(Document(
-                    page_content=page_text,
-                    metadata=metadata
-                ))
+        texts = [page.text if page.has_text(self.pdf_min_text_chars) else None for page in pages]
+        self.pdf_stats["text_layer_pages"] += sum(text is not None for text in texts)
+        scanned = [i for i, text in enumerate(texts) if text is None]
+        ocr_texts = await asyncio.gather(*(self._ocr_page(pages[i], source) for i in scanned))
+        for i, text in zip(scanned, ocr_texts):
+            texts[i] = text
+
+        documents = []
+        for page, text in zip(pages, texts):
+            if text.strip():
+                documents.append(Document(page_content=text, metadata=page.metadata(source)))
+        return documents
+
+    async def load_pdf_file(self, file_path: str) -> List[Document]:
+        try:
+            with open(file_path, "rb") as file:
+                data = file.read()
+            documents = await self.load_pdf_bytes(data, file_path)
             
             print(f"Successfully loaded PDF file: {file_path}")
             return documents
@@ -128,4 +230,21 @@ class DocumentProcessor:
         splitter = self.char_splitter if use_char_splitter else self.text_splitter
         splits = splitter.split_documents(documents)
         print(f"Split {len(documents)} documents into {len(splits)} chunks")
-        return splits
\ No newline at end of file
+        return splits
+
+    @staticmethod
+    def chunk_ids(documents: List[Document], seen: Optional[Dict[str, int]] = None) -> List[str]:
+        """Deterministic IDs from each chunk's source and content, so unchanged chunks keep their ID.
+
+        Pass the same ``seen`` dict across calls when one source is processed in batches.
+        """
+        ids = []
+        seen = {} if seen is None else seen
+        for doc in documents:
+            key = f"{doc.metadata.get('source', '')}\x00{doc.page_content}"
+            chunk_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+            # The same text twice in one source still needs two IDs
+            count = seen.get(chunk_id, 0)
+            seen[chunk_id] = count + 1
+            ids.append(chunk_id if count == 0 else f"{chunk_id}-{count}")
+        return ids
\ No newline at end of file
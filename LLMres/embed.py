@@ -1,20 +1,60 @@
 import os
+import asyncio
 import logging
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from dotenv import load_dotenv
-from langchain.embeddings.base import Embeddings
-from openai import AzureOpenAI
+from langchain_core.embeddings import Embeddings
+
+from tokens import count_tokens
+from embedding_cache import EmbeddingCache
+from singleflight import SingleFlight
 
 
 load_dotenv()
 
 class EmbeddingsService:
-    def __init__(self):
-        self.client = AzureOpenAI(
+    def __init__(self,
+                 max_batch_size: int = None,
+                 max_batch_tokens: int = None,
+                 max_concurrency: int = None):
+        self._client = None
+        self._async_client = None
+        self.model_name = os.getenv("DEPLOYMENT_NAME", "embedding")
+        # Azure accepts up to 2048 inputs per request; keep well below that and
+        # below the per-request token budget so one batch never gets rejected.
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+        self.max_batch_tokens = max_batch_tokens or int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "60000"))
+        self.max_concurrency = max_concurrency or int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+        # Identical requests already in flight (a double-tapped question) wait for that one
+        self.inflight = SingleFlight("embeddings")
+        # Async requests from every caller share one limit per event loop
+        self._request_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _client_kwargs():
+        return dict(
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
             api_version=os.getenv("API_VERSION")
         )
-        self.model_name = os.getenv("DEPLOYMENT_NAME", "embedding")
+
+    # The openai SDK is slow to import; clients are built on first request
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AzureOpenAI
+            self._client = AzureOpenAI(**self._client_kwargs())
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncAzureOpenAI
+            self._async_client = AsyncAzureOpenAI(**self._client_kwargs())
+        return self._async_client
 
     def get_embeddings_sync(self, text: str):
         try:
@@ -29,6 +69,160 @@ class EmbeddingsService:
             logging.error(f"Error generating embeddings: {str(e)}")
             raise
 
+    def make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group input positions into batches bounded by item count and token budget."""
+        batches = []
+        current, current_tokens = [], 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (len(current) >= self.max_batch_size or
+                            current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _prepare_input(texts: List[str]) -> List[str]:
+        # The embeddings endpoint rejects empty strings
+        return [text if text.strip() else " " for text in texts]
+
+    @staticmethod
+    def _ordered_embeddings(response) -> List[List[float]]:
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _embed_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        response = self.client.embeddings.create(
+            input=self._prepare_input(texts),
+            model=self.model_name
+        )
+        return self._ordered_embeddings(response)
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        slots = self._request_slots.get(loop)
+        if slots is None:
+            slots = self._request_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    async def _embed_batch_async(self, texts: List[str]) -> List[List[float]]:
+        # At most max_concurrency requests in flight, however many callers there are
+        async with self._slots():
+            response = await self.async_client.embeddings.create(
+                input=self._prepare_input(texts),
+                model=self.model_name
+            )
+        return self._ordered_embeddings(response)
+
+    def get_embeddings_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = self.make_batches(texts)
+        results = [None] * len(texts)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                batch_results = executor.map(
+                    lambda batch: self._embed_batch_sync([texts[i] for i in batch]),
+                    batches
+                )
+                for batch, embeddings in zip(batches, batch_results):
+                    for i, embedding in zip(batch, embeddings):
+                        results[i] = embedding
+        except Exception as e:
+            logging.error(f"Error generating batch embeddings: {str(e)}")
+            raise
+        logging.info(f"Embedded {len(texts)} texts in {len(batches)} requests")
+        return results
+
+    async def aget_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return await self.inflight.do(tuple(texts), lambda: self._aget_embeddings_batch(texts))
+
+    async def _aget_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        batches = self.make_batches(texts)
+        results = [None] * len(texts)
+
+        async def run(batch: List[int]):
+            embeddings = await self._embed_batch_async([texts[i] for i in batch])
+            for i, embedding in zip(batch, embeddings):
+                results[i] = embedding
+
+        try:
+            await asyncio.gather(*(run(batch) for batch in batches))
+        except Exception as e:
+            logging.error(f"Error generating batch embeddings: {str(e)}")
+            raise
+        logging.info(f"Embedded {len(texts)} texts in {len(batches)} requests")
+        return results
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        try:
+            embeddings = await self.inflight.do((text,), lambda: self._embed_batch_async([text]))
+            return embeddings[0]
+        except Exception as e:
+            logging.error(f"Error generating embeddings: {str(e)}")
+            raise
+
+class CachedEmbeddingsService:
+    """Wraps an EmbeddingsService so texts already embedded never reach the endpoint again."""
+
+    def __init__(self, embedding_service: EmbeddingsService, cache: EmbeddingCache = None):
+        self.embedding_service = embedding_service
+        self.cache = cache or EmbeddingCache()
+
+    @property
+    def model_name(self) -> str:
+        return self.embedding_service.model_name
+
+    def _split_misses(self, texts: List[str]):
+        results = self.cache.get_many(self.model_name, texts)
+        # Embed each distinct missing text once, even if it repeats in the input
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        return results, missing
+
+    async def _asplit_misses(self, texts: List[str]):
+        results = await self.cache.aget_many(self.model_name, texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        return results, missing
+
+    def _merge(self, texts: List[str], results: list, missing: List[str], embeddings: list) -> list:
+        if missing:
+            self.cache.put_many(self.model_name, missing, embeddings)
+        return self._fill(texts, results, missing, embeddings)
+
+    def _fill(self, texts: List[str], results: list, missing: List[str], embeddings: list) -> list:
+        if missing:
+            fresh = dict(zip(missing, embeddings))
+            results = [fresh[text] if vector is None else vector for text, vector in zip(texts, results)]
+        return results
+
+    def get_embeddings_sync(self, text: str):
+        return self.get_embeddings_batch_sync([text])[0]
+
+    def get_embeddings_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        results, missing = self._split_misses(texts)
+        embeddings = self.embedding_service.get_embeddings_batch_sync(missing) if missing else []
+        return self._merge(texts, results, missing, embeddings)
+
+    async def aget_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        results, missing = await self._asplit_misses(texts)
+        embeddings = await self.embedding_service.aget_embeddings_batch(missing) if missing else []
+        if missing:
+            await self.cache.aput_many(self.model_name, missing, embeddings)
+        return self._fill(texts, results, missing, embeddings)
+
+    async def aget_embedding(self, text: str) -> List[float]:
+        return (await self.aget_embeddings_batch([text]))[0]
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["inflight"] = self.embedding_service.inflight.stats()
+        return stats
+
 class CustomAzureOpenAIEmbeddings(Embeddings):
     def __init__(self, embedding_service: EmbeddingsService):
         self.embedding_service = embedding_service
@@ -37,8 +231,10 @@ class CustomAzureOpenAIEmbeddings(Embeddings):
         return self.embedding_service.get_embeddings_sync(text)
 
     def embed_documents(self, texts: list) -> list:
-        return [self.embedding_service.get_embeddings_sync(text) for text in texts]
+        return self.embedding_service.get_embeddings_batch_sync(texts)
 
+    async def aembed_query(self, text: str) -> list:
+        return await self.embedding_service.aget_embedding(text)
 
-embedding_service = EmbeddingsService()
-custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
\ No newline at end of file
+    async def aembed_documents(self, texts: list) -> list:
+        return await self.embedding_service.aget_embeddings_batch(texts)
\ No newline at end of file
@@ -0,0 +1,202 @@
+import array
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store: in-process LRU in front of SQLite.
+
+    Vectors are keyed by (model deployment name, sha256 of the text) and kept as
+    float32 blobs. When the disk store grows past ``max_entries`` the least
+    recently used rows are evicted. Lookups never write straight away: access
+    times are buffered and written at most every ``touch_interval`` seconds,
+    or together with the next insert.
+    """
+
+    def __init__(self,
+                 path: str = None,
+                 max_entries: int = None,
+                 memory_entries: int = None,
+                 touch_interval: float = None):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+        self.memory_entries = memory_entries or int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "2048"))
+        self.touch_interval = touch_interval or float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL_SECONDS", "60"))
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        # (model, text_hash) -> last access time not yet written to disk
+        self._touched: Dict[tuple, float] = {}
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+        # Shared by every uvicorn worker; WAL lets them read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: tuple, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touches(self):
+        """Write buffered access times; the caller commits."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                [(at, model, h) for (model, h), at in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        now = time.time()
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = (model, text_hash(text))
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key[1], []).append(i)
+
+            if missing:
+                hashes = list(missing)
+                found = {}
+                # Stay under SQLite's bound-parameter limit
+                for start in range(0, len(hashes), 500):
+                    chunk = hashes[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings "
+                        f"WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model, *chunk]
+                    ).fetchall()
+                    found.update(rows)
+
+                for h, positions in missing.items():
+                    blob = found.get(h)
+                    if blob is None:
+                        self.misses += len(positions)
+                        continue
+                    vector = array.array("f", blob).tolist()
+                    self._remember((model, h), vector)
+                    self._touched[(model, h)] = now
+                    for i in positions:
+                        results[i] = vector
+                    self.disk_hits += len(positions)
+
+            if self._touched and time.monotonic() - self._last_flush >= self.touch_interval:
+                self._flush_touches()
+                self._conn.commit()
+
+        return results
+
+    async def aget_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """get_many on a worker thread, so SQLite never blocks the event loop."""
+        return await asyncio.to_thread(self.get_many, model, texts)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                h = text_hash(text)
+                self._remember((model, h), list(vector))
+                rows.append((model, h, array.array("f", vector).tobytes(), now))
+                self._touched.pop((model, h), None)
+            # Recent reads land before eviction picks the oldest rows
+            self._flush_touches()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    async def aput_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        await asyncio.to_thread(self.put_many, model, texts, vectors)
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self.put_many(model, [text], [vector])
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% of the cap so we don't pay for this on every insert
+        excess = count - int(self.max_entries * 0.9)
+        victims = self._conn.execute(
+            "SELECT rowid, model, text_hash FROM embeddings ORDER BY last_access ASC LIMIT ?",
+            (excess,)
+        ).fetchall()
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", [(rowid,) for rowid, _, _ in victims])
+        self._conn.commit()
+        self.evictions += len(victims)
+        for _, model, h in victims:
+            self._memory.pop((model, h), None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
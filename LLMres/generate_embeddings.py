@@ -1,8 +1,9 @@
 import os
 import asyncio
 from dotenv import load_dotenv
-from embed import EmbeddingsService, CustomAzureOpenAIEmbeddings
+from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
 from retrieval_system import RetrievalSystem
+from ingest_pipeline import IngestPipeline
 
 async def process_docs_directory(system: RetrievalSystem, docs_dir: str = "docs"):
     """Process all documents in the docs directory and generate embeddings."""
@@ -23,35 +24,28 @@ async def process_docs_directory(system: RetrievalSystem, docs_dir: str = "docs"
 
     print("\nChecking for files that need updating...")
     
-    # Process PDF files
-    for pdf_file in pdf_files:
-        file_path = os.path.join(docs_dir, pdf_file)
+    changed_files = []
+    for file_name in pdf_files + text_files:
+        file_path = os.path.join(docs_dir, file_name)
         if system._check_file_changed(file_path):
-            try:
-                print(f"\nGenerating embeddings for PDF file: {pdf_file}")
-                await system.setup_from_pdf_file(file_path)
-            except Exception as e:
-                print(f"Error processing PDF file {pdf_file}: {str(e)}")
+            changed_files.append(file_path)
+            print(f"Will process new/modified file: {file_name}")
         else:
-            print(f"Skipping unchanged PDF: {pdf_file}")
+            print(f"Skipping unchanged file: {file_name}")
 
-    # Process text files
-    if text_files:
-        changed_text_files = []
-        for text_file in text_files:
-            file_path = os.path.join(docs_dir, text_file)
-            if system._check_file_changed(file_path):
-                changed_text_files.append(file_path)
-                print(f"Will process modified text file: {text_file}")
-                
-        if changed_text_files:
-            try:
-                print("\nGenerating embeddings for modified text files...")
-                await system.setup_from_files(changed_text_files)
-            except Exception as e:
-                print(f"Error processing text files: {str(e)}")
-        else:
-            print("No text files need updating")
+    if not changed_files:
+        print("No files need updating")
+        return
+
+    # Load, OCR, split, embed and upsert files concurrently
+    print(f"\nGenerating embeddings for {len(changed_files)} files...")
+    report = await IngestPipeline(system).run(changed_files)
+    
+    print(f"\nIngested {report['files']} files in {report['seconds']:.2f}s")
+    for stage, seconds in report["stage_seconds"].items():
+        print(f"  {stage:<7} {seconds:.2f}s total")
+    for failure in report["failed"]:
+        print(f"Error processing {failure['path']}: {failure['error']}")
 
 async def main():
     """Main function to generate embeddings."""
@@ -64,7 +58,7 @@ async def main():
     print("\nInitializing embedding system...")
     
     # Initialize embedding service
-    embedding_service = EmbeddingsService()
+    embedding_service = CachedEmbeddingsService(EmbeddingsService())
     custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
     
     # Initialize the system
@@ -75,11 +69,12 @@ async def main():
         index_name="chris-data"
     )
     
-    # Initialize document client
-    system.initialize_document_client(
-        endpoint=os.getenv("AZURE_DOCUMENT_ENDPOINT"),
-        key=os.getenv("AZURE_DOCUMENT_KEY")
-    )
+    # Initialize document client (only needed for PDF pages without a text layer)
+    if os.getenv("AZURE_DOCUMENT_ENDPOINT"):
+        system.initialize_document_client(
+            endpoint=os.getenv("AZURE_DOCUMENT_ENDPOINT"),
+            key=os.getenv("AZURE_DOCUMENT_KEY")
+        )
     
     try:
         # Check for removed files and clean up if necessary
@@ -89,6 +84,8 @@ async def main():
         await process_docs_directory(system)
         
         print("\nEmbedding generation complete!")
+        print(f"Embedding cache: {embedding_service.stats()}")
+        print(f"PDF pages: {system.doc_processor.pdf_stats}")
         
     except Exception as e:
         print(f"An error occurred during embedding generation: {str(e)}")
@@ -0,0 +1,92 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+
+from bm25 import BM25Index
+from metrics import timed
+
+
+def _doc_key(doc: Document):
+    # Chunk IDs are derived from source and text, and not every store returns them
+    return doc.metadata.get("source", ""), doc.page_content
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]],
+                           weights: Optional[List[float]] = None,
+                           rrf_k: int = 60) -> List[Document]:
+    """Merge ranked lists by summing weight / (rrf_k + rank) per document."""
+    weights = weights or [1.0] * len(result_lists)
+    scores: Dict[Any, float] = {}
+    docs: Dict[Any, Document] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, doc in enumerate(results, 1):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and vector search results with reciprocal rank fusion.
+
+    Each side fetches ``fetch_k`` candidates and the best ``k`` fused chunks
+    are returned. Exact strings such as phone numbers, emails and names are
+    found by BM25 even when their embedding is not among the nearest ones.
+    """
+
+    vector_store: VectorStore
+    lexical_index: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+    vector_weight: float = 1.0
+    lexical_weight: float = 1.0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _fuse(self, vector_docs: List[Document], lexical_docs: List[Document]) -> List[Document]:
+        fused = reciprocal_rank_fusion(
+            [vector_docs, lexical_docs],
+            weights=[self.vector_weight, self.lexical_weight],
+            rrf_k=self.rrf_k
+        )
+        return fused[:self.k]
+
+    def search(self, query: str) -> Tuple[List[Document], List[float]]:
+        """Fused results plus the query's embedding, so a reranker needn't embed the query again."""
+        with timed("query_embedding"):
+            query_vector = self.vector_store.embeddings.embed_query(query)
+        with timed("vector_search"):
+            vector_docs = self.vector_store.similarity_search_by_vector(query_vector, k=self.fetch_k)
+        with timed("bm25_search"):
+            lexical_docs = [doc for doc, _ in self.lexical_index.search(query, k=self.fetch_k)]
+        return self._fuse(vector_docs, lexical_docs), query_vector
+
+    async def asearch(self, query: str) -> Tuple[List[Document], List[float]]:
+        async def vector_search():
+            with timed("query_embedding"):
+                query_vector = await self.vector_store.embeddings.aembed_query(query)
+            with timed("vector_search"):
+                return query_vector, await self.vector_store.asimilarity_search_by_vector(query_vector, k=self.fetch_k)
+
+        def lexical_search():
+            with timed("bm25_search"):
+                return self.lexical_index.search(query, self.fetch_k)
+
+        (query_vector, vector_docs), lexical_hits = await asyncio.gather(
+            vector_search(), asyncio.to_thread(lexical_search)
+        )
+        return self._fuse(vector_docs, [doc for doc, _ in lexical_hits]), query_vector
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search(query)[0]
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return (await self.asearch(query))[0]
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+from langchain_core.documents import Document
+
+from answer_cache import bump_index_version
+
+STAGES = ["load", "parse", "split", "embed", "upsert"]
+
+# Marks the end of a stage's input queue
+_DONE = object()
+
+
+@dataclass
+class FileJob:
+    path: str
+    kind: str
+    data: Optional[bytes] = None
+    documents: List[Document] = field(default_factory=list)
+    known_ids: Set[str] = field(default_factory=set)
+    chunk_ids: List[str] = field(default_factory=list)
+    id_counts: Dict[str, int] = field(default_factory=dict)
+    batch_count: Optional[int] = None
+    batch_ids: Dict[int, List[str]] = field(default_factory=dict)
+    new_chunks: int = 0
+    removed_chunks: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+    finished: bool = False
+
+
+@dataclass
+class ChunkBatch:
+    """A slice of one file's chunks; files are split into these so large files stream through."""
+    job: FileJob
+    index: int
+    splits: List[Document]
+    ids: List[str]
+    last: bool
+    new_splits: List[Document] = field(default_factory=list)
+    new_ids: List[str] = field(default_factory=list)
+    embeddings: List[List[float]] = field(default_factory=list)
+
+
+class IngestPipeline:
+    """Streams files through load -> parse -> split -> embed -> upsert.
+
+    Stages run concurrently and are connected by bounded queues, so one file
+    can be embedded while the next is still being OCR'd. From the split stage
+    on, files travel as batches of ``batch_size`` chunks; text files are read
+    and split lazily, so a file of any size holds only a few batches in memory.
+    Each stage has its own worker count; a file that fails in one stage skips
+    the rest and is reported at the end. Like ``RetrievalSystem._setup_system``
+    only changed chunks are embedded. Chunk IDs are assigned in file order by
+    the split stage; stale chunks are deleted only once every batch of the
+    file has been upserted. Upserts only change the index in memory;
+    the vector store, then the BM25 index and the manifest, are written once
+    when the run ends, so the manifest never lists chunks the store lacks.
+    """
+
+    def __init__(self,
+                 system,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 queue_size: Optional[int] = None,
+                 batch_size: Optional[int] = None):
+        self.system = system
+        defaults = {"load": 4, "parse": 4, "split": 2, "embed": 2, "upsert": 1}
+        self.concurrency = {
+            stage: int(os.getenv(f"INGEST_{stage.upper()}_CONCURRENCY", str(defaults[stage])))
+            for stage in STAGES
+        }
+        self.concurrency.update(concurrency or {})
+        self.queue_size = queue_size or int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", "256"))
+        self.jobs: List[FileJob] = []
+        self._finished = 0
+        self._changed = False
+        self._index_existed = True
+
+    def _progress(self, job: FileJob, stage: str, detail: str = ""):
+        print(f"[{self._finished}/{len(self.jobs)}] {job.path}: {stage} "
+              f"{job.timings.get(stage, 0.0):.2f}s {detail}".rstrip())
+
+    async def _load(self, job: FileJob, emit):
+        if job.kind == "pdf":
+            def read() -> bytes:
+                with open(job.path, "rb") as f:
+                    return f.read()
+            job.data = await asyncio.to_thread(read)
+            detail = f"{len(job.data)} bytes"
+        else:
+            # Text is streamed from disk by the split stage
+            detail = f"{os.path.getsize(job.path)} bytes"
+        await emit(job)
+        return detail
+
+    async def _parse(self, job: FileJob, emit):
+        if job.kind == "pdf":
+            job.documents = await self.system.doc_processor.load_pdf_bytes(job.data, job.path)
+            job.data = None
+            detail = f"{len(job.documents)} pages"
+        else:
+            detail = "streamed"
+        await emit(job)
+        return detail
+
+    def _chunks(self, job: FileJob) -> Iterator[Document]:
+        if job.kind == "pdf":
+            return iter(self.system.doc_processor.split_documents(job.documents, False) if job.documents else [])
+        return self.system.doc_processor.iter_text_chunks(job.path)
+
+    async def _split(self, job: FileJob, emit):
+        if self._index_existed:
+            job.known_ids = set(self.system.processed_files.get(job.path, {}).get("chunks", []))
+        chunks = self._chunks(job)
+        job.documents = []
+        count = 0
+        index = 0
+        batch = await asyncio.to_thread(lambda: list(islice(chunks, self.batch_size)))
+        while job.error is None:
+            following = await asyncio.to_thread(lambda: list(islice(chunks, self.batch_size))) if batch else []
+            count += len(batch)
+            # IDs follow the file's order, whichever embed worker takes the batch
+            ids = self.system.doc_processor.chunk_ids(batch, seen=job.id_counts)
+            if not following:
+                job.batch_count = index + 1
+            await emit(ChunkBatch(job=job, index=index, splits=batch, ids=ids, last=not following))
+            if not following:
+                break
+            batch = following
+            index += 1
+        return f"{count} chunks"
+
+    async def _embed(self, batch: ChunkBatch, emit):
+        job = batch.job
+        for doc, chunk_id in zip(batch.splits, batch.ids):
+            if chunk_id not in job.known_ids:
+                batch.new_splits.append(doc)
+                batch.new_ids.append(chunk_id)
+        if batch.new_splits:
+            batch.embeddings = await self.system.embedding_model.aembed_documents(
+                [doc.page_content for doc in batch.new_splits]
+            )
+        await emit(batch)
+        return f"{len(batch.new_splits)} new, {len(batch.splits) - len(batch.new_splits)} unchanged"
+
+    async def _upsert(self, batch: ChunkBatch, emit):
+        job = batch.job
+        manager = self.system.vector_manager
+        if batch.new_splits:
+            await manager.upsert_embeddings(batch.new_splits, batch.embeddings, batch.new_ids, flush=False)
+            self.system.lexical_index.add(batch.new_splits, batch.new_ids)
+        job.batch_ids[batch.index] = batch.ids
+        job.new_chunks += len(batch.new_ids)
+        # Embed workers can deliver a file's batches out of order; the diff
+        # needs all of its chunk IDs, so it waits for the file's last upsert
+        if len(job.batch_ids) != job.batch_count:
+            return f"{len(batch.new_ids)} upserted"
+
+        job.chunk_ids = [chunk_id for index in sorted(job.batch_ids) for chunk_id in job.batch_ids[index]]
+        removed_ids = sorted(job.known_ids - set(job.chunk_ids))
+        if removed_ids:
+            await asyncio.to_thread(manager.delete, removed_ids, False)
+            self.system.lexical_index.remove(removed_ids)
+        job.removed_chunks = len(removed_ids)
+        # An emptied file is covered too: all its old chunks are in removed_ids,
+        # and everything is written once, when the run ends
+        self.system._record_chunks({job.path: job.chunk_ids}, save=False)
+        self.system._update_file_metadata(job.path, save=False)
+        self._changed = self._changed or bool(job.new_chunks or removed_ids)
+        self._finish(job)
+        return f"{len(job.chunk_ids)} chunks: {job.new_chunks} upserted, {job.removed_chunks} deleted"
+
+    def _finish(self, job: FileJob):
+        if not job.finished:
+            job.finished = True
+            self._finished += 1
+
+    async def _worker(self, stage: str, handler: Callable[[Any, Callable], Awaitable[str]],
+                      inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]):
+        waited = 0.0
+
+        async def emit(item):
+            # Time spent blocked on a full queue is not charged to this stage
+            nonlocal waited
+            if outbox is not None:
+                start = time.perf_counter()
+                await outbox.put(item)
+                waited += time.perf_counter() - start
+
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # Let the other workers of this stage see it too
+                await inbox.put(_DONE)
+                return
+            job = item.job if isinstance(item, ChunkBatch) else item
+            if job.error is not None:
+                continue
+            start = time.perf_counter()
+            waited = 0.0
+            try:
+                detail = await handler(item, emit)
+            except Exception as e:
+                job.error = f"{stage}: {str(e)}"
+                detail = f"failed ({str(e)})"
+                self._finish(job)
+            job.timings[stage] = job.timings.get(stage, 0.0) + time.perf_counter() - start - waited
+            # A file's batches may leave a stage out of order; report it once, when all have
+            file_done = job.finished if stage == "upsert" else isinstance(item, ChunkBatch) and item.last
+            if not isinstance(item, ChunkBatch) or file_done or job.error is not None:
+                self._progress(job, stage, detail)
+
+    async def _run_stage(self, stage: str, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]):
+        handler = getattr(self, f"_{stage}")
+        await asyncio.gather(*(
+            self._worker(stage, handler, inbox, outbox)
+            for _ in range(max(1, self.concurrency[stage]))
+        ))
+        if outbox is not None:
+            await outbox.put(_DONE)
+
+    async def run(self, file_paths: List[str]) -> Dict[str, Any]:
+        self.jobs = [
+            FileJob(path=path, kind="pdf" if path.lower().endswith(".pdf") else "text")
+            for path in file_paths
+        ]
+        self._finished = 0
+        self._changed = False
+        if not self.jobs:
+            return self.report(0.0)
+
+        start = time.perf_counter()
+        self._index_existed = self.system.vector_manager.index_exists(self.system.index_name)
+        await self.system.vector_manager.ensure_index(self.system.index_name, self.system.embedding_model)
+
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in STAGES]
+        stages = [
+            asyncio.create_task(self._run_stage(stage, queues[i], queues[i + 1] if i + 1 < len(STAGES) else None))
+            for i, stage in enumerate(STAGES)
+        ]
+
+        async def feed():
+            for job in self.jobs:
+                await queues[0].put(job)
+            await queues[0].put(_DONE)
+
+        try:
+            await asyncio.gather(feed(), *stages)
+        finally:
+            await asyncio.to_thread(self.system.vector_manager.flush)
+            self.system._save_metadata()
+            self.system.lexical_index.save()
+        if self._changed:
+            bump_index_version()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "files": len(self.jobs),
+            "failed": [{"path": job.path, "error": job.error} for job in self.jobs if job.error],
+            "seconds": elapsed,
+            "stage_seconds": {
+                stage: sum(job.timings.get(stage, 0.0) for job in self.jobs) for stage in STAGES
+            },
+            "per_file": {job.path: dict(job.timings) for job in self.jobs},
+        }
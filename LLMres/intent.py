@@ -0,0 +1,141 @@
+import os
+import re
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Requests to stop, e.g. "don't forget" / "อย่าลืม", are never clear requests
+NEGATION_PATTERNS = [
+    re.compile(r"\b(don'?t|do not|never|please don'?t)\s+(clear|reset|forget|wipe|erase|delete)\b", re.I),
+    re.compile(r"อย่า\s*(ลืม|ลบ|ล้าง|รีเซ็ต|เคลียร์)"),
+]
+
+# Only short imperative commands that are the whole message settle a clear
+# request on their own; anything longer goes through the exemplar/LLM path
+STRONG_PATTERNS = [
+    re.compile(r"^(please |can you |could you )?(clear|reset|wipe|erase|delete|forget) "
+               r"((my|our|the|your|this) )?((chat|conversation) )?"
+               r"(memory|memories|history|chat|conversation|context|everything)( please)?[.!?]*$", re.I),
+    re.compile(r"^(please |let'?s )?(start over|start fresh|start again|begin again|restart|reset|clear"
+               r"|(start a )?new (chat|conversation|session))( please)?[.!]*$", re.I),
+    re.compile(r"^/(reset|clear|new)$", re.I),
+    re.compile(r"^(ช่วย|ขอ)?(ล้าง|ลบ|ลืม|รีเซ็ต|รีเซ็ท|เคลียร์)"
+               r"(ความจำ|ความทรงจำ|ประวัติ(แชท|การคุย)?|แชท|บทสนทนา|ทุกอย่าง|ทั้งหมด)"
+               r"(ทั้งหมด)?(ให้)?(หน่อย|ด้วย|เลย)?(ครับ|ค่ะ|คะ|นะ)?[.!]*$"),
+    re.compile(r"^(รีเซ็ต|รีเซ็ท|เคลียร์)(ครับ|ค่ะ|คะ|นะ)?[.!]*$"),
+    re.compile(r"^(ขอ)?เริ่ม(ต้น)?(คุย|แชท|บทสนทนา|การสนทนา)?ใหม่(ได้ไหม|หน่อย|นะ)?(ครับ|ค่ะ|คะ)?[.!?]*$"),
+]
+
+HINT_WORDS = re.compile(
+    r"\b(clear|reset|wipe|erase|forget|flush|purge|restart|memory|memories|history|new (chat|conversation|session)|start over|fresh)\b"
+    r"|ลืม|ล้าง|ลบ|ใหม่|ความจำ|ประวัติ|รีเซ็ต|รีเซ็ท|เคลียร์",
+    re.I
+)
+
+# A letter outside Latin and Thai: the hint words can't judge other languages
+OTHER_SCRIPT = re.compile(r"[^\W\d_A-Za-z\u00C0-\u024F\u0E00-\u0E7F]")
+
+CLEAR_EXEMPLARS = [
+    "clear your memory",
+    "clear the chat history",
+    "forget everything we talked about",
+    "reset the conversation",
+    "let's start a new conversation",
+    "start over from scratch",
+    "wipe our chat",
+    "delete the conversation history",
+    "ล้างความจำ",
+    "ลบประวัติแชท",
+    "ลืมทุกอย่างที่คุยกัน",
+    "เริ่มบทสนทนาใหม่",
+    "รีเซ็ตแชท",
+    "เคลียร์แชททั้งหมด",
+]
+
+
+class ClearIntentDetector:
+    """Decides locally whether a message asks to clear the chat memory.
+
+    Short Thai/English commands ("clear memory", "เริ่มใหม่") are settled by
+    rules, as are messages with no hint of clearing at all. Everything else,
+    including messages in other languages, is compared against cached
+    exemplar embeddings, and only those that land between ``low_threshold``
+    and ``high_threshold`` are sent to the (optional) LLM classifier.
+    """
+
+    def __init__(self,
+                 embedding_model=None,
+                 high_threshold: Optional[float] = None,
+                 low_threshold: Optional[float] = None,
+                 max_rule_length: int = 120,
+                 exemplars: List[str] = None):
+        self.embedding_model = embedding_model
+        self.high_threshold = high_threshold or float(os.getenv("CLEAR_INTENT_HIGH_THRESHOLD", "0.86"))
+        self.low_threshold = low_threshold or float(os.getenv("CLEAR_INTENT_LOW_THRESHOLD", "0.78"))
+        self.max_rule_length = max_rule_length
+        self.exemplars = exemplars or CLEAR_EXEMPLARS
+        self._exemplar_matrix: Optional[np.ndarray] = None
+        self.decisions: Dict[str, int] = {"rule": 0, "embedding": 0, "llm": 0, "default": 0}
+
+    def classify_by_rules(self, message: str) -> Tuple[Optional[bool], str]:
+        """Return (decision, reason); decision is None when the rules can't tell."""
+        text = message.strip()
+        if not text:
+            return False, "empty"
+        if any(pattern.search(text) for pattern in NEGATION_PATTERNS):
+            return False, "negation"
+        if len(text) <= self.max_rule_length and any(pattern.search(text) for pattern in STRONG_PATTERNS):
+            return True, "strong_pattern"
+        if OTHER_SCRIPT.search(text):
+            return None, "other_script"
+        if not HINT_WORDS.search(text):
+            return False, "no_hint"
+        return None, "ambiguous"
+
+    async def _exemplars(self) -> np.ndarray:
+        if self._exemplar_matrix is None:
+            vectors = np.asarray(await self.embedding_model.aembed_documents(self.exemplars), dtype=np.float32)
+            self._exemplar_matrix = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        return self._exemplar_matrix
+
+    async def exemplar_similarity(self, message: str) -> float:
+        exemplars = await self._exemplars()
+        query = np.asarray(await self.embedding_model.aembed_query(message), dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        return float(np.max(exemplars @ query))
+
+    async def detect(self,
+                     message: str,
+                     llm_fallback: Optional[Callable[[str], Awaitable[bool]]] = None) -> bool:
+        decision, reason = self.classify_by_rules(message)
+        if decision is not None:
+            self.decisions["rule"] += 1
+            return decision
+
+        similarity = None
+        if self.embedding_model is not None:
+            try:
+                similarity = await self.exemplar_similarity(message)
+            except Exception as e:
+                logger.warning(f"Clear-intent embedding check failed: {str(e)}")
+            if similarity is not None:
+                if similarity >= self.high_threshold:
+                    self.decisions["embedding"] += 1
+                    return True
+                if similarity <= self.low_threshold:
+                    self.decisions["embedding"] += 1
+                    return False
+
+        if llm_fallback is not None:
+            self.decisions["llm"] += 1
+            return await llm_fallback(message)
+
+        self.decisions["default"] += 1
+        midpoint = (self.high_threshold + self.low_threshold) / 2
+        return similarity is not None and similarity >= midpoint
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.decisions)
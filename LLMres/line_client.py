@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LineClient:
+    """Shared async client for the LINE Messaging API.
+
+    One pooled keep-alive connection set lives for the whole app. Calls that
+    fail with 429/5xx or a transport error are retried with exponential
+    backoff and full jitter, and every call's latency is recorded per
+    operation. A ``Retry-After`` is honoured in full; if it would outlast the
+    reply token (``reply_token_ttl`` seconds from the event) the call gives up.
+    """
+
+    def __init__(self,
+                 access_token: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None,
+                 max_connections: int = 20,
+                 backoff_base: float = 0.25,
+                 backoff_cap: float = 5.0,
+                 reply_token_ttl: Optional[float] = None):
+        self.access_token = access_token or os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+        self.base_url = base_url or os.getenv("LINE_API_BASE", "https://api.line.me")
+        self.timeout = timeout or float(os.getenv("LINE_API_TIMEOUT", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LINE_API_MAX_RETRIES", "3"))
+        self.max_connections = max_connections
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.reply_token_ttl = reply_token_ttl or float(os.getenv("LINE_REPLY_TOKEN_TTL_SECONDS", "60"))
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.latency: Dict[str, Histogram] = {}
+        self.retries = 0
+        self.errors = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.access_token}"
+                },
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                )
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return max(float(retry_after), 0.0)
+                except ValueError:
+                    pass
+                try:
+                    return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    async def _post(self,
+                    operation: str,
+                    path: str,
+                    payload: Dict[str, Any],
+                    expires_at: Optional[float] = None) -> httpx.Response:
+        """POST with retries; no retry is started that would end after ``expires_at`` (epoch seconds)."""
+        histogram = self.latency.setdefault(operation, Histogram())
+        attempt = 0
+        while True:
+            response = None
+            start = time.perf_counter()
+            try:
+                response = await self.client.post(path, json=payload)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                error = f"{response.status_code} {response.text}"
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+            if attempt >= self.max_retries:
+                self.errors += 1
+                if response is not None:
+                    return response
+                raise httpx.TransportError(f"LINE {operation} failed after {attempt + 1} attempts: {error}")
+
+            delay = self._backoff(attempt, response)
+            if expires_at is not None and time.time() + delay > expires_at:
+                self.errors += 1
+                logger.warning(f"LINE {operation} failed ({error}); a retry in {delay:.2f}s would be too late, giving up")
+                if response is not None:
+                    return response
+                raise httpx.TransportError(f"LINE {operation} failed and expired before a retry: {error}")
+            logger.warning(f"LINE {operation} failed ({error}); retrying in {delay:.2f}s")
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def reply_message(self, reply_token: str, message: str, issued_at: Optional[float] = None) -> Dict[str, Any]:
+        """Reply with ``message``; ``issued_at`` is when the event arrived (epoch seconds).
+
+        Returns LINE's JSON body, or {} if it had none, with the HTTP status under "status".
+        """
+        expires_at = (issued_at or time.time()) + self.reply_token_ttl
+        response = await self._post("reply", "/v2/bot/message/reply", {
+            "replyToken": reply_token,
+            "messages": [
+                {
+                    "type": "text",
+                    "text": message
+                }
+            ]
+        }, expires_at=expires_at)
+        if response.status_code != 200:
+            logger.error(f"Error sending LINE message: {response.status_code} {response.text}")
+        try:
+            body = response.json() if response.content else {}
+        except ValueError:
+            # e.g. an HTML error page from a proxy
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        return {**body, "status": response.status_code}
+
+    async def start_loading_animation(self, chat_id: str, seconds: int = 15) -> bool:
+        """Start loading animation for LINE chat."""
+        try:
+            response = await self._post("loading", "/v2/bot/chat/loading/start", {
+                "chatId": chat_id,
+                "loadingSeconds": seconds
+            }, expires_at=time.time() + seconds)
+        except httpx.TransportError as e:
+            logger.error(f"Error starting loading animation: {str(e)}")
+            return False
+        return response.status_code in (200, 202)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "errors": self.errors,
+            "latency": {operation: histogram.snapshot() for operation, histogram in self.latency.items()},
+        }
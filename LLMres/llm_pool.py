@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import Histogram, registry
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Delay asked for by a 429, from ``retry-after-ms`` or ``retry-after`` (seconds)."""
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                # HTTP-date form; fall back to the default pause
+                continue
+    return None
+
+
+class AdaptiveLimiter:
+    """Global cap on concurrent LLM requests that backs off on 429s.
+
+    At most ``limit`` requests are in flight; the rest queue. A 429 pauses
+    every new request until its ``Retry-After`` has passed and halves
+    ``limit``; each run of ``limit`` successful requests raises it by one
+    again, up to ``max_concurrency``.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1, default_pause: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.default_pause = default_pause
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.queued = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.limit_decreases = 0
+        self.queue_wait = Histogram()
+        self._successes = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            async with self.condition:
+                while True:
+                    pause = self._paused_until - time.monotonic()
+                    if pause <= 0 and self.in_flight < self.limit:
+                        break
+                    if pause > 0:
+                        try:
+                            await asyncio.wait_for(self.condition.wait(), pause)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self.condition.wait()
+                self.in_flight += 1
+                self.requests += 1
+        finally:
+            self.queued -= 1
+            self.queue_wait.observe(time.perf_counter() - start)
+
+    async def release(self, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        async with self.condition:
+            self.in_flight -= 1
+            if status_code == 429:
+                self._rate_limited(retry_after)
+            elif status_code is not None and status_code < 500:
+                self._succeeded()
+            self.condition.notify_all()
+
+    def _rate_limited(self, retry_after: Optional[float]):
+        now = time.monotonic()
+        pause = retry_after if retry_after is not None else self.default_pause
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, now + pause)
+        self._successes = 0
+        # Requests that were already in flight often all come back 429; count them as one signal
+        if now - self._last_decrease > pause:
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            self._last_decrease = now
+            self.limit_decreases += 1
+            logger.warning(f"LLM rate limited; pausing {pause:.2f}s, concurrency limit now {self.limit}")
+
+    def _succeeded(self):
+        self._successes += 1
+        if self.limit < self.max_concurrency and self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "limit": self.limit,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "limit_decreases": self.limit_decreases,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that gives the limiter slot back once it has been read or closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            await self._release()
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """httpx transport that passes every request through an AdaptiveLimiter.
+
+    A slot is held until the response body is closed, so a streamed
+    completion counts as in flight for as long as tokens are arriving.
+    """
+
+    def __init__(self, limiter: AdaptiveLimiter, transport: httpx.AsyncBaseTransport):
+        self.limiter = limiter
+        self.transport = transport
+        self.latency = Histogram()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.limiter.acquire()
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            await self.limiter.release()
+            raise
+
+        released = False
+        retry_after = retry_after_seconds(response) if response.status_code == 429 else None
+
+        async def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.latency.observe(time.perf_counter() - start)
+                await self.limiter.release(response.status_code, retry_after)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, release),
+            extensions=response.extensions,
+            request=request
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records duration, time to first token and token counts of every chat model call.
+
+    Token counts come from the response's usage when the API reports it
+    (streamed responses usually don't) and are estimated with tiktoken otherwise.
+    """
+
+    run_inline = True
+
+    def __init__(self, deployment: str):
+        self.deployment = deployment
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs):
+        prompt = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._runs[run_id] = {"start": time.perf_counter(), "first_token": None, "prompt": prompt}
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None and run["first_token"] is None:
+            run["first_token"] = time.perf_counter()
+            registry.histogram("llm_time_to_first_token_seconds", "Time until the first streamed token",
+                               deployment=self.deployment).observe(run["first_token"] - run["start"])
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        registry.histogram("llm_call_seconds", "Duration of each chat model call",
+                           deployment=self.deployment).observe(time.perf_counter() - run["start"])
+        prompt_tokens, completion_tokens = self._usage(response)
+        if prompt_tokens is None:
+            prompt_tokens = count_tokens(run["prompt"])
+        if completion_tokens is None:
+            completion_tokens = sum(count_tokens(g.text) for batch in response.generations for g in batch)
+        registry.counter("llm_tokens", "Tokens sent to and received from the chat model",
+                         deployment=self.deployment, kind="prompt").inc(prompt_tokens)
+        registry.counter("llm_tokens", "Tokens sent to and received from the chat model",
+                         deployment=self.deployment, kind="completion").inc(completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._runs.pop(run_id, None)
+        registry.counter("llm_errors", "Chat model calls that raised", deployment=self.deployment).inc()
+
+    @staticmethod
+    def _usage(response):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens") is not None:
+            return usage["prompt_tokens"], usage.get("completion_tokens")
+        for batch in response.generations:
+            for generation in batch:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if metadata:
+                    return metadata.get("input_tokens"), metadata.get("output_tokens")
+        return None, None
+
+
+class LLMPool:
+    """Registry of chat model clients that share one connection pool and limiter.
+
+    ``get_llm`` returns the same AzureChatOpenAI for the same settings, so
+    the agent, summaries and intent checks all draw on one set of keep-alive
+    connections and one global concurrency limit.
+    """
+
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 max_connections: Optional[int] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        self.limiter = AdaptiveLimiter(self.max_concurrency)
+        self._transport = transport
+        self.transport: Optional[LimitedTransport] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._llms: Dict[tuple, Any] = {}
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            inner = self._transport or httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                )
+            )
+            self.transport = LimitedTransport(self.limiter, inner)
+            self._http_client = httpx.AsyncClient(transport=self.transport, timeout=httpx.Timeout(60.0, connect=5.0))
+        return self._http_client
+
+    def get_llm(self, azure_endpoint: str, azure_deployment: str, api_version: str, **kwargs):
+        key = (azure_endpoint, azure_deployment, api_version, tuple(sorted(kwargs.items())))
+        if key not in self._llms:
+            from langchain_openai import AzureChatOpenAI
+            self._llms[key] = AzureChatOpenAI(
+                azure_endpoint=azure_endpoint,
+                azure_deployment=azure_deployment,
+                openai_api_version=api_version,
+                http_async_client=self.http_client,
+                callbacks=[LLMMetricsCallback(azure_deployment)],
+                **kwargs
+            )
+        return self._llms[key]
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.limiter.stats()
+        stats["clients"] = len(self._llms)
+        if self._http_client is not None:
+            stats["latency"] = self.transport.latency.snapshot()
+        return stats
+
+
+_pool: Optional[LLMPool] = None
+
+
+def get_llm_pool() -> LLMPool:
+    global _pool
+    if _pool is None:
+        _pool = LLMPool()
+    return _pool
@@ -0,0 +1,474 @@
+import asyncio
+import copy
+import json
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from ann_index import IVFIndex
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store kept on local disk and queried in-process.
+
+    Unit-normalised embeddings live in ``embeddings.npy`` and are opened with
+    ``mmap_mode="r"`` so the OS page cache holds them; ids, texts and metadata
+    live in the ``metadata.json`` sidecar. Cosine similarity is a single
+    matrix-vector product, or, once an ``ann_index`` is trained, a product over
+    the rows in the probed clusters only.
+
+    Each save writes a new generation directory and then swaps the one-line
+    ``CURRENT`` pointer, so readers see either the old or the new files, never
+    a mix. Adds and deletes only touch memory when ``save=False``; ingest runs
+    use that and call ``save()`` once at the end. Adds, deletes and searches
+    may come from several threads (e.g. concurrent upsert workers).
+    """
+
+    EMBEDDINGS_FILE = "embeddings.npy"
+    METADATA_FILE = "metadata.json"
+    POINTER_FILE = "CURRENT"
+
+    def __init__(self,
+                 directory: str,
+                 embedding: Embeddings,
+                 dtype: str = "float32",
+                 ann_index: Optional[IVFIndex] = None):
+        self.directory = directory
+        self._embedding = embedding
+        self.dtype = np.dtype(dtype)
+        self.ann_index = ann_index
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.matrix: Optional[np.ndarray] = None
+        # Writable rows behind ``matrix`` once it has been changed in memory;
+        # over-allocated so appends don't copy the whole matrix each time
+        self._buffer: Optional[np.ndarray] = None
+        self._row_of: Dict[str, int] = {}
+        self._dirty = False
+        self._version = 0
+        self._generation_dir: Optional[str] = None
+        # Guards the in-memory state; _save_lock keeps whole saves in order
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @classmethod
+    def current_dir(cls, directory: str) -> Optional[str]:
+        """Directory holding the live embeddings/metadata, or None if nothing was saved."""
+        try:
+            with open(os.path.join(directory, cls.POINTER_FILE), "r", encoding="utf-8") as f:
+                generation = f.read().strip()
+        except FileNotFoundError:
+            generation = ""
+        if generation:
+            return os.path.join(directory, generation)
+        # Stores written before generations existed keep their files at the top level
+        if os.path.exists(os.path.join(directory, cls.METADATA_FILE)):
+            return directory
+        return None
+
+    def _load(self):
+        current = self.current_dir(self.directory)
+        if current is None:
+            return
+        with open(os.path.join(current, self.METADATA_FILE), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        self._generation_dir = current
+        self.ids = sidecar["ids"]
+        self.texts = sidecar["texts"]
+        self.metadatas = sidecar["metadatas"]
+        self._row_of = {id_: i for i, id_ in enumerate(self.ids)}
+        embeddings_path = os.path.join(current, self.EMBEDDINGS_FILE)
+        if self.ids and os.path.exists(embeddings_path):
+            self.matrix = np.load(embeddings_path, mmap_mode="r")
+            self.dtype = self.matrix.dtype
+        if self.ann_index is not None and not self.ann_index.load(current, len(self.ids)):
+            self.ann_index.maybe_train(self.matrix)
+
+    def save(self):
+        """Write the in-memory state as a new generation, if anything changed.
+
+        The files are written from a snapshot taken under the lock, so searches
+        and further adds carry on while the .npy is being written. An ANN
+        retrain runs on the snapshot outside the lock too; the new index is
+        swapped in afterwards unless rows changed meanwhile, in which case the
+        next save retrains.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                version = self._version
+                # Rows already in the matrix are never changed in place, so the
+                # snapshot needs no copy
+                matrix = self.matrix if self.matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+                sidecar = {
+                    "dimension": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+                    "dtype": self.dtype.name,
+                    "ids": list(self.ids),
+                    "texts": list(self.texts),
+                    "metadatas": list(self.metadatas),
+                }
+                os.makedirs(self.directory, exist_ok=True)
+                generation = f"v-{uuid.uuid4().hex}"
+                target = os.path.join(self.directory, generation)
+                os.makedirs(target)
+                ann_index = None
+                retrain = False
+                if self.ann_index is not None:
+                    if len(self.ids) < self.ann_index.train_threshold and self.ann_index.is_trained:
+                        self.ann_index.reset()
+                    retrain = self.ann_index.needs_training(len(self.ids))
+                    # The index replaces its arrays rather than changing them, so a shallow copy is a snapshot
+                    ann_index = copy.copy(self.ann_index)
+
+            if retrain:
+                ann_index.train(matrix)
+            if ann_index is not None:
+                ann_index.save(target)
+            np.save(os.path.join(target, self.EMBEDDINGS_FILE), matrix)
+            with open(os.path.join(target, self.METADATA_FILE), "w", encoding="utf-8") as f:
+                json.dump(sidecar, f, ensure_ascii=False)
+            pointer = os.path.join(self.directory, self.POINTER_FILE)
+            with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+                f.write(generation)
+            # The only step readers can observe: the pointer names the old or the new generation
+            os.replace(pointer + ".tmp", pointer)
+
+            with self._lock:
+                previous = self._generation_dir
+                self._generation_dir = target
+                if self._version == version:
+                    if retrain:
+                        self.ann_index = ann_index
+                    self._dirty = False
+                    self._buffer = None
+                    self.matrix = np.load(os.path.join(target, self.EMBEDDINGS_FILE),
+                                          mmap_mode="r") if self.ids else None
+            self._prune(keep={generation, os.path.basename(previous or "")})
+
+    def _prune(self, keep: set):
+        # The generation just replaced stays on disk for readers that resolved
+        # the pointer a moment ago; anything older is removed
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("v-") and name not in keep and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        for name in (self.EMBEDDINGS_FILE, self.METADATA_FILE, IVFIndex.INDEX_FILE):
+            legacy = os.path.join(self.directory, name)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _append_rows(self, vectors: np.ndarray):
+        count = self.matrix.shape[0] if self.matrix is not None else 0
+        needed = count + len(vectors)
+        if self._buffer is None or self._buffer.shape[0] < needed or self._buffer.shape[1] != vectors.shape[1]:
+            buffer = np.empty((max(needed, 2 * count, 1024), vectors.shape[1]), dtype=self.dtype)
+            if count:
+                buffer[:count] = self.matrix
+            self._buffer = buffer
+        self._buffer[count:needed] = vectors
+        self.matrix = self._buffer[:needed]
+
+    def _keep_rows(self, keep: List[int]):
+        if keep and self.matrix is not None:
+            self._buffer = np.asarray(self.matrix[keep], dtype=self.dtype)
+            self.matrix = self._buffer
+        else:
+            self._buffer = None
+            self.matrix = None
+        if self.ann_index is not None:
+            self.ann_index.keep(keep)
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self._row_of = {id_: i for i, id_ in enumerate(self.ids)}
+
+    def add_embeddings(self,
+                       texts: List[str],
+                       embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None,
+                       save: bool = True) -> List[str]:
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+
+        new_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32)).astype(self.dtype, copy=False)
+        with self._lock:
+            # Re-adding an existing id replaces it
+            replaced = {id_ for id_ in ids if id_ in self._row_of}
+            if replaced:
+                self._keep_rows([i for i, id_ in enumerate(self.ids) if id_ not in replaced])
+
+            start = len(self.ids)
+            self._append_rows(new_vectors)
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(dict(m) for m in metadatas)
+            self._row_of.update((id_, start + i) for i, id_ in enumerate(ids))
+            if self.ann_index is not None:
+                self.ann_index.add(new_vectors)
+            self._dirty = True
+            self._version += 1
+
+        if save:
+            self.save()
+        return list(ids)
+
+    def add_texts(self,
+                  texts: Iterable[str],
+                  metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas, ids)
+
+    async def aadd_texts(self,
+                         texts: Iterable[str],
+                         metadatas: Optional[List[dict]] = None,
+                         ids: Optional[List[str]] = None,
+                         **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        embeddings = await self._embedding.aembed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, save: bool = True, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            drop = {id_ for id_ in ids if id_ in self._row_of}
+            if not drop:
+                return False
+            self._keep_rows([i for i, id_ in enumerate(self.ids) if id_ not in drop])
+            self._dirty = True
+            self._version += 1
+        if save:
+            self.save()
+        return True
+
+    def _top_k(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.matrix @ query.astype(self.matrix.dtype, copy=False)
+        k = min(k, scores.shape[0])
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top].astype(np.float32)
+
+    def similarity_search_by_vector_with_score(self,
+                                               embedding: List[float],
+                                               k: int = 4,
+                                               nprobe: Optional[int] = None,
+                                               exact: bool = False,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Top-k by cosine similarity. ``nprobe`` overrides the ANN index's default
+        per query; ``exact=True`` bypasses the index."""
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            if self.matrix is None or not self.ids:
+                return []
+            if self.ann_index is not None and self.ann_index.is_trained and not exact:
+                top, scores = self.ann_index.search(self.matrix, query, k, nprobe=nprobe)
+            else:
+                top, scores = self._top_k(query, k)
+            return [
+                (Document(page_content=self.texts[i], metadata={**self.metadatas[i], "id": self.ids[i]}),
+                 float(score))
+                for i, score in zip(top, scores)
+            ]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        # An in-process matrix product; no need for the base class's thread executor
+        return self.similarity_search_by_vector(embedding, k, **kwargs)
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Stored chunks by id, with their metadata; ids not in the store are left out."""
+        with self._lock:
+            rows = [(id_, self._row_of[id_]) for id_ in ids if id_ in self._row_of]
+            return {
+                id_: Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]))
+                for id_, row in rows
+            }
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored unit-normalised vectors by id; ids not in the store are left out."""
+        with self._lock:
+            rows = [(id_, self._row_of[id_]) for id_ in ids if id_ in self._row_of]
+            if not rows or self.matrix is None:
+                return {}
+            block = np.asarray(self.matrix[[row for _, row in rows]], dtype=np.float32)
+        return {id_: block[j] for j, (id_, _) in enumerate(rows)}
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k, **kwargs)
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls,
+                   texts: List[str],
+                   embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None,
+                   directory: str = "data/local-index",
+                   **kwargs: Any) -> "LocalVectorStore":
+        store = cls(directory=directory, embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def __bool__(self) -> bool:
+        # An emptied store is still a loaded store; callers test ``if not manager.vector_store``
+        return True
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class LocalVectorStoreManager:
+    """Same interface as PineconeManager, backed by LocalVectorStore."""
+
+    def __init__(self,
+                 base_dir: str = "data/vector_store",
+                 dtype: str = "float32",
+                 ann: str = "ivf",
+                 ann_nprobe: int = 8,
+                 ann_train_threshold: int = 1024):
+        self.base_dir = base_dir
+        self.dtype = dtype
+        self.ann = ann
+        self.ann_nprobe = ann_nprobe
+        self.ann_train_threshold = ann_train_threshold
+        self.index_name = None
+        self.vector_store = None
+
+    def _index_dir(self, index_name: str) -> str:
+        return os.path.join(self.base_dir, index_name)
+
+    def index_exists(self, index_name: str) -> bool:
+        return LocalVectorStore.current_dir(self._index_dir(index_name)) is not None
+
+    def _create_ann_index(self) -> Optional[IVFIndex]:
+        if self.ann == "ivf":
+            return IVFIndex(nprobe=self.ann_nprobe, train_threshold=self.ann_train_threshold)
+        if self.ann in ("", "none", "exact"):
+            return None
+        raise ValueError(f"Unknown ANN index '{self.ann}'. Use 'ivf' or 'none'.")
+
+    def load_vectorstore(self, index_name: str, embedding_model) -> LocalVectorStore:
+        self.index_name = index_name
+        self.vector_store = LocalVectorStore(
+            self._index_dir(index_name),
+            embedding_model,
+            dtype=self.dtype,
+            ann_index=self._create_ann_index()
+        )
+        return self.vector_store
+
+    async def ensure_index(self, index_name: str, embedding_model, dimension: int = 1536) -> LocalVectorStore:
+        if self.vector_store is None or self.index_name != index_name:
+            self.load_vectorstore(index_name, embedding_model)
+        return self.vector_store
+
+    async def upsert_embeddings(self,
+                                documents: List[Document],
+                                embeddings: List[List[float]],
+                                ids: Optional[List[str]] = None,
+                                flush: bool = True):
+        """With ``flush=False`` the rows are only added in memory until ``flush()``."""
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        await asyncio.to_thread(self.vector_store.add_embeddings, texts, embeddings, metadatas, ids, flush)
+
+    async def create_vectorstore(self,
+                                 documents: List[Document],
+                                 embedding_model,
+                                 index_name: str,
+                                 dimension: int = 1536,
+                                 ids: Optional[List[str]] = None) -> LocalVectorStore:
+        await self.ensure_index(index_name, embedding_model, dimension)
+
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        await self.vector_store.aadd_texts(texts, metadatas, ids)
+        return self.vector_store
+
+    def delete(self, ids: List[str], flush: bool = True):
+        if ids and self.vector_store is not None:
+            self.vector_store.delete(ids, save=flush)
+
+    def flush(self):
+        """Write out adds and deletes made with ``flush=False``."""
+        if self.vector_store is not None:
+            self.vector_store.save()
+
+    def fetch_documents(self, ids: List[str]) -> Dict[str, Document]:
+        if not ids or self.vector_store is None:
+            return {}
+        return self.vector_store.get_documents(ids)
+
+    def fetch_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        if not ids or self.vector_store is None:
+            return {}
+        return self.vector_store.get_vectors(ids)
+
+    def lexical_index_path(self, index_name: str) -> str:
+        # Kept in the index directory so the two are moved and deleted together
+        return os.path.join(self._index_dir(index_name), "bm25.json")
+
+    def get_retriever(self):
+        if not self.vector_store:
+            raise ValueError("Vector store has not been initialized")
+        return self.vector_store.as_retriever()
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        if not self.vector_store:
+            raise ValueError("Vector store has not been initialized")
+        return self.vector_store.similarity_search(query, k=k, **kwargs)
+
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs):
+        if not self.vector_store:
+            raise ValueError("Vector store has not been initialized")
+        # An in-process matrix product; no need to leave the event loop
+        return self.vector_store.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def delete_index(self):
+        if self.index_name and os.path.exists(self._index_dir(self.index_name)):
+            shutil.rmtree(self._index_dir(self.index_name))
+        self.vector_store = None
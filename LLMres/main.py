@@ -2,8 +2,10 @@ import os
 import asyncio
 import uuid
 from dotenv import load_dotenv
-from embed import EmbeddingsService, CustomAzureOpenAIEmbeddings
+from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
 from retrieval_system import RetrievalSystem
+from startup import startup_timer
+startup_timer.mark("imports")
 
 async def run_chat_session(system: RetrievalSystem, thread_id: str):
     """Run an interactive chat session."""
@@ -25,7 +27,7 @@ async def run_chat_session(system: RetrievalSystem, thread_id: str):
                 search_query = user_input[7:].strip()
                 print("\nPerforming similarity search...")
                 try:
-                    results = system.similarity_search(search_query, k=2)
+                    results = await system.asimilarity_search(search_query, k=2)
                     if results:
                         for i, doc in enumerate(results, 1):
                             print(f"\nResult {i}:")
@@ -41,7 +43,10 @@ async def run_chat_session(system: RetrievalSystem, thread_id: str):
                     continue
                     
                 try:
-                    await system.chat(thread_id, user_input)
+                    print("\nAssistant: ", end="", flush=True)
+                    async for token in system.chat_stream(thread_id, user_input):
+                        print(token, end="", flush=True)
+                    print("\n")
                 except Exception as e:
                     print(f"Error in chat processing: {str(e)}")
                     print("Please try again with a different question.")
@@ -72,21 +77,26 @@ async def main():
     
     try:
         # Initialize embedding service
-        embedding_service = EmbeddingsService()
-        custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
+        with startup_timer.phase("embedding service"):
+            embedding_service = CachedEmbeddingsService(EmbeddingsService())
+            custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
         
         # Initialize the system
-        system = RetrievalSystem(
-            embedding_model=custom_embeddings,
-            pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-            pinecone_environment=os.getenv("PINECONE_ENVIRONMENT"),
-            index_name="chris-data"
-        )
+        with startup_timer.phase("retrieval system"):
+            system = RetrievalSystem(
+                embedding_model=custom_embeddings,
+                pinecone_api_key=os.getenv("PINECONE_API_KEY"),
+                pinecone_environment=os.getenv("PINECONE_ENVIRONMENT"),
+                index_name="chris-data"
+            )
         
         # Initialize the chat system with existing embeddings
         await system.initialize_chat_system()
         
         print("Chat system ready!")
+        if os.getenv("STARTUP_REPORT", "false").lower() == "true":
+            for name, seconds in startup_timer.report()["phases"].items():
+                print(f"  {name:<24} {seconds * 1000:8.1f} ms")
         
         # Start chat session
         thread_id = str(uuid.uuid4())
@@ -0,0 +1,314 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (seconds), cheap enough for hot paths."""
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for i, bucket_count in enumerate(self.counts):
+                if seen + bucket_count >= rank and bucket_count:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                    return lower + (upper - lower) * (rank - seen) / bucket_count
+                seen += bucket_count
+            return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations <= bound) per bucket, ending with +Inf."""
+        with self._lock:
+            total = 0
+            rows = []
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], self.counts):
+                total += bucket_count
+                rows.append((bound, total))
+            return rows
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+
+def _labels_text(labels: Sequence[Sequence[str]]) -> str:
+    parts = [f'{key}="{str(value)}"' for key, value in labels]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Named, labelled metrics rendered in the Prometheus text format.
+
+    Histograms and counters are created on first use and shared by name and
+    labels. Components that already keep a ``stats()`` dict register it with
+    ``register_stats``; its numeric leaves are exported as gauges at scrape
+    time, so nothing is counted twice.
+    """
+
+    def __init__(self, namespace: str = "chatbot"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def _series(self, kind: str, name: str, help_text: str, labels: Dict[str, Any], factory):
+        full_name = f"{self.namespace}_{name}"
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            metric = self._metrics.setdefault(full_name, {"type": kind, "help": help_text, "series": {}})
+            if key not in metric["series"]:
+                metric["series"][key] = factory()
+            return metric["series"][key]
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._series("histogram", name, help_text, labels, Histogram)
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._series("counter", name, help_text, labels, Counter)
+
+    def register_stats(self, prefix: str, collect: Callable[[], Optional[Dict[str, Any]]]):
+        """Export ``collect()``'s numbers as ``<namespace>_<prefix>_<key>`` gauges (replaces any earlier one)."""
+        with self._lock:
+            self._stats[prefix] = collect
+
+    @staticmethod
+    def _flatten(prefix: str, value: Any, out: List[Tuple[str, float]]):
+        if isinstance(value, bool):
+            out.append((prefix, float(value)))
+        elif isinstance(value, (int, float)):
+            out.append((prefix, float(value)))
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                MetricsRegistry._flatten(f"{prefix}_{key}", item, out)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """Every metric family as {"name", "type", "help", "samples": [[name, [[label, value], ...], value]]}."""
+        families = []
+        with self._lock:
+            metrics = {name: (metric["type"], metric["help"], dict(metric["series"]))
+                       for name, metric in self._metrics.items()}
+            stats = dict(self._stats)
+        for name, (kind, help_text, series) in sorted(metrics.items()):
+            samples = []
+            for labels, item in sorted(series.items()):
+                labels = [list(pair) for pair in labels]
+                if kind == "histogram":
+                    for bound, count in item.cumulative():
+                        samples.append([f"{name}_bucket", labels + [["le", _format_value(bound)]], str(count)])
+                    samples.append([f"{name}_sum", labels, _format_value(item.sum)])
+                    samples.append([f"{name}_count", labels, str(item.count)])
+                else:
+                    samples.append([f"{name}_total", labels, _format_value(item.value)])
+            families.append({"name": name, "type": kind, "help": help_text, "samples": samples})
+        for prefix, collect in sorted(stats.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Could not collect {prefix} stats: {str(e)}")
+                continue
+            flat: List[Tuple[str, float]] = []
+            self._flatten(prefix, values or {}, flat)
+            for key, value in flat:
+                name = f"{self.namespace}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+                families.append({"name": name, "type": "gauge", "help": None,
+                                 "samples": [[name, [], _format_value(value)]]})
+        return families
+
+    @staticmethod
+    def render_families(families: List[Dict[str, Any]]) -> str:
+        lines = []
+        for family in families:
+            if family["help"] is not None:
+                lines.append(f"# HELP {family['name']} {family['help']}")
+            lines.append(f"# TYPE {family['name']} {family['type']}")
+            for sample_name, labels, value in family["samples"]:
+                lines.append(f"{sample_name}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def render(self) -> str:
+        return self.render_families(self.collect())
+
+
+# Process-wide registry; import this module by its bare name so every caller shares it
+registry = MetricsRegistry()
+
+
+class SharedMetrics:
+    """Lets any worker process serve the metrics of all of them.
+
+    A scrape reaches a single uvicorn worker. Each worker writes its samples to
+    ``<directory>/<pid>.json`` every ``interval`` seconds, and again whenever it
+    serves a scrape; ``render`` merges the files of workers that are still
+    running and labels every series with ``worker="<pid>"``.
+    """
+
+    def __init__(self,
+                 metrics: MetricsRegistry,
+                 directory: Optional[str] = None,
+                 interval: Optional[float] = None):
+        self.metrics = metrics
+        self.directory = directory or os.getenv("METRICS_DIR", "data/metrics")
+        self.interval = interval or float(os.getenv("METRICS_SHARE_INTERVAL_SECONDS", "5"))
+        self.worker = str(os.getpid())
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.worker}.json")
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.metrics.collect(), f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def render(self) -> str:
+        self.write()
+        merged: Dict[str, Dict[str, Any]] = {}
+        for name in sorted(os.listdir(self.directory)):
+            worker, ext = os.path.splitext(name)
+            if ext != ".json" or not worker.isdigit():
+                continue
+            path = os.path.join(self.directory, name)
+            if not self._alive(int(worker)):
+                # Left behind by a worker that exited or was restarted
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for family in families:
+                target = merged.setdefault(family["name"], {**family, "samples": []})
+                target["samples"].extend(
+                    [sample_name, [["worker", worker]] + labels, value]
+                    for sample_name, labels, value in family["samples"]
+                )
+        return MetricsRegistry.render_families(list(merged.values()))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.write)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Could not share worker metrics: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+trace_id_var: contextvars.ContextVar = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id(trace_id: Optional[str] = None) -> str:
+    """Start a trace for the current task (or its children) and return its ID."""
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds ``%(trace_id)s`` to every record passing through a handler."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+def install_trace_logging(fmt: str = "%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"):
+    """Put the trace ID into every log line written by the root logger's handlers."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter(fmt))
+
+
+@contextmanager
+def timed(stage: str):
+    """Record how long a chat-turn stage took in ``chatbot_stage_seconds{stage=...}``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.histogram("stage_seconds", "Time spent per chat-turn stage", stage=stage).observe(elapsed)
+        logging.getLogger(__name__).debug(f"{stage} took {elapsed * 1000:.1f} ms")
@@ -0,0 +1,101 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import pypdf
+except ImportError:  # pypdf is optional; without it every page goes to Document Intelligence
+    pypdf = None
+
+POINTS_PER_INCH = 72.0
+
+
+class PdfPage:
+    """One page of a PDF: its text layer (if any) and a standalone single-page PDF for OCR."""
+
+    def __init__(self, page_number: int, text: str, width: float, height: float, data: bytes):
+        self.page_number = page_number
+        self.text = text
+        self.width = width
+        self.height = height
+        self.data = data
+
+    @property
+    def page_hash(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    def has_text(self, min_chars: int) -> bool:
+        return len("".join(self.text.split())) >= min_chars
+
+    def metadata(self, source: str) -> Dict:
+        # Same keys and units as the Document Intelligence path
+        return {
+            "source": source,
+            "page_number": self.page_number,
+            "width": self.width,
+            "height": self.height,
+            "unit": "inch"
+        }
+
+
+def read_pdf_pages(data: bytes) -> List[PdfPage]:
+    """Extract each page's embedded text layer with pypdf."""
+    if pypdf is None:
+        raise ImportError("pypdf is not installed")
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    pages = []
+    for number, page in enumerate(reader.pages, 1):
+        writer = pypdf.PdfWriter()
+        writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        pages.append(PdfPage(
+            page_number=number,
+            text=page.extract_text() or "",
+            width=round(float(page.mediabox.width) / POINTS_PER_INCH, 4),
+            height=round(float(page.mediabox.height) / POINTS_PER_INCH, 4),
+            data=buffer.getvalue()
+        ))
+    return pages
+
+
+class OCRPageCache:
+    """OCR text per page, keyed by the hash of the single-page PDF, so a page is only OCR'd once."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("OCR_CACHE_PATH", "data/ocr_cache.sqlite3")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (page_hash TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, page_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM pages WHERE page_hash = ?", (page_hash,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, page_hash: str, text: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (page_hash, text, created) VALUES (?, ?, ?)",
+                (page_hash, text, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
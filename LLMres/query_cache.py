@@ -0,0 +1,88 @@
+import os
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from answer_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+
+def load_common_queries(path: Optional[str] = None) -> List[str]:
+    """Read one query per line from ``PRECOMPUTE_QUERIES_FILE``, skipping blanks and # comments."""
+    path = path or os.getenv("PRECOMPUTE_QUERIES_FILE")
+    if not path:
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    except FileNotFoundError:
+        logger.warning(f"Common queries file not found: {path}")
+        return []
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of query embeddings keyed on normalised query text.
+
+    "Skills?" and "skills" share one entry, so a repeated search never waits
+    on the embeddings endpoint. The normalised text is only the cache key;
+    what gets embedded is the query as the user wrote it (the first spelling
+    seen for a key). ``precompute`` embeds a list of common queries in one
+    batched request at startup.
+    """
+
+    def __init__(self, embedding_model, max_entries: Optional[int] = None):
+        self.embedding_model = embedding_model
+        self.max_entries = max_entries or int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.precomputed = 0
+
+    def _remember(self, key: str, vector: List[float]):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = normalize_question(query)
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+        return vector
+
+    async def aembed_query(self, query: str) -> List[float]:
+        key = normalize_question(query)
+        vector = self.get(query)
+        if vector is not None:
+            self.hits += 1
+            return vector
+        self.misses += 1
+        vector = await self.embedding_model.aembed_query(query)
+        self._remember(key, vector)
+        return vector
+
+    async def precompute(self, queries: List[str]) -> int:
+        originals: Dict[str, str] = {}
+        for query in queries:
+            key = normalize_question(query)
+            if key and key not in self._entries:
+                originals.setdefault(key, query)
+        if not originals:
+            return 0
+        vectors = await self.embedding_model.aembed_documents(list(originals.values()))
+        for key, vector in zip(originals, vectors):
+            self._remember(key, vector)
+        self.precomputed += len(originals)
+        return len(originals)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "precomputed": self.precomputed,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from hybrid_retriever import HybridRetriever
+from metrics import timed
+from tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def mmr_order(query: np.ndarray, candidates: np.ndarray, lambda_mult: float) -> List[int]:
+    """Order all candidates by maximal marginal relevance.
+
+    Each step picks the row maximising
+    ``lambda * sim(query) - (1 - lambda) * max sim(already picked)``.
+    """
+    n = candidates.shape[0]
+    if n == 0:
+        return []
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    order = []
+    for _ in range(n):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return order
+
+
+def text_overlap(before: str, after: str, min_chars: int) -> int:
+    """Length of the longest suffix of ``before`` that is also a prefix of ``after``."""
+    probe = after[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    position = before.find(probe)
+    while position != -1:
+        length = len(before) - position
+        if after[:length] == before[position:]:
+            return length
+        position = before.find(probe, position + 1)
+    return 0
+
+
+class ContextSelector:
+    """Picks the chunks that go to the agent from an over-fetched candidate list.
+
+    Candidates are ordered by MMR over their embeddings, so near-duplicates
+    sink. Walking that order, a chunk is dropped when its text is already
+    inside a kept chunk from the same source, and the overlap the splitter
+    repeats between neighbouring chunks is cut off. Chunks are kept until
+    ``k`` are chosen or the token budget is used up. Candidate vectors are
+    read from the vector store by chunk ID through ``vector_lookup``; only
+    chunks it doesn't return are embedded, and the query vector is taken from
+    the base retriever when it has one.
+    """
+
+    def __init__(self,
+                 embedding_model,
+                 k: Optional[int] = None,
+                 lambda_mult: Optional[float] = None,
+                 token_budget: Optional[int] = None,
+                 min_overlap_chars: int = 20,
+                 vector_lookup: Optional[Callable[[List[str]], Dict[str, Any]]] = None):
+        self.embedding_model = embedding_model
+        self.vector_lookup = vector_lookup
+        self.k = k or int(os.getenv("RETRIEVER_K", "4"))
+        self.lambda_mult = lambda_mult if lambda_mult is not None else float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+        self.min_overlap_chars = min_overlap_chars
+        self.counters = {"queries": 0, "candidates": 0, "candidates_embedded": 0, "selected": 0,
+                         "duplicates_dropped": 0, "overlap_chars_trimmed": 0, "baseline_tokens": 0,
+                         "selected_tokens": 0}
+        self.last: Dict[str, Any] = {}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @staticmethod
+    def _same_span_group(a: Document, b: Document) -> bool:
+        return (a.metadata.get("source") == b.metadata.get("source")
+                and a.metadata.get("page_number") == b.metadata.get("page_number"))
+
+    def _dedupe(self, doc: Document, kept: List[Document]) -> Tuple[Optional[Document], int]:
+        """Return the part of ``doc`` not already covered by ``kept`` and how many characters were cut."""
+        text = doc.page_content
+        trimmed = 0
+        for other in kept:
+            if not self._same_span_group(doc, other):
+                continue
+            if text in other.page_content:
+                return None, len(doc.page_content)
+            head = text_overlap(other.page_content, text, self.min_overlap_chars)
+            if head:
+                text = text[head:].lstrip()
+                trimmed += head
+            tail = text_overlap(text, other.page_content, self.min_overlap_chars)
+            if tail:
+                text = text[:-tail].rstrip()
+                trimmed += tail
+        if len(text) < self.min_overlap_chars:
+            return None, len(doc.page_content)
+        if not trimmed:
+            return doc, 0
+        return Document(page_content=text, metadata={**doc.metadata, "trimmed_chars": trimmed}), trimmed
+
+    def _select(self, candidates: List[Document], order: List[int]) -> List[Document]:
+        kept: List[Document] = []
+        used_tokens = 0
+        dropped = 0
+        trimmed_chars = 0
+        for i in order:
+            if len(kept) >= self.k:
+                break
+            doc, cut = self._dedupe(candidates[i], kept)
+            if doc is None:
+                dropped += 1
+                continue
+            tokens = count_tokens(doc.page_content)
+            if kept and used_tokens + tokens > self.token_budget:
+                # Something smaller further down may still fit
+                continue
+            kept.append(doc)
+            used_tokens += tokens
+            trimmed_chars += cut
+
+        baseline = sum(count_tokens(doc.page_content) for doc in candidates[:self.k])
+        self.counters["queries"] += 1
+        self.counters["candidates"] += len(candidates)
+        self.counters["selected"] += len(kept)
+        self.counters["duplicates_dropped"] += dropped
+        self.counters["overlap_chars_trimmed"] += trimmed_chars
+        self.counters["baseline_tokens"] += baseline
+        self.counters["selected_tokens"] += used_tokens
+        self.last = {"candidates": len(candidates), "selected": len(kept), "baseline_tokens": baseline,
+                     "selected_tokens": used_tokens, "tokens_saved": baseline - used_tokens}
+        logger.info(f"Context selection: {len(candidates)} candidates -> {len(kept)} chunks, "
+                    f"{used_tokens} tokens (top-{self.k} would be {baseline}, saved {baseline - used_tokens})")
+        return kept
+
+    def _order(self, query_vector: List[float], candidate_vectors: List[List[float]]) -> List[int]:
+        query = self._normalize(np.asarray(query_vector, dtype=np.float32))
+        candidates = self._normalize(np.asarray(candidate_vectors, dtype=np.float32))
+        return mmr_order(query, candidates, self.lambda_mult)
+
+    def _stored_vectors(self, candidates: List[Document]) -> List[Optional[Any]]:
+        ids = [doc.metadata.get("id") or doc.id for doc in candidates]
+        found: Dict[str, Any] = {}
+        if self.vector_lookup is not None:
+            try:
+                found = self.vector_lookup([id_ for id_ in ids if id_])
+            except Exception as e:
+                logger.warning(f"Could not read stored vectors, embedding candidates instead: {str(e)}")
+        return [found.get(id_) if id_ else None for id_ in ids]
+
+    def select(self, query: str, candidates: List[Document],
+               query_vector: Optional[List[float]] = None) -> List[Document]:
+        if not candidates:
+            return []
+        if query_vector is None:
+            query_vector = self.embedding_model.embed_query(query)
+        vectors = self._stored_vectors(candidates)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = self.embedding_model.embed_documents([candidates[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        self.counters["candidates_embedded"] += len(missing)
+        return self._select(candidates, self._order(query_vector, vectors))
+
+    async def aselect(self, query: str, candidates: List[Document],
+                      query_vector: Optional[List[float]] = None) -> List[Document]:
+        if not candidates:
+            return []
+        if query_vector is None:
+            query_vector = await self.embedding_model.aembed_query(query)
+        # A local lookup is a row gather; Pinecone's is a network call
+        vectors = await asyncio.to_thread(self._stored_vectors, candidates)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            embedded = await self.embedding_model.aembed_documents([candidates[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        self.counters["candidates_embedded"] += len(missing)
+        return self._select(candidates, self._order(query_vector, vectors))
+
+    def stats(self) -> Dict[str, Any]:
+        queries = self.counters["queries"]
+        saved = self.counters["baseline_tokens"] - self.counters["selected_tokens"]
+        return {
+            **self.counters,
+            "tokens_saved": saved,
+            "avg_tokens_saved": saved / queries if queries else 0.0,
+            "last": self.last,
+        }
+
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetches from ``base_retriever`` and hands the candidates to a ContextSelector."""
+
+    base_retriever: BaseRetriever
+    selector: ContextSelector
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_vector = None
+        if isinstance(self.base_retriever, HybridRetriever):
+            candidates, query_vector = self.base_retriever.search(query)
+        else:
+            candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        with timed("rerank"):
+            return self.selector.select(query, candidates, query_vector)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        query_vector = None
+        if isinstance(self.base_retriever, HybridRetriever):
+            candidates, query_vector = await self.base_retriever.asearch(query)
+        else:
+            candidates = await self.base_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        with timed("rerank"):
+            return await self.selector.aselect(query, candidates, query_vector)
@@ -2,17 +2,18 @@ import json
 import os
 import asyncio
 from typing import List, Dict, Any, Optional
-from langchain.tools.retriever import create_retriever_tool
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import create_react_agent
 from langchain_core.documents import Document
-from langchain_pinecone import PineconeVectorStore
-from pinecone import Pinecone, ServerlessSpec
 
-from config import AzureOpenAIConfig
-from document_processor import DocumentProcessor
-from vector_store import PineconeManager
+from config import AzureOpenAIConfig, VectorStoreConfig, ConversationStoreConfig, RetrieverConfig
+from bm25 import BM25Index
 from conversation import ConversationalAgent
+from answer_cache import AnswerCache, bump_index_version, normalize_question
+from query_cache import QueryEmbeddingCache, load_common_queries
+from ingest_pipeline import IngestPipeline
+from intent import ClearIntentDetector
+from startup import startup_timer
+from metrics import timed
+from singleflight import SingleFlight
 
 class RetrievalSystem:
     
@@ -22,19 +23,38 @@ class RetrievalSystem:
                  pinecone_environment: str,
                  index_name: str):
         self.embedding_model = embedding_model
-        self.doc_processor = DocumentProcessor()
-        self.pinecone_manager = PineconeManager(
-            api_key=pinecone_api_key,
-            environment=pinecone_environment
+        self._doc_processor = None
+        self.vector_config = VectorStoreConfig()
+        self.vector_manager = self.vector_config.create_manager(
+            pinecone_api_key=pinecone_api_key,
+            pinecone_environment=pinecone_environment
         )
         self.index_name = index_name
+        self.retriever_config = RetrieverConfig()
+        # Kept up to date on every ingest, whichever retriever mode is in use
+        self.lexical_index = BM25Index(self.vector_manager.lexical_index_path(index_name))
+        # Candidates are reranked with the vectors already in the store, not re-embedded
+        self.context_selector = self.retriever_config.create_selector(embedding_model, self.vector_manager.fetch_vectors)
+        self.query_cache = QueryEmbeddingCache(embedding_model)
         self.azure_config = AzureOpenAIConfig()
-        self.memory = MemorySaver()
+        self.conversation_config = ConversationStoreConfig()
+        self.conversation_store = self.conversation_config.create_store()
+        self.answer_cache = (AnswerCache(embedding_model)
+                             if os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true" else None)
+        # A repeated question on an unchanged thread (double taps, retries) is answered by one agent run
+        self.chat_flight = SingleFlight("chat", linger=float(os.getenv("SINGLEFLIGHT_LINGER_SECONDS", "5")))
         self.agent = None
         self.conv_agent = None
         self.metadata_file = "embedding_metadata.json"
         self.processed_files = self._load_metadata()
-        self.pc = Pinecone(api_key=pinecone_api_key)
+
+    @property
+    def doc_processor(self):
+        # Only ingestion needs it (and the PDF/Azure SDKs behind it); chat never does
+        if self._doc_processor is None:
+            from document_processor import DocumentProcessor
+            self._doc_processor = DocumentProcessor()
+        return self._doc_processor
 
     def _load_metadata(self) -> Dict[str, Dict]:
         if os.path.exists(self.metadata_file):
@@ -49,19 +69,21 @@ class RetrievalSystem:
         with open(self.metadata_file, 'w') as f:
             json.dump(self.processed_files, f, indent=2)
 
-    def _update_file_metadata(self, file_path: str):
+    def _update_file_metadata(self, file_path: str, save: bool = True):
         if os.path.exists(file_path):
             stat = os.stat(file_path)
             self.processed_files[file_path] = {
+                **self.processed_files.get(file_path, {}),
                 "last_modified": stat.st_mtime,
                 "size": stat.st_size
             }
-            self._save_metadata()
+            if save:
+                self._save_metadata()
 
     def _check_file_changed(self, file_path: str) -> bool:
         if not os.path.exists(file_path):
             if file_path in self.processed_files:
-                del self.processed_files[file_path]
+                self._forget_source(file_path)
                 self._save_metadata()
                 return False
             return False
@@ -79,19 +101,23 @@ class RetrievalSystem:
 
     async def initialize_chat_system(self):
         try:
-            if self.index_name not in self.pc.list_indexes().names():
+            if not self.vector_manager.index_exists(self.index_name):
                 raise ValueError(f"Index '{self.index_name}' not found. Please run generate_embeddings.py first.")
 
-            print("Found existing Pinecone index.")
+            print(f"Found existing {self.vector_config.backend} index.")
             
-            self.pinecone_manager.vector_store = PineconeVectorStore(
-                index_name=self.index_name,
-                embedding=self.embedding_model
-            )
+            with startup_timer.phase("load vector store"):
+                self.vector_manager.load_vectorstore(self.index_name, self.embedding_model)
             
-            retriever = self.pinecone_manager.get_retriever()
+            with startup_timer.phase("build retriever"):
+                retriever = self._create_retriever()
+            with startup_timer.phase("precompute queries"):
+                await self.precompute_queries()
             
-            llm = self.azure_config.create_llm()
+            with startup_timer.phase("import chat SDKs"):
+                from langchain.tools.retriever import create_retriever_tool
+                from langgraph.prebuilt import create_react_agent
+                llm = self.azure_config.create_llm()
             
             tool = create_retriever_tool(
                 retriever,
@@ -109,14 +135,18 @@ class RetrievalSystem:
             """
             )
             
-            self.agent = create_react_agent(
-                llm,
-                [tool],
-                checkpointer=self.memory,
+            # No checkpointer: history comes from the conversation store, once, each turn
+            with startup_timer.phase("build agent"):
+                self.agent = create_react_agent(
+                    llm,
+                    [tool],
+                )
                 
-            )
-            
-            self.conv_agent = ConversationalAgent(self.agent)
+                self.conv_agent = ConversationalAgent(
+                    self.agent,
+                    intent_detector=ClearIntentDetector(embedding_model=self.embedding_model),
+                    conversation_store=self.conversation_store
+                )
             
             print("Successfully initialized chat system with existing embeddings.")
             return self.conv_agent
@@ -130,23 +160,19 @@ class RetrievalSystem:
         await self._setup_system(documents)
 
     async def setup_from_files(self, file_paths: List[str]):
-        all_documents = []
-        new_files = False
+        changed_files = []
 
         for file_path in file_paths:
             if self._check_file_changed(file_path):
                 print(f"Processing new/modified file: {file_path}")
-                documents = self.doc_processor.load_text_files([file_path])
-                all_documents.extend(documents)
-                self._update_file_metadata(file_path)
-                new_files = True
+                changed_files.append(file_path)
             else:
                 print(f"Skipping unchanged file: {file_path}")
 
-        if new_files:
-            await self._setup_system(all_documents, use_char_splitter=True)
-        else:
-            await self._initialize_existing_system()
+        if changed_files:
+            # Streams each file through split/embed/upsert without loading it whole
+            await IngestPipeline(self).run(changed_files)
+        await self._initialize_existing_system()
 
     async def setup_from_pdf_file(self, file_path: str):
         if self._check_file_changed(file_path):
@@ -161,8 +187,12 @@ class RetrievalSystem:
 
     async def _initialize_existing_system(self):
         try:
-            retriever = self.pinecone_manager.get_retriever()
+            if not self.vector_manager.vector_store:
+                self.vector_manager.load_vectorstore(self.index_name, self.embedding_model)
+            retriever = self._create_retriever()
             
+            from langchain.tools.retriever import create_retriever_tool
+            from langgraph.prebuilt import create_react_agent
             llm = self.azure_config.create_llm()
             
             tool = create_retriever_tool(
@@ -174,10 +204,13 @@ class RetrievalSystem:
             self.agent = create_react_agent(
                 llm,
                 [tool],
-                checkpointer=self.memory,
             )
             
-            self.conv_agent = ConversationalAgent(self.agent)
+            self.conv_agent = ConversationalAgent(
+                self.agent,
+                intent_detector=ClearIntentDetector(embedding_model=self.embedding_model),
+                conversation_store=self.conversation_store
+            )
             
             return self.conv_agent
         except Exception as e:
@@ -194,52 +227,233 @@ class RetrievalSystem:
         try:
             splits = self.doc_processor.split_documents(documents, use_char_splitter)
             
-            if not self.index_name in self.pc.list_indexes().names():
-                print(f"Creating new Pinecone index: {self.index_name}")
-                self.pc.create_index(
-                    name=self.index_name,
-                    dimension=1536,
-                    metric="cosine",
-                    spec=ServerlessSpec(
-                        cloud="aws",
-                        region="us-east-1"
-                    )
+            index_exists = self.vector_manager.index_exists(self.index_name)
+            if not index_exists:
+                print(f"Creating new {self.vector_config.backend} index: {self.index_name}")
+            elif not self.vector_manager.vector_store:
+                self.vector_manager.load_vectorstore(self.index_name, self.embedding_model)
+            
+            new_splits, new_ids, removed_ids, chunk_map = self._diff_chunks(splits, index_exists)
+            print(f"{len(new_splits)} new chunks to embed, {len(removed_ids)} stale chunks to delete, "
+                  f"{len(splits) - len(new_splits)} unchanged")
+            
+            if new_splits or not index_exists:
+                await self.vector_manager.create_vectorstore(
+                    documents=new_splits,
+                    embedding_model=self.embedding_model,
+                    index_name=self.index_name,
+                    ids=new_ids
                 )
-                await asyncio.sleep(10)
+                self.lexical_index.add(new_splits, new_ids)
+            if removed_ids:
+                await asyncio.to_thread(self.vector_manager.delete, removed_ids)
+                self.lexical_index.remove(removed_ids)
+            self._record_chunks(chunk_map)
             
-            await self.pinecone_manager.create_vectorstore(
-                documents=splits,
-                embedding_model=self.embedding_model,
-                index_name=self.index_name
-            )
+            if new_splits or removed_ids:
+                # Answers cached against the old index are no longer trustworthy
+                bump_index_version()
             
             await self._initialize_existing_system()
         except Exception as e:
             print(f"Error in system setup: {str(e)}")
             raise
 
-    async def chat(self, thread_id: str, message: str):
+    def _diff_chunks(self, splits: List[Document], index_exists: bool):
+        """Compare chunk IDs per source with the manifest.
+
+        Returns (chunks to embed, their IDs, IDs to delete from the vector
+        store, {source: chunk IDs} to record once the upsert has succeeded).
+        """
+        ids = self.doc_processor.chunk_ids(splits)
+        by_source: Dict[str, List[str]] = {}
+        for doc, chunk_id in zip(splits, ids):
+            by_source.setdefault(doc.metadata.get("source", ""), []).append(chunk_id)
+
+        known = set()
+        removed_ids = []
+        for source, source_ids in by_source.items():
+            old_ids = self.processed_files.get(source, {}).get("chunks", []) if index_exists else []
+            known.update(old_ids)
+            removed_ids.extend(sorted(set(old_ids) - set(source_ids)))
+
+        new_splits, new_ids = [], []
+        for doc, chunk_id in zip(splits, ids):
+            if chunk_id not in known:
+                new_splits.append(doc)
+                new_ids.append(chunk_id)
+        return new_splits, new_ids, removed_ids, by_source
+
+    def _record_chunks(self, chunk_map: Dict[str, List[str]], save: bool = True):
+        for source, chunk_ids in chunk_map.items():
+            self.processed_files.setdefault(source, {})["chunks"] = chunk_ids
+        if save:
+            self._save_metadata()
+            self.lexical_index.save()
+
+    def _create_retriever(self):
+        if not self.vector_manager.vector_store:
+            raise ValueError("Vector store has not been initialized")
+        if self.retriever_config.mode == "hybrid" and not len(self.lexical_index):
+            self._rebuild_lexical_index()
+        return self.retriever_config.create_retriever(
+            self.vector_manager.vector_store,
+            self.lexical_index,
+            self.context_selector
+        )
+
+    def _rebuild_lexical_index(self):
+        """Fill the BM25 index from the vector store for indexes built before it existed."""
+        chunk_ids = [chunk_id for entry in self.processed_files.values() for chunk_id in entry.get("chunks", [])]
+        if not chunk_ids:
+            print("No chunk IDs recorded; re-run generate_embeddings.py to build the BM25 index")
+            return
+        try:
+            documents = self.vector_manager.fetch_documents(chunk_ids)
+        except Exception as e:
+            print(f"Could not rebuild BM25 index, using vector search only: {str(e)}")
+            return
+        self.lexical_index.add(list(documents.values()), list(documents))
+        self.lexical_index.save()
+        print(f"Built BM25 index from {len(documents)} stored chunks")
+
+    async def thread_version(self, thread_id: str) -> str:
+        """Changes whenever the thread's history does; part of the single-flight key of a chat turn."""
+        conversation = await self.conversation_store.aget(thread_id)
+        # A thread created at the start of a turn has no history yet either
+        if conversation is None or not (conversation.messages or conversation.summary):
+            return "new"
+        last = conversation.messages[-1]["content"] if conversation.messages else ""
+        return f"{len(conversation.messages)}:{hash(last)}:{hash(conversation.summary)}"
+
+    async def chat(self, thread_id: str, message: str, state_version: Optional[str] = None):
+        """Answer ``message``; calls with the same thread, normalised text and thread version share one run.
+
+        Pass the ``thread_version`` seen when the message arrived so a duplicate
+        queued behind the original reuses its answer (for ``SINGLEFLIGHT_LINGER_SECONDS``).
+        """
         if not self.conv_agent:
             raise ValueError("System not initialized. Call setup first.")
+        key = (thread_id, normalize_question(message), state_version or await self.thread_version(thread_id))
+        return await self.chat_flight.do(key, lambda: self._chat(thread_id, message))
+
+    async def _chat(self, thread_id: str, message: str):
         print(f"\nYou: {message}")
+        cacheable = await self._is_first_turn(thread_id)
+        if cacheable:
+            cached = await self._cached_answer(thread_id, message)
+            if cached is not None:
+                return cached
         response = await self.conv_agent.stream_response(thread_id, message)
+        if cacheable:
+            await self._cache_answer(thread_id, message, response)
         return response
 
+    async def chat_stream(self, thread_id: str, message: str):
+        if not self.conv_agent:
+            raise ValueError("System not initialized. Call setup first.")
+        cacheable = await self._is_first_turn(thread_id)
+        if cacheable:
+            cached = await self._cached_answer(thread_id, message)
+            if cached is not None:
+                yield cached
+                return
+        parts = []
+        async for token in self.conv_agent.stream_tokens(thread_id, message):
+            parts.append(token)
+            yield token
+        if cacheable:
+            await self._cache_answer(thread_id, message, "".join(parts))
+
+    async def _is_first_turn(self, thread_id: str) -> bool:
+        # Only stateless questions are cached; follow-ups depend on the thread
+        if self.answer_cache is None:
+            return False
+        conversation = await self.conversation_store.aget(thread_id)
+        return conversation is None or not (conversation.messages or conversation.summary)
+
+    async def _cached_answer(self, thread_id: str, message: str) -> Optional[str]:
+        try:
+            answer = await self.answer_cache.lookup(message)
+        except Exception as e:
+            print(f"Answer cache lookup failed: {str(e)}")
+            return None
+        if answer is not None:
+            # Keep the thread's history complete so follow-up questions have context
+            await self.conversation_store.aadd_message(thread_id, "human", message)
+            await self.conversation_store.aadd_message(thread_id, "assistant", answer)
+        return answer
+
+    async def _cache_answer(self, thread_id: str, message: str, answer: str):
+        # A clear-memory reply leaves no history behind; only real answers are cached
+        conversation = await self.conversation_store.aget(thread_id)
+        if conversation is None or len(conversation.messages) != 2:
+            return
+        try:
+            await self.answer_cache.put(message, answer)
+        except Exception as e:
+            print(f"Answer cache store failed: {str(e)}")
+
     def get_conversation_history(self, thread_id: str) -> List[Dict[str, Any]]:
         if not self.conv_agent:
             raise ValueError("System not initialized. Call setup first.")
         return self.conv_agent.get_conversation(thread_id).messages
 
+    def memory_stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": self.conversation_store.stats(),
+            "answer_cache": self.answer_cache.stats() if self.answer_cache else None
+        }
+
+    def retrieval_stats(self) -> Dict[str, Any]:
+        return {
+            "context": self.context_selector.stats() if self.context_selector else None,
+            "query_cache": self.query_cache.stats(),
+            "chat_singleflight": self.chat_flight.stats()
+        }
+
     def similarity_search(self, query: str, k: int = 4):
-        return self.pinecone_manager.similarity_search(query, k=k)
+        return self.vector_manager.similarity_search(query, k=k)
+
+    async def asimilarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """Search without blocking the event loop; repeated queries reuse their cached embedding."""
+        if not self.vector_manager.vector_store:
+            self.vector_manager.load_vectorstore(self.index_name, self.embedding_model)
+        with timed("query_embedding"):
+            embedding = await self.query_cache.aembed_query(query)
+        with timed("vector_search"):
+            return await self.vector_manager.asimilarity_search_by_vector(embedding, k=k)
+
+    async def precompute_queries(self, queries: Optional[List[str]] = None):
+        queries = load_common_queries() if queries is None else queries
+        if not queries:
+            return
+        try:
+            count = await self.query_cache.precompute(queries)
+            print(f"Precomputed embeddings for {count} common queries")
+        except Exception as e:
+            print(f"Could not precompute query embeddings: {str(e)}")
+
+    def _forget_source(self, source: str):
+        """Drop a source from the manifest along with its chunks in the vector store."""
+        chunk_ids = self.processed_files.pop(source, {}).get("chunks", [])
+        if chunk_ids and self.vector_manager.index_exists(self.index_name):
+            if not self.vector_manager.vector_store:
+                self.vector_manager.load_vectorstore(self.index_name, self.embedding_model)
+            self.vector_manager.delete(chunk_ids)
+            self.lexical_index.remove(chunk_ids)
+            self.lexical_index.save()
+            print(f"Deleted {len(chunk_ids)} chunks of {source} from the index")
+            bump_index_version()
 
     def cleanup_removed_files(self):
         removed_files = []
-        for file_path in list(self.processed_files.keys()):
-            if not os.path.exists(file_path):
+        for file_path, entry in list(self.processed_files.items()):
+            # Web sources have no file on disk
+            if "last_modified" in entry and not os.path.exists(file_path):
                 print(f"File no longer exists: {file_path}")
                 removed_files.append(file_path)
-                del self.processed_files[file_path]
+                self._forget_source(file_path)
         
         if removed_files:
             print(f"Removed metadata for deleted files: {removed_files}")
@@ -0,0 +1,199 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from metrics import registry
+
+
+class SingleFlight:
+    """Collapses concurrent calls that share a key into one execution.
+
+    The first caller starts the work as its own task; callers with the same
+    key that arrive while it runs await that task instead of repeating it.
+    Cancelling one caller does not cancel the shared work. With ``linger``
+    the finished task is kept for that many seconds, so a duplicate that was
+    queued behind the original (as the dispatcher does for one user's
+    events) still gets its result rather than redoing it.
+    """
+
+    def __init__(self, name: str, linger: float = 0.0):
+        self.name = name
+        self.linger = linger
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self._finished: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.executed = 0
+        self.shared = 0
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._finished:
+            key, (finished_at, _) = next(iter(self._finished.items()))
+            if now - finished_at < self.linger:
+                break
+            del self._finished[key]
+
+    def _count(self, outcome: str):
+        registry.counter("singleflight_calls", "Calls run or served from a shared in-flight call",
+                         flight=self.name, outcome=outcome).inc()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._expire()
+        task = self._flights.get(key)
+        if task is None and key in self._finished:
+            task = self._finished[key][1]
+        if task is not None:
+            self.shared += 1
+            self._count("shared")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._flights[key] = task
+        self.executed += 1
+        self._count("executed")
+
+        def done(finished: asyncio.Task):
+            self._flights.pop(key, None)
+            # Failures are never replayed to later callers
+            if self.linger and not finished.cancelled() and finished.exception() is None:
+                self._finished[key] = (time.monotonic(), finished)
+            elif not finished.cancelled():
+                finished.exception()  # retrieved, so an unawaited failure is not logged twice
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.executed + self.shared
+        return {
+            "in_flight": len(self._flights),
+            "executed": self.executed,
+            "shared": self.shared,
+            "shared_ratio": self.shared / calls if calls else 0.0,
+        }
+
+
+class RecentKeys:
+    """Bounded set of recently seen keys, e.g. webhook event IDs, with a TTL.
+
+    Only one process sees these keys; workers sharing a database use
+    ``SQLiteRecentKeys`` instead.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds or float(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "600"))
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._seen:
+            oldest, added = next(iter(self._seen.items()))
+            if now - added < self.ttl_seconds and len(self._seen) <= self.max_entries:
+                break
+            del self._seen[oldest]
+
+    def add(self, key: Hashable):
+        self._seen[key] = time.monotonic()
+        self._seen.move_to_end(key)
+        self._expire()
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire()
+        return key in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def claim(self, keys: List[Hashable]) -> List[Hashable]:
+        """Add ``keys`` and return those that were not already present."""
+        claimed = [key for key in dict.fromkeys(keys) if key not in self]
+        for key in claimed:
+            self.add(key)
+        return claimed
+
+    def release(self, keys: List[Hashable]):
+        """Forget keys claimed for work that was not accepted after all."""
+        for key in keys:
+            self._seen.pop(key, None)
+
+    async def aclaim(self, keys: List[Hashable]) -> List[Hashable]:
+        return self.claim(keys)
+
+    async def arelease(self, keys: List[Hashable]):
+        self.release(keys)
+
+
+class SQLiteRecentKeys:
+    """Recently seen keys in a SQLite table, shared by every worker process.
+
+    ``claim`` is an ``INSERT OR IGNORE``, so when two workers get the same key
+    at once exactly one of them claims it. Rows older than ``ttl_seconds`` are
+    deleted before each claim. The async methods run in a thread.
+    """
+
+    def __init__(self, path: str = "data/conversations.sqlite3", ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.ttl_seconds = ttl_seconds or float(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "600"))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS recent_keys (
+                key TEXT PRIMARY KEY,
+                added REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_recent_keys_added ON recent_keys (added);
+            """
+        )
+        self._conn.commit()
+
+    def claim(self, keys: List[str]) -> List[str]:
+        """Add ``keys`` and return those no worker had added within the TTL."""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            self._conn.execute("DELETE FROM recent_keys WHERE added < ?", (now - self.ttl_seconds,))
+            for key in dict.fromkeys(keys):
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO recent_keys (key, added) VALUES (?, ?)", (key, now)
+                )
+                if cursor.rowcount:
+                    claimed.append(key)
+            self._conn.commit()
+        return claimed
+
+    def release(self, keys: List[str]):
+        """Forget keys claimed for work that was not accepted after all."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM recent_keys WHERE key = ?", [(key,) for key in keys])
+            self._conn.commit()
+
+    async def aclaim(self, keys: List[str]) -> List[str]:
+        return await asyncio.to_thread(self.claim, keys)
+
+    async def arelease(self, keys: List[str]):
+        await asyncio.to_thread(self.release, keys)
+
+    def add(self, key: str):
+        self.claim([key])
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM recent_keys WHERE key = ? AND added >= ?", (key, time.time() - self.ttl_seconds)
+            ).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM recent_keys WHERE added >= ?", (time.time() - self.ttl_seconds,)
+            ).fetchone()[0]
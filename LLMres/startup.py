@@ -0,0 +1,64 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _process_age() -> float:
+    """Seconds since this process started (Linux), so interpreter start-up and
+    imports made before this module are counted too; 0.0 elsewhere."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Fields after the command name, which may itself contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(0.0, time.clock_gettime(time.CLOCK_BOOTTIME) - started)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+class StartupTimer:
+    """Wall time of each startup phase, in the order the phases ran.
+
+    Use ``with startup_timer.phase("name"):`` around a step, or ``mark("name")``
+    to charge everything since the previous phase ended (handy for imports at
+    the top of an entry point).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter() - _process_age()
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []
+
+    def _record(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+        self._last = time.perf_counter()
+
+    def mark(self, name: str):
+        self._record(name, time.perf_counter() - self._last)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(self._last - self.started, 4) if self.phases else 0.0,
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases},
+        }
+
+    def log(self):
+        total = self._last - self.started
+        lines = [f"  {name:<24} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        logger.info("Startup took %.1f ms:\n%s", total * 1000, "\n".join(lines))
+
+
+# One per process; entry points and RetrievalSystem record into it
+startup_timer = StartupTimer()
@@ -0,0 +1,90 @@
+from collections import deque
+from typing import Iterable, Iterator, Tuple
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+# Longer lines are passed on in pieces instead of being buffered whole
+MAX_LINE_CHARS = 1 << 20
+
+
+def iter_lines(file_path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[Tuple[str, int]]:
+    """Yield (line, character offset) from a UTF-8 file, reading ``block_size`` characters at a time.
+
+    Lines are split on "\\n" with any trailing "\\r" removed; offsets count
+    characters of the file as stored.
+    """
+    offset = 0
+    pending = ""
+    with open(file_path, "r", encoding="utf-8", newline="") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            pending += block
+            lines = pending.split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip("\r"), offset
+                offset += len(line) + 1
+            if len(pending) > MAX_LINE_CHARS:
+                # One enormous line; hand it on in pieces to keep memory bounded
+                yield pending, offset
+                offset += len(pending)
+                pending = ""
+    if pending:
+        yield pending.rstrip("\r"), offset
+
+
+class StreamingLineSplitter:
+    """Line-based splitter with the same packing as CharacterTextSplitter(separator="\\n").
+
+    Lines are merged greedily up to ``chunk_size`` characters and the trailing
+    lines of each chunk (up to ``chunk_overlap`` characters) start the next
+    one, so overlap carries across read blocks. Only the lines of the chunk
+    being built are held in memory. Lines longer than ``chunk_size`` are cut
+    into ``chunk_size`` pieces rather than producing an oversized chunk.
+    """
+
+    separator = "\n"
+
+    def __init__(self, chunk_size: int = 800, chunk_overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _pieces(self, lines: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, int]]:
+        for line, offset in lines:
+            if not line:
+                continue
+            for start in range(0, len(line), self.chunk_size):
+                yield line[start:start + self.chunk_size], offset + start
+
+    def _join(self, current) -> Tuple[str, int, int]:
+        text = self.separator.join(piece for piece, _ in current)
+        stripped = text.lstrip()
+        start = current[0][1] + (len(text) - len(stripped))
+        last_piece, last_offset = current[-1]
+        end = last_offset + len(last_piece.rstrip())
+        return stripped.rstrip(), start, end
+
+    def split(self, lines: Iterable[Tuple[str, int]]) -> Iterator[Tuple[str, int, int]]:
+        """Yield (chunk text, start offset, end offset)."""
+        separator_len = len(self.separator)
+        current = deque()
+        total = 0
+        for piece, offset in self._pieces(lines):
+            length = len(piece)
+            if total + length + (separator_len if current else 0) > self.chunk_size:
+                if current:
+                    chunk = self._join(current)
+                    if chunk[0]:
+                        yield chunk
+                    while total > self.chunk_overlap or (
+                        total + length + (separator_len if current else 0) > self.chunk_size and total > 0
+                    ):
+                        total -= len(current[0][0]) + (separator_len if len(current) > 1 else 0)
+                        current.popleft()
+            current.append((piece, offset))
+            total += length + (separator_len if len(current) > 1 else 0)
+        if current:
+            chunk = self._join(current)
+            if chunk[0]:
+                yield chunk
@@ -1,23 +1,33 @@
 import asyncio
-from typing import List
+import os
+import uuid
+from typing import Dict, List, Optional
 from langchain_core.documents import Document
 from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone, ServerlessSpec
 
 class PineconeManager:
     
-    def __init__(self, api_key: str, environment: str):
+    def __init__(self, api_key: str, environment: str, upsert_batch_size: int = 100):
         self.api_key = api_key
         self.environment = environment
         self.index_name = None
         self.vector_store = None
+        self.upsert_batch_size = upsert_batch_size
         self.pc = Pinecone(api_key=api_key)
 
-    async def create_vectorstore(self, 
-                               documents: List[Document], 
-                               embedding_model, 
-                               index_name: str,
-                               dimension: int = 1536) -> PineconeVectorStore:
+    def index_exists(self, index_name: str) -> bool:
+        return index_name in self.pc.list_indexes().names()
+
+    def load_vectorstore(self, index_name: str, embedding_model) -> PineconeVectorStore:
+        self.index_name = index_name
+        self.vector_store = PineconeVectorStore(
+            index_name=index_name,
+            embedding=embedding_model
+        )
+        return self.vector_store
+
+    async def ensure_index(self, index_name: str, embedding_model, dimension: int = 1536) -> PineconeVectorStore:
         self.index_name = index_name
 
         if index_name not in self.pc.list_indexes().names():
@@ -30,16 +40,84 @@ class PineconeManager:
                     region='us-east-1'
                 )
             )
+            # Give the new serverless index time to become ready
+            await asyncio.sleep(10)
 
-        self.vector_store = await asyncio.to_thread(
-            PineconeVectorStore.from_documents,
-            documents=documents,
-            embedding=embedding_model,
-            index_name=index_name
-        )
+        return self.load_vectorstore(index_name, embedding_model)
+
+    async def upsert_embeddings(self,
+                                documents: List[Document],
+                                embeddings: List[List[float]],
+                                ids: Optional[List[str]] = None,
+                                flush: bool = True):
+        ids = ids or [str(uuid.uuid4()) for _ in documents]
+        index = self.pc.Index(self.index_name)
+        vectors = [
+            {
+                "id": id_,
+                "values": embedding,
+                "metadata": {**doc.metadata, "text": doc.page_content}
+            }
+            for id_, doc, embedding in zip(ids, documents, embeddings)
+        ]
+        for start in range(0, len(vectors), self.upsert_batch_size):
+            await asyncio.to_thread(
+                index.upsert,
+                vectors=vectors[start:start + self.upsert_batch_size]
+            )
+
+    async def create_vectorstore(self, 
+                               documents: List[Document], 
+                               embedding_model, 
+                               index_name: str,
+                               dimension: int = 1536,
+                               ids: Optional[List[str]] = None) -> PineconeVectorStore:
+        await self.ensure_index(index_name, embedding_model, dimension)
+
+        texts = [doc.page_content for doc in documents]
+        embeddings = await embedding_model.aembed_documents(texts)
+        await self.upsert_embeddings(documents, embeddings, ids)
         
         return self.vector_store
 
+    def delete(self, ids: List[str], flush: bool = True):
+        if not ids or not self.index_name:
+            return
+        index = self.pc.Index(self.index_name)
+        for start in range(0, len(ids), self.upsert_batch_size):
+            index.delete(ids=ids[start:start + self.upsert_batch_size])
+
+    def flush(self):
+        # Pinecone applies every upsert and delete as it is made
+        pass
+
+    def fetch_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Chunks by ID, rebuilt from the text kept in their metadata."""
+        if not ids or not self.index_name:
+            return {}
+        index = self.pc.Index(self.index_name)
+        documents = {}
+        for start in range(0, len(ids), self.upsert_batch_size):
+            vectors = index.fetch(ids=ids[start:start + self.upsert_batch_size]).vectors
+            for id_, vector in vectors.items():
+                metadata = dict(vector.metadata or {})
+                documents[id_] = Document(page_content=metadata.pop("text", ""), metadata=metadata)
+        return documents
+
+    def fetch_vectors(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Stored vectors by ID, so chunks can be reranked without embedding them again."""
+        if not ids or not self.index_name:
+            return {}
+        index = self.pc.Index(self.index_name)
+        vectors = {}
+        for start in range(0, len(ids), self.upsert_batch_size):
+            for id_, vector in index.fetch(ids=ids[start:start + self.upsert_batch_size]).vectors.items():
+                vectors[id_] = vector.values
+        return vectors
+
+    def lexical_index_path(self, index_name: str) -> str:
+        return os.path.join("data", "bm25", f"{index_name}.json")
+
     def get_retriever(self):
         
         if not self.vector_store:
@@ -51,6 +129,12 @@ class PineconeManager:
             raise ValueError("Vector store has not been initialized")
         return self.vector_store.similarity_search(query, k=k)
 
+    async def asimilarity_search_by_vector(self, embedding: List[float], k: int = 4):
+        if not self.vector_store:
+            raise ValueError("Vector store has not been initialized")
+        # The Pinecone client is synchronous
+        return await asyncio.to_thread(self.vector_store.similarity_search_by_vector, embedding, k=k)
+
     def delete_index(self):
         if self.index_name and self.index_name in self.pc.list_indexes().names():
             self.pc.delete_index(self.index_name)
\ No newline at end of file
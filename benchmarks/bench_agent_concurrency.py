@@ -0,0 +1,62 @@
+"""Concurrent chat throughput: blocking agent.stream vs async agent.astream.
+
+    python benchmarks/bench_agent_concurrency.py --users 20 --latency 0.2
+
+Builds the real LangGraph react agent around a stub chat model that takes
+--latency seconds per call, then sends one message per user concurrently.
+The legacy path is the old sync `agent.stream` loop inside `async def`.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+from conversation import ConversationalAgent
+from stubs import StubChatModel
+
+
+class LegacyConversationalAgent(ConversationalAgent):
+    async def _run_agent(self, messages, config):
+        final_response = ""
+        for event in self.agent.stream({"messages": messages}, config=config, stream_mode="values"):
+            if "messages" in event and event["messages"]:
+                final_response = event["messages"][-1].content
+        return final_response
+
+
+async def run(agent_cls, users: int, latency: float) -> float:
+    llm = StubChatModel(latency=latency)
+    agent = create_react_agent(llm, [], checkpointer=MemorySaver())
+    conv_agent = agent_cls(agent, llm=StubChatModel(latency=latency / 4, reply="false"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        conv_agent.stream_response(f"user-{i}", "What did Chris study?")
+        for i in range(users)
+    ))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    legacy = asyncio.run(run(LegacyConversationalAgent, args.users, args.latency))
+    current = asyncio.run(run(ConversationalAgent, args.users, args.latency))
+
+    print(f"{args.users} concurrent users, {args.latency:.2f}s per LLM call")
+    print(f"sync stream:  {legacy:6.2f}s  {args.users / legacy:6.1f} chats/s")
+    print(f"async astream:{current:6.2f}s  {args.users / current:6.1f} chats/s  ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Recall-vs-latency sweep of the IVF index against exact search.
+
+    python benchmarks/bench_ann.py --vectors 50000 --dimension 1536 --queries 200
+
+Vectors are drawn around random cluster centres so the data has structure,
+like real document embeddings do. Pass --store-dir to benchmark an existing
+LocalVectorStore (its live embeddings.npy) instead.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from ann_index import IVFIndex
+from local_vector_store import LocalVectorStore
+
+
+def synthetic(n: int, dimension: int, clusters: int, rng) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--store-dir", help="Directory of an existing LocalVectorStore")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    if args.store_dir:
+        store_dir = LocalVectorStore.current_dir(args.store_dir) or args.store_dir
+        matrix = np.load(os.path.join(store_dir, LocalVectorStore.EMBEDDINGS_FILE), mmap_mode="r")
+        matrix = np.asarray(matrix, dtype=np.float32)
+        queries = matrix[rng.choice(len(matrix), args.queries)] + 0.05 * rng.standard_normal(
+            (args.queries, matrix.shape[1])).astype(np.float32)
+    else:
+        matrix = synthetic(args.vectors, args.dimension, args.clusters, rng)
+        queries = synthetic(args.queries, args.dimension, args.clusters, rng)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    index = IVFIndex(train_threshold=0)
+    index.train(matrix)
+    build = time.perf_counter() - start
+    print(f"{len(matrix)} vectors x {matrix.shape[1]} dims, {index.n_lists} lists, built in {build:.2f}s\n")
+
+    start = time.perf_counter()
+    truth = [exact_top_k(matrix, q, args.k) for q in queries]
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+    print(f"{'search':>10} {'recall@' + str(args.k):>10} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'exact':>10} {1.0:>10.3f} {exact_ms:>10.3f} {1.0:>8.1f}")
+
+    for nprobe in args.nprobe:
+        if nprobe > index.n_lists:
+            break
+        start = time.perf_counter()
+        results = [index.search(matrix, q, args.k, nprobe=nprobe)[0] for q in queries]
+        ivf_ms = (time.perf_counter() - start) / len(queries) * 1000
+        recall = np.mean([len(set(r) & set(t)) / args.k for r, t in zip(results, truth)])
+        print(f"{'nprobe=' + str(nprobe):>10} {recall:>10.3f} {ivf_ms:>10.3f} {exact_ms / ivf_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
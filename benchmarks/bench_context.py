@@ -0,0 +1,93 @@
+"""Prompt tokens per turn over a long conversation: checkpointer + last-5 replay vs the context window.
+
+    python benchmarks/bench_context.py --turns 50
+
+Runs the real LangGraph react agent around a stub chat model that records the
+tokens of every prompt it receives. The legacy path is the old setup: a
+MemorySaver checkpointer for the thread plus the system prompt and the last 5
+messages re-sent on every turn. The current path keeps history only in the
+conversation store and sends a token-budgeted window with a running summary.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+from typing import Any, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+from conversation import ConversationalAgent
+from conversation_store import InMemoryConversationStore
+from tokens import count_tokens
+from stubs import StubChatModel
+
+REPLY = " ".join(["Chris worked on retrieval pipelines and LINE chatbots at several companies."] * 6)
+SUMMARY = " ".join(["The user asked about Chris's projects, skills and work history."] * 4)
+
+
+class RecordingChatModel(StubChatModel):
+    prompt_tokens: List[int] = []
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any):
+        self.prompt_tokens.append(sum(count_tokens(m.content) + 4 for m in messages))
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+
+class LegacyConversationalAgent(ConversationalAgent):
+    def prepare_messages(self, conversation, query):
+        messages = [SystemMessage(content=self.system_prompt)]
+        for msg in conversation.get_context():
+            if msg["role"] == "human":
+                messages.append(HumanMessage(content=msg["content"]))
+            else:
+                messages.append(AIMessage(content=msg["content"]))
+        messages.append(HumanMessage(content=query))
+        return messages
+
+    async def _compact_history(self, thread_id):
+        pass
+
+
+async def run(legacy: bool, turns: int) -> List[int]:
+    llm = RecordingChatModel(latency=0, reply=REPLY)
+    if legacy:
+        agent = create_react_agent(llm, [], checkpointer=MemorySaver())
+        conv_agent = LegacyConversationalAgent(
+            agent, llm=StubChatModel(latency=0, reply=SUMMARY),
+            conversation_store=InMemoryConversationStore(max_messages=10 * turns)
+        )
+    else:
+        agent = create_react_agent(llm, [])
+        conv_agent = ConversationalAgent(
+            agent, llm=StubChatModel(latency=0, reply=SUMMARY),
+            conversation_store=InMemoryConversationStore(max_messages=10 * turns)
+        )
+    for turn in range(turns):
+        await conv_agent.stream_response("bench-user", f"Question {turn}: what did Chris build in project {turn}?")
+    return llm.prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    args = parser.parse_args()
+
+    legacy = asyncio.run(run(True, args.turns))
+    current = asyncio.run(run(False, args.turns))
+
+    print(f"prompt tokens per turn over {args.turns} turns")
+    print(f"{'turn':>5} {'legacy':>8} {'window':>8}")
+    for turn in sorted({0, 1, 4, 9, 19, 29, 39, args.turns - 1}):
+        if turn < args.turns:
+            print(f"{turn + 1:>5} {legacy[turn]:>8} {current[turn]:>8}")
+    print(f"total  {sum(legacy):>8} {sum(current):>8}  ({sum(legacy) / sum(current):.1f}x fewer)")
+    print(f"max    {max(legacy):>8} {max(current):>8}")
+
+
+if __name__ == "__main__":
+    main()
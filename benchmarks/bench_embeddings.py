@@ -0,0 +1,72 @@
+"""Compare per-chunk embedding against the batched sync and async paths.
+
+Runs entirely against the local fake server:
+
+    python benchmarks/bench_embeddings.py --chunks 2000 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from fake_openai import FakeOpenAIServer
+
+
+def make_chunks(n: int) -> list:
+    corpus = (Path(__file__).resolve().parent.parent / "corpus.txt").read_text(encoding="utf-8")
+    lines = [line for line in corpus.splitlines() if line.strip()]
+    return [f"{lines[i % len(lines)]} #{i}" for i in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--serial-sample", type=int, default=50,
+                        help="Chunks to embed one-by-one; the full serial time is extrapolated")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        os.environ["AZURE_OPENAI_ENDPOINT"] = server.endpoint
+        os.environ["AZURE_OPENAI_API_KEY"] = "fake-key"
+        os.environ["API_VERSION"] = "2024-02-01"
+
+        from embed import EmbeddingsService
+        from fake_openai import fake_embedding
+
+        service = EmbeddingsService()
+        chunks = make_chunks(args.chunks)
+
+        sample = chunks[:args.serial_sample]
+        start = time.perf_counter()
+        for text in sample:
+            service.get_embeddings_sync(text)
+        serial = (time.perf_counter() - start) / len(sample) * len(chunks)
+
+        start = time.perf_counter()
+        batched = service.get_embeddings_batch_sync(chunks)
+        batched_sync = time.perf_counter() - start
+
+        start = time.perf_counter()
+        async_results = asyncio.run(service.aget_embeddings_batch(chunks))
+        batched_async = time.perf_counter() - start
+
+        for i in (0, len(chunks) // 2, len(chunks) - 1):
+            expected = fake_embedding(chunks[i])[:4]
+            for results in (batched, async_results):
+                assert all(abs(a - b) < 1e-5 for a, b in zip(results[i][:4], expected)), \
+                    f"Embedding {i} returned out of order"
+
+        print(f"chunks: {len(chunks)}  batches: {len(service.make_batches(chunks))}")
+        print(f"serial (extrapolated): {serial:8.2f}s")
+        print(f"batched sync:          {batched_sync:8.2f}s  ({serial / batched_sync:.1f}x)")
+        print(f"batched async:         {batched_async:8.2f}s  ({serial / batched_async:.1f}x)")
+        print(f"server requests: {server.request_count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Ingestion wall time: the old one-file-at-a-time loop vs IngestPipeline.
+
+    python benchmarks/bench_ingest.py --files 12 --ocr-latency 1.0 --latency 0.2
+
+Uses the local vector backend, the fake embeddings server (--latency seconds
+per request) and a fake Document Intelligence client (--ocr-latency seconds
+per PDF). Each run starts from an empty index in a temporary directory.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from fake_openai import FakeOpenAIServer
+from stubs import FakeDocumentClient
+
+
+def make_files(directory: str, count: int) -> list:
+    corpus = (Path(__file__).resolve().parent.parent / "corpus.txt").read_text(encoding="utf-8")
+    lines = [line for line in corpus.splitlines() if line.strip()]
+    paths = []
+    for i in range(count):
+        pages = ["\n".join(f"[{i}.{p}] {lines[(i * 7 + p * 3 + j) % len(lines)]}" for j in range(25))
+                 for p in range(3)]
+        path = os.path.join(directory, f"doc_{i:03d}.pdf")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\f".join(pages))
+        paths.append(path)
+    return paths
+
+
+def make_system(ocr_latency: float):
+    from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
+    from retrieval_system import RetrievalSystem
+
+    embeddings = CustomAzureOpenAIEmbeddings(CachedEmbeddingsService(EmbeddingsService()))
+    system = RetrievalSystem(embeddings, None, None, "bench")
+    system.doc_processor.document_client = FakeDocumentClient(latency=ocr_latency)
+    return system
+
+
+async def run_serial(paths: list, ocr_latency: float) -> float:
+    system = make_system(ocr_latency)
+    start = time.perf_counter()
+    for path in paths:
+        await system.setup_from_pdf_file(path)
+    return time.perf_counter() - start
+
+
+async def run_pipeline(paths: list, ocr_latency: float) -> float:
+    from ingest_pipeline import IngestPipeline
+
+    report = await IngestPipeline(make_system(ocr_latency)).run(paths)
+    assert not report["failed"], report["failed"]
+    return report["seconds"]
+
+
+def in_fresh_dir(files: int, runner, ocr_latency: float) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.environ["LOCAL_VECTOR_DIR"] = os.path.join(directory, "vectors")
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(directory, "cache.sqlite3")
+        os.environ["INDEX_VERSION_PATH"] = os.path.join(directory, "index_version")
+        paths = make_files(directory, files)
+        return asyncio.run(runner(paths, ocr_latency))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--ocr-latency", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        os.environ.update(
+            AZURE_OPENAI_ENDPOINT=server.endpoint,
+            AZURE_OPENAI_API_KEY="fake-key",
+            API_VERSION="2024-02-01",
+            OPENAI_API_VERSION="2024-02-01",
+            VECTOR_BACKEND="local",
+            LOCAL_ANN_INDEX="none",
+            # The fake PDFs have no real text layer; every page is "OCR'd"
+            PDF_TEXT_MODE="azure",
+        )
+        cwd = os.getcwd()
+        try:
+            serial = in_fresh_dir(args.files, run_serial, args.ocr_latency)
+            pipelined = in_fresh_dir(args.files, run_pipeline, args.ocr_latency)
+        finally:
+            os.chdir(cwd)
+
+    print(f"\n{args.files} PDFs, {args.ocr_latency:.2f}s OCR each, {args.latency:.2f}s per embeddings request")
+    print(f"one at a time: {serial:6.2f}s  {args.files / serial:5.2f} files/s")
+    print(f"pipeline:      {pipelined:6.2f}s  {args.files / pipelined:5.2f} files/s  ({serial / pipelined:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
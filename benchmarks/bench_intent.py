@@ -0,0 +1,86 @@
+"""Accuracy and latency of the local clear-intent detector on a labelled set.
+
+    python benchmarks/bench_intent.py [--data benchmarks/data/clear_intent_labelled.jsonl] [--llm]
+
+By default only the rules run, and messages they can't settle count as "not
+clear" and are listed as escalations (those would go to the embedding check
+and then the LLM). With --llm, the live Azure embeddings + LLM fallback are
+used as well and need the usual .env settings.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from intent import ClearIntentDetector
+
+DEFAULT_DATA = Path(__file__).resolve().parent / "data" / "clear_intent_labelled.jsonl"
+
+
+async def evaluate(rows, detector: ClearIntentDetector, llm_fallback=None):
+    predictions, escalated = [], []
+    start = time.perf_counter()
+    for row in rows:
+        if llm_fallback is None:
+            decision, _ = detector.classify_by_rules(row["text"])
+            if decision is None:
+                escalated.append(row["text"])
+            predictions.append(bool(decision))
+        else:
+            predictions.append(await detector.detect(row["text"], llm_fallback=llm_fallback))
+    elapsed = time.perf_counter() - start
+    return predictions, escalated, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default=str(DEFAULT_DATA))
+    parser.add_argument("--llm", action="store_true", help="Use live embeddings + LLM for ambiguous messages")
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    llm_fallback = None
+    if args.llm:
+        from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
+        from conversation import ConversationalAgent
+
+        embeddings = CustomAzureOpenAIEmbeddings(CachedEmbeddingsService(EmbeddingsService()))
+        detector = ClearIntentDetector(embedding_model=embeddings)
+        llm_fallback = ConversationalAgent(agent=None, intent_detector=detector).classify_clear_intent_with_llm
+    else:
+        detector = ClearIntentDetector()
+
+    predictions, escalated, elapsed = asyncio.run(evaluate(rows, detector, llm_fallback))
+
+    tp = sum(p and r["label"] for p, r in zip(predictions, rows))
+    fp = sum(p and not r["label"] for p, r in zip(predictions, rows))
+    fn = sum(not p and r["label"] for p, r in zip(predictions, rows))
+    tn = len(rows) - tp - fp - fn
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+
+    print(f"messages:  {len(rows)}  ({sum(r['label'] for r in rows)} clear requests)")
+    print(f"accuracy:  {(tp + tn) / len(rows):.3f}")
+    print(f"precision: {precision:.3f}  recall: {recall:.3f}")
+    print(f"confusion: tp={tp} fp={fp} fn={fn} tn={tn}")
+    print(f"latency:   {elapsed / len(rows) * 1e6:.1f} us/message")
+    if args.llm:
+        print(f"decided by: {detector.stats()}")
+    else:
+        print(f"escalated past the rules: {len(escalated)}")
+        for text in escalated:
+            print(f"  - {text}")
+
+    for prediction, row in zip(predictions, rows):
+        if prediction != row["label"]:
+            print(f"MISCLASSIFIED ({'clear' if row['label'] else 'keep'}): {row['text']}")
+
+
+if __name__ == "__main__":
+    main()
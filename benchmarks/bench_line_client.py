@@ -0,0 +1,66 @@
+"""Exercise LineClient against the fake LINE server.
+
+    python benchmarks/bench_line_client.py --calls 500 --concurrency 50 --failure-rate 0.1
+
+Checks that every reply eventually lands despite injected 429/5xx failures,
+and prints retry counts and the per-operation latency histograms.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from fake_line import FakeLineServer
+from line_client import LineClient
+
+
+async def run(client: LineClient, calls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            loading = asyncio.create_task(client.start_loading_animation(f"user-{i}"))
+            await client.reply_message(f"token-{i}", f"reply {i}")
+            await loading
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--failure-status", type=int, default=429)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    with FakeLineServer(latency=args.latency, failure_rate=args.failure_rate,
+                        failure_status=args.failure_status) as server:
+        client = LineClient(access_token="fake-token", base_url=server.endpoint,
+                            max_retries=5, backoff_base=0.05)
+
+        async def go():
+            try:
+                await run(client, args.calls, args.concurrency)
+            finally:
+                await client.aclose()
+
+        start = time.perf_counter()
+        asyncio.run(go())
+        elapsed = time.perf_counter() - start
+
+        delivered = {call["body"]["replyToken"] for call in server.replies()}
+        print(f"{args.calls} replies in {elapsed:.2f}s, delivered {len(delivered)}, "
+              f"injected failures {server.failures}")
+        print(json.dumps(client.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Cold start: fresh interpreter to a ready chat system, for the API and the CLI.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Each run is a new Python process that imports the entry point and
+initialises the chat system against a local index built once up front,
+with the fake embeddings server standing in for Azure. Prints the median
+import, initialise and total times plus the startup phase breakdown.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "LLMres"))
+
+from fake_openai import FakeOpenAIServer
+
+CHILD = r"""
+import asyncio, json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {llmres!r})
+sys.path.insert(0, {root!r})
+target = {target!r}
+if target == "api":
+    import mainFastAPI
+    imported = time.perf_counter()
+    asyncio.run(mainFastAPI.chatbot_service.initialize())
+else:
+    import main
+    from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
+    from retrieval_system import RetrievalSystem
+    imported = time.perf_counter()
+    system = RetrievalSystem(CustomAzureOpenAIEmbeddings(CachedEmbeddingsService(EmbeddingsService())),
+                             None, None, "chris-data")
+    asyncio.run(system.initialize_chat_system())
+ready = time.perf_counter()
+try:
+    from startup import startup_timer
+    phases = startup_timer.report()["phases"]
+except ImportError:
+    phases = {{}}
+print(json.dumps({{"import": imported - start, "init": ready - imported, "total": ready - start,
+                  "phases": phases}}))
+"""
+
+
+def build_index(workdir: str):
+    from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
+    from retrieval_system import RetrievalSystem
+
+    system = RetrievalSystem(CustomAzureOpenAIEmbeddings(CachedEmbeddingsService(EmbeddingsService())),
+                             None, None, "chris-data")
+    asyncio.run(system.setup_from_files([str(ROOT / "corpus.txt")]))
+
+
+def run_child(target: str, workdir: str) -> dict:
+    script = CHILD.format(llmres=str(ROOT / "LLMres"), root=str(ROOT), target=target)
+    output = subprocess.run([sys.executable, "-c", script], cwd=workdir, env=os.environ.copy(),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=0.0) as server, tempfile.TemporaryDirectory() as workdir:
+        os.environ.update(
+            AZURE_OPENAI_ENDPOINT=server.endpoint,
+            AZURE_OPENAI_API_KEY="bench",
+            API_VERSION="2024-02-01",
+            OPENAI_API_VERSION="2024-02-01",
+            MODEL_NAME="chat",
+            VECTOR_BACKEND="local",
+            USER_AGENT="bench",
+        )
+        os.chdir(workdir)
+        build_index(workdir)
+
+        for target in ("api", "cli"):
+            results = [run_child(target, workdir) for _ in range(args.runs)]
+            print(f"\n{target}: median of {args.runs} runs")
+            for key in ("import", "init", "total"):
+                print(f"  {key:<8} {statistics.median(r[key] for r in results) * 1000:8.1f} ms")
+            for name in results[-1]["phases"]:
+                values = [r["phases"].get(name, 0.0) for r in results]
+                print(f"    {name:<24} {statistics.median(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
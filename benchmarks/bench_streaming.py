@@ -0,0 +1,53 @@
+"""Time to first token: buffered stream_response vs token streaming.
+
+    python benchmarks/bench_streaming.py --latency 0.3 --token-latency 0.03 --words 80
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+from conversation import ConversationalAgent
+from stubs import StubChatModel
+
+
+async def main_async(args):
+    reply = " ".join(f"word{i}" for i in range(args.words))
+    llm = StubChatModel(latency=args.latency, token_latency=args.token_latency, reply=reply)
+    agent = create_react_agent(llm, [], checkpointer=MemorySaver())
+    conv_agent = ConversationalAgent(agent, llm=StubChatModel(latency=0.0, reply="false"))
+
+    start = time.perf_counter()
+    buffered = await conv_agent.stream_response("buffered", "Tell me about Chris")
+    buffered_total = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first_token = None
+    tokens = []
+    async for token in conv_agent.stream_tokens("streamed", "Tell me about Chris"):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        tokens.append(token)
+    streamed_total = time.perf_counter() - start
+
+    assert "".join(tokens) == buffered == reply
+    print(f"buffered: first token {buffered_total:6.3f}s  total {buffered_total:6.3f}s")
+    print(f"streamed: first token {first_token:6.3f}s  total {streamed_total:6.3f}s  ({len(tokens)} chunks)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.03)
+    parser.add_argument("--words", type=int, default=80)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
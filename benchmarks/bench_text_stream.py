@@ -0,0 +1,72 @@
+"""Peak memory of splitting a large text file: whole-file load vs the streaming splitter.
+
+    python benchmarks/bench_text_stream.py --mb 10 20 40
+
+Writes a synthetic file of each size (lines from corpus.txt), then measures
+peak Python allocations with tracemalloc while producing every chunk. The
+streaming path consumes chunks one at a time like the ingest pipeline does.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "LLMres"))
+os.environ.setdefault("USER_AGENT", "ChrisBot/1.0")
+
+from document_processor import DocumentProcessor
+
+
+def write_file(path: str, megabytes: int):
+    corpus = (Path(__file__).resolve().parent.parent / "corpus.txt").read_text(encoding="utf-8")
+    lines = [line for line in corpus.splitlines() if line.strip()]
+    target = megabytes * 1024 * 1024
+    written, i = 0, 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            line = f"{i}: {lines[i % len(lines)]}\n"
+            f.write(line)
+            written += len(line.encode("utf-8"))
+            i += 1
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, peak / 1024 / 1024, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, nargs="+", default=[10, 20, 40])
+    args = parser.parse_args()
+
+    processor = DocumentProcessor()
+    print(f"{'file':>6} {'whole-file peak':>16} {'streaming peak':>15} {'chunks':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        for megabytes in args.mb:
+            path = os.path.join(directory, f"big_{megabytes}.txt")
+            write_file(path, megabytes)
+
+            def whole():
+                documents = processor.load_text_files([path])
+                return len(processor.split_documents(documents, use_char_splitter=True))
+
+            def streaming():
+                return sum(1 for _ in processor.iter_text_chunks(path))
+
+            whole_count, whole_peak, whole_time = measure(whole)
+            stream_count, stream_peak, stream_time = measure(streaming)
+            print(f"{megabytes:>4}MB {whole_peak:>12.1f} MB {stream_peak:>11.1f} MB {stream_count:>8}"
+                  f"   ({whole_time:.1f}s vs {stream_time:.1f}s, {whole_count} chunks whole-file)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Local stand-in for the LINE Messaging API.
+
+Records every call it receives and can be told to add latency or to fail a
+fraction of calls with 429/500 so the client's retry path gets exercised.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLineServer:
+    """Accepts `/v2/bot/message/reply` and `/v2/bot/chat/loading/start` on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.02, failure_rate: float = 0.0,
+                 failure_status: int = 500, retry_after: float = None, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.retry_after = retry_after
+        self.calls = []
+        self.failures = 0
+        self.reply_times = {}  # replyToken -> time.time() the reply landed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def replies(self) -> list:
+        with self._lock:
+            return [call for call in self.calls if call["path"] == "/v2/bot/message/reply"]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: dict = None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status, response, headers = server.handle(self.path, body, dict(self.headers))
+                self._send_json(status, response, headers)
+
+        return Handler
+
+    def handle(self, path: str, body: dict, headers: dict):
+        time.sleep(self.latency)
+        with self._lock:
+            if self._rng.random() < self.failure_rate:
+                self.failures += 1
+                extra = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+                return self.failure_status, {"message": "Injected failure"}, extra
+            self.calls.append({
+                "path": path,
+                "body": body,
+                "authorization": headers.get("Authorization"),
+                "received_at": time.time(),
+            })
+            if path == "/v2/bot/message/reply" and "replyToken" in body:
+                self.reply_times[body["replyToken"]] = self.calls[-1]["received_at"]
+        if path == "/v2/bot/message/reply":
+            return 200, {"sentMessages": [{"id": str(len(self.calls)), "quoteToken": "fake"}]}, {}
+        if path == "/v2/bot/chat/loading/start":
+            return 202, {}, {}
+        return 404, {"message": f"Unknown path {path}"}, {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake LINE Messaging API server")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeLineServer(port=args.port, latency=args.latency, failure_rate=args.failure_rate)
+    print(f"Fake LINE server listening on {fake.endpoint}")
+    fake._server.serve_forever()
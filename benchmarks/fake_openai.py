@@ -0,0 +1,211 @@
+"""Local stand-in for the Azure OpenAI embeddings and chat completions endpoints.
+
+Vectors are derived from a hash of the input text, so the same text always gets
+the same embedding and callers can check that results come back in input order.
+Chat completions behave like a tool-using agent: when tools are offered and no
+tool result is in the conversation yet, the reply is a call to the first tool
+with the user's message as its query; otherwise it is a fixed answer, streamed
+word by word when asked for.
+"""
+import array
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dimension: int = 1536) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dimension)]
+
+
+class FakeOpenAIServer:
+    """Serves `/openai/deployments/<name>/embeddings` and `/chat/completions` on a background thread.
+
+    ``chat_latency`` is the wait before the first token of a chat completion
+    and ``token_latency`` the wait between streamed words.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.05, dimension: int = 1536,
+                 chat_latency: float = 0.3, token_latency: float = 0.0,
+                 reply: str = "Chris studied Computer Engineering at Chulalongkorn University."):
+        self.latency = latency
+        self.dimension = dimension
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.reply = reply
+        self.request_count = 0
+        self.input_count = 0
+        self.chat_request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?")[0]
+                if path.endswith("/embeddings"):
+                    self._send_json(200, server.handle_embeddings(body))
+                elif path.endswith("/chat/completions") and body.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    for chunk in server.stream_chat(body):
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                elif path.endswith("/chat/completions"):
+                    self._send_json(200, server.handle_chat(body))
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+        return Handler
+
+    def handle_embeddings(self, body: dict) -> dict:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self._lock:
+            self.request_count += 1
+            self.input_count += len(inputs)
+        time.sleep(self.latency)
+
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, self.dimension)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array.array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(max(1, len(text) // 4) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def _chat_turn(self, body: dict):
+        """(tool call or None, reply text, prompt tokens) for a chat request."""
+        messages = body.get("messages", [])
+        with self._lock:
+            self.chat_request_count += 1
+        prompt_tokens = sum(max(1, len(str(m.get("content") or "")) // 4) for m in messages)
+        tools = body.get("tools") or []
+        if tools and not any(m.get("role") == "tool" for m in messages):
+            query = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+            call = {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": tools[0]["function"]["name"], "arguments": json.dumps({"query": query})}
+            }
+            return call, "", prompt_tokens
+        system = " ".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        # The clear-memory classifier expects a bare true/false
+        reply = "false" if "intent classifier" in system else self.reply
+        return None, reply, prompt_tokens
+
+    def _completion(self, body: dict, choice: dict, usage: dict, chunk: bool = False) -> dict:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk" if chunk else "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "chat"),
+            "choices": [choice] if choice else [],
+            "usage": usage
+        }
+
+    def handle_chat(self, body: dict) -> dict:
+        call, reply, prompt_tokens = self._chat_turn(body)
+        words = reply.split(" ")
+        time.sleep(self.chat_latency + self.token_latency * (len(words) - 1))
+        message = {"role": "assistant", "content": reply or None}
+        if call:
+            message["tool_calls"] = [call]
+        completion_tokens = max(1, len(reply) // 4)
+        return self._completion(body, {
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if call else "stop"
+        }, {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens})
+
+    def stream_chat(self, body: dict):
+        call, reply, prompt_tokens = self._chat_turn(body)
+        time.sleep(self.chat_latency)
+        if call:
+            delta = {"role": "assistant", "content": None, "tool_calls": [dict(call, index=0)]}
+            yield self._completion(body, {"index": 0, "delta": delta, "finish_reason": None}, None, chunk=True)
+            finish_reason = "tool_calls"
+        else:
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(self.token_latency)
+                token = word if i == len(words) - 1 else word + " "
+                delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                yield self._completion(body, {"index": 0, "delta": delta, "finish_reason": None}, None, chunk=True)
+            finish_reason = "stop"
+        yield self._completion(body, {"index": 0, "delta": {}, "finish_reason": finish_reason}, None, chunk=True)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            completion_tokens = max(1, len(reply) // 4)
+            yield self._completion(body, None, {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                                "total_tokens": prompt_tokens + completion_tokens}, chunk=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake Azure OpenAI server")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(port=args.port, latency=args.latency,
+                            chat_latency=args.chat_latency, token_latency=args.token_latency)
+    print(f"Fake OpenAI server listening on {fake.endpoint}")
+    fake._server.serve_forever()
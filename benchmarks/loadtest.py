@@ -0,0 +1,304 @@
+"""End-to-end load test of the real webhook app with no cloud credentials.
+
+    python benchmarks/loadtest.py --concurrency 20 --requests 200 --chat-latency 0.3
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-20240101-120000.json
+
+Starts `mainFastAPI.py` under uvicorn in a child process, pointed at local
+stand-ins: the fake OpenAI server for embeddings and chat completions, the
+local on-disk vector index (built from corpus.txt in a temporary directory)
+and the fake LINE server as the reply sink. Each of --concurrency virtual
+users posts a LINE webhook event, waits for its reply to reach the sink,
+then sends the next message from the workload.
+
+The workload is a JSONL file with one message per line, taken from a
+`message`, `text` or `title` field (so a file like requests.jsonl works
+as-is) plus an optional `user_id`. It is replayed in order, round robin,
+until --requests events have been sent.
+
+Latency is measured from posting the webhook to the reply landing at the
+fake LINE server. Errors are webhook responses other than 200, replies
+that never arrive within --timeout, and apology replies. Results are saved
+as JSON under benchmarks/results/, and --compare prints the change against
+an earlier run.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "LLMres"))
+
+from fake_line import FakeLineServer
+from fake_openai import FakeOpenAIServer
+
+DEFAULT_WORKLOAD = ROOT / "benchmarks" / "data" / "loadtest_workload.jsonl"
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+ERROR_REPLY = "I apologize, but I encountered an error"
+
+
+def load_workload(path: str) -> list:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            message = record.get("message") or record.get("text") or record.get("title")
+            if message:
+                items.append({"message": message, "user_id": record.get("user_id")})
+    if not items:
+        raise SystemExit(f"No messages found in {path}")
+    return items
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "avg": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_index(workdir: str):
+    from embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
+    from retrieval_system import RetrievalSystem
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        system = RetrievalSystem(CustomAzureOpenAIEmbeddings(CachedEmbeddingsService(EmbeddingsService())),
+                                 None, None, "chris-data")
+        asyncio.run(system.setup_from_files([str(ROOT / "corpus.txt")]))
+    finally:
+        os.chdir(cwd)
+
+
+def webhook_payload(message: str, user_id: str, reply_token: str) -> dict:
+    return {
+        "destination": "Uloadtest",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "webhookEventId": uuid.uuid4().hex,
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": reply_token,
+            "source": {"type": "user", "userId": user_id},
+            "message": {"type": "text", "id": uuid.uuid4().hex[:18], "text": message},
+        }],
+    }
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, workers: int, timeout: float = 120.0):
+    """Poll /health on fresh connections until every worker process reports itself initialised."""
+    deadline = time.monotonic() + timeout
+    ready = set()
+    async with httpx.AsyncClient(headers={"Connection": "close"}) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited with code {process.returncode}")
+            try:
+                health = (await client.get(f"{base_url}/health")).json()
+                if health.get("initialized"):
+                    ready.add(health.get("worker_pid"))
+                    if len(ready) >= workers:
+                        return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.05 if ready else 0.2)
+    raise RuntimeError(f"Only {len(ready)} of {workers} workers became ready in time")
+
+
+async def replay(base_url: str, line: FakeLineServer, workload: list, args) -> dict:
+    latencies, ack_latencies = [], []
+    errors = {"http": 0, "timeout": 0, "error_reply": 0}
+    next_item = iter(range(args.requests))
+
+    async def wait_for_reply(reply_token: str, deadline: float):
+        while time.monotonic() < deadline:
+            received_at = line.reply_times.get(reply_token)
+            if received_at is not None:
+                return received_at
+            await asyncio.sleep(0.005)
+        return None
+
+    async def user(worker: int, client: httpx.AsyncClient):
+        for i in next_item:
+            item = workload[i % len(workload)]
+            user_id = item["user_id"] or f"loadtest-user-{worker}"
+            reply_token = uuid.uuid4().hex
+            sent_at = time.time()
+            try:
+                response = await client.post(f"{base_url}/webhook",
+                                             json=webhook_payload(item["message"], user_id, reply_token))
+                ack_latencies.append(time.time() - sent_at)
+                if response.status_code != 200 or response.json().get("status") != "received":
+                    errors["http"] += 1
+                    continue
+            except httpx.HTTPError:
+                errors["http"] += 1
+                continue
+            received_at = await wait_for_reply(reply_token, time.monotonic() + args.timeout)
+            if received_at is None:
+                errors["timeout"] += 1
+                continue
+            latencies.append(received_at - sent_at)
+            reply = next(call for call in line.replies() if call["body"].get("replyToken") == reply_token)
+            if reply["body"]["messages"][0]["text"].startswith(ERROR_REPLY):
+                errors["error_reply"] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(worker, client) for worker in range(args.concurrency)))
+        duration = time.perf_counter() - start
+        health = (await client.get(f"{base_url}/health")).json()
+
+    failed = sum(errors.values())
+    return {
+        "requests": args.requests,
+        "completed": len(latencies),
+        "errors": errors,
+        "error_rate": failed / args.requests if args.requests else 0.0,
+        "duration_seconds": duration,
+        "throughput_rps": (len(latencies) - errors["error_reply"]) / duration if duration else 0.0,
+        "latency": summarize(latencies),
+        "ack_latency": summarize(ack_latencies),
+        "server": {key: health.get(key) for key in ("queue", "llm", "line_api", "memory", "retrieval")},
+    }
+
+
+def print_results(results: dict):
+    latency, ack = results["latency"], results["ack_latency"]
+    print(f"\n{results['completed']}/{results['requests']} replies in {results['duration_seconds']:.2f}s "
+          f"({results['throughput_rps']:.1f} req/s), error rate {results['error_rate']:.1%} {results['errors']}")
+    print(f"  reply latency  p50 {latency['p50'] * 1000:8.1f} ms  p95 {latency['p95'] * 1000:8.1f} ms  "
+          f"p99 {latency['p99'] * 1000:8.1f} ms  max {latency['max'] * 1000:8.1f} ms")
+    print(f"  webhook ack    p50 {ack['p50'] * 1000:8.1f} ms  p95 {ack['p95'] * 1000:8.1f} ms  "
+          f"p99 {ack['p99'] * 1000:8.1f} ms")
+
+
+def print_comparison(previous: dict, current: dict):
+    rows = [
+        ("throughput req/s", previous["throughput_rps"], current["throughput_rps"]),
+        ("error rate", previous["error_rate"], current["error_rate"]),
+    ] + [
+        (f"latency {key} ms", previous["latency"][key] * 1000, current["latency"][key] * 1000)
+        for key in ("p50", "p95", "p99")
+    ]
+    print(f"\n{'':<18} {'before':>10} {'after':>10} {'change':>8}")
+    for name, before, after in rows:
+        change = f"{(after - before) / before:+.1%}" if before else "n/a"
+        print(f"{name:<18} {before:10.3f} {after:10.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload", default=str(DEFAULT_WORKLOAD))
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for each reply")
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--line-latency", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (WEB_CONCURRENCY)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. --env WEBHOOK_WORKERS=16")
+    parser.add_argument("--output", help="where to save results (default benchmarks/results/loadtest-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+    workload = load_workload(args.workload)
+
+    with FakeOpenAIServer(latency=args.embedding_latency, chat_latency=args.chat_latency,
+                          token_latency=args.token_latency) as openai_server, \
+            FakeLineServer(latency=args.line_latency) as line_server, \
+            tempfile.TemporaryDirectory() as workdir:
+        env = dict(
+            os.environ,
+            AZURE_OPENAI_ENDPOINT=openai_server.endpoint,
+            AZURE_OPENAI_API_KEY="loadtest",
+            API_VERSION="2024-02-01",
+            OPENAI_API_VERSION="2024-02-01",
+            MODEL_NAME="chat",
+            VECTOR_BACKEND="local",
+            LINE_API_BASE=line_server.endpoint,
+            LINE_CHANNEL_ACCESS_TOKEN="loadtest",
+            USER_AGENT="loadtest",
+            WEB_CONCURRENCY=str(args.workers),
+        )
+        env.update(item.split("=", 1) for item in args.env)
+        os.environ.update(env)
+        build_index(workdir)
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = Path(workdir) / "app.log"
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "mainFastAPI:app", "--host", "127.0.0.1",
+                 "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=workdir, env=dict(env, PYTHONPATH=str(ROOT)), stdout=log, stderr=subprocess.STDOUT
+            )
+        try:
+            asyncio.run(wait_until_ready(base_url, process, args.workers))
+            print(f"Replaying {args.requests} events from {args.workload} with {args.concurrency} users")
+            results = asyncio.run(replay(base_url, line_server, workload, args))
+        except Exception:
+            print(log_path.read_text()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        results["fakes"] = {
+            "chat_requests": openai_server.chat_request_count,
+            "embedding_requests": openai_server.request_count,
+            "line_calls": len(line_server.calls),
+        }
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        **results,
+    }
+    print_results(results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print_comparison(json.loads(Path(args.compare).read_text()), results)
+
+
+if __name__ == "__main__":
+    main()
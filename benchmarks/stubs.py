@@ -0,0 +1,81 @@
+"""In-process stand-ins used by the benchmarks."""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that sleeps for ``latency`` seconds and answers with ``reply``.
+
+    The sync path blocks the calling thread like a real HTTP call would; the
+    async path yields to the event loop. When streamed, the first token arrives
+    after ``latency`` and each following word after ``token_latency``.
+    """
+
+    latency: float = 0.2
+    token_latency: float = 0.0
+    reply: str = "Chris studied Computer Engineering."
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _result(self) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        # Same total generation time as streaming the reply word by word
+        await asyncio.sleep(self.latency + self.token_latency * (len(self.reply.split(" ")) - 1))
+        return self._result()
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        words = self.reply.split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            token = word if i == len(words) - 1 else word + " "
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "StubChatModel":
+        return self
+
+
+class FakeDocumentClient:
+    """Stand-in for DocumentAnalysisClient: "OCR" decodes the bytes after ``latency`` seconds.
+
+    Pages are separated by form feeds, so a fake PDF is just UTF-8 text.
+    """
+
+    def __init__(self, latency: float = 1.0):
+        self.latency = latency
+        self.calls = 0
+
+    def begin_analyze_document(self, model_id: str, document: Any):
+        self.calls += 1
+        data = document if isinstance(document, bytes) else document.read()
+        pages = [
+            SimpleNamespace(page_number=i, width=8.5, height=11.0, unit="inch",
+                            lines=[SimpleNamespace(content=line) for line in text.splitlines()])
+            for i, text in enumerate(data.decode("utf-8", errors="replace").split("\f"), 1)
+        ]
+
+        def result():
+            time.sleep(self.latency)
+            return SimpleNamespace(pages=pages)
+
+        return SimpleNamespace(result=result)
@@ -1,11 +1,13 @@
 # mainFastAPI.py
 import json
-from fastapi import FastAPI, Request
+import secrets
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 import os
 import logging
 import asyncio
 from dotenv import load_dotenv
-import requests
 import sys
 from pathlib import Path
 
@@ -14,11 +16,20 @@ LLMRES_PATH = Path(__file__).parent / "LLMres"
 sys.path.append(str(LLMRES_PATH))
 
 # Import LLMres modules
-from LLMres.embed import EmbeddingsService, CustomAzureOpenAIEmbeddings
+from LLMres.embed import EmbeddingsService, CachedEmbeddingsService, CustomAzureOpenAIEmbeddings
 from LLMres.retrieval_system import RetrievalSystem
+from LLMres.dispatcher import KeyedDispatcher
+from LLMres.line_client import LineClient
+# Imported by bare name: RetrievalSystem records its phases into this same instance
+from startup import startup_timer
+from llm_pool import get_llm_pool
+from metrics import registry, timed, new_trace_id, install_trace_logging, SharedMetrics
+from config import ConversationStoreConfig
+startup_timer.mark("imports")
 
-# Configure logging
+# Configure logging; every line carries the trace ID of the request or event being handled
 logging.basicConfig(level=logging.INFO)
+install_trace_logging()
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -38,16 +49,18 @@ class ChatbotService:
         if not self.initialized:
             try:
                 # Initialize embedding service
-                embedding_service = EmbeddingsService()
-                custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
+                with startup_timer.phase("embedding service"):
+                    embedding_service = CachedEmbeddingsService(EmbeddingsService())
+                    custom_embeddings = CustomAzureOpenAIEmbeddings(embedding_service)
                 
                 # Initialize the retrieval system
-                self.retrieval_system = RetrievalSystem(
-                    embedding_model=custom_embeddings,
-                    pinecone_api_key=os.getenv("PINECONE_API_KEY"),
-                    pinecone_environment=os.getenv("PINECONE_ENVIRONMENT"),
-                    index_name="chris-data"
-                )
+                with startup_timer.phase("retrieval system"):
+                    self.retrieval_system = RetrievalSystem(
+                        embedding_model=custom_embeddings,
+                        pinecone_api_key=os.getenv("PINECONE_API_KEY"),
+                        pinecone_environment=os.getenv("PINECONE_ENVIRONMENT"),
+                        index_name="chris-data"
+                    )
                 
                 # Initialize the chat system
                 await self.retrieval_system.initialize_chat_system()
@@ -83,7 +96,7 @@ class ChatbotService:
             logger.error(f"Error cleaning response: {str(e)}")
             return full_response.strip()
 
-    async def get_response(self, user_id: str, message: str) -> str:
+    async def get_response(self, user_id: str, message: str, state_version: str = None) -> str:
         if not self.initialized:
             await self.initialize()
         
@@ -91,7 +104,7 @@ class ChatbotService:
             # Handle search queries
             if message.lower().startswith('search:'):
                 search_query = message[7:].strip()
-                results = self.retrieval_system.similarity_search(search_query, k=2)
+                results = await self.retrieval_system.asimilarity_search(search_query, k=2)
                 if results:
                     response_parts = []
                     for i, doc in enumerate(results, 1):
@@ -100,10 +113,11 @@ class ChatbotService:
                 return "No results found"
             
             # Handle regular chat messages
-            full_response = await self.retrieval_system.chat(user_id, message)
+            full_response = await self.retrieval_system.chat(user_id, message, state_version)
             
             # Extract only the final assistant response
-            clean_response = self.extract_assistant_response(full_response)
+            with timed("response_cleanup"):
+                clean_response = self.extract_assistant_response(full_response)
             
             # Add logging to debug response cleaning
             logger.debug(f"Original response: {full_response}")
@@ -115,84 +129,194 @@ class ChatbotService:
             logger.error(f"Error processing message: {str(e)}")
             return f"I apologize, but I encountered an error processing your message. Please try again."
 
+    async def stream_response(self, user_id: str, message: str):
+        """Yield the answer in pieces as it is generated (search results come in one piece)."""
+        if not self.initialized:
+            await self.initialize()
+
+        if message.lower().startswith('search:'):
+            yield await self.get_response(user_id, message)
+            return
+
+        async for token in self.retrieval_system.chat_stream(user_id, message):
+            yield token
+
 # Initialize the chatbot service
 chatbot_service = ChatbotService()
 
+# One pooled LINE API client for the lifetime of the app
+line_client = LineClient()
+
+async def handle_line_event(event: dict):
+    # Workers don't inherit the webhook request's context; trace the event by LINE's own ID
+    new_trace_id(event.get("webhookEventId"))
+    user_message = event["message"]["text"]
+    reply_token = event["replyToken"]
+    user_id = event["source"]["userId"]
+    
+    with timed("turn"):
+        #Animation, started alongside the chat call rather than before it
+        loading = asyncio.create_task(line_client.start_loading_animation(user_id))
+
+        # Get response from chatbot
+        bot_reply = await chatbot_service.get_response(user_id, user_message, event.get("threadVersion"))
+        
+        if not await loading:
+            logger.warning("Failed to start loading animation")
+
+        # Send response back to LINE
+        with timed("line_reply"):
+            # LINE stamps events in epoch milliseconds; the reply token's lifetime runs from then
+            issued_at = event["timestamp"] / 1000 if event.get("timestamp") else None
+            line_response = await line_client.reply_message(reply_token, bot_reply, issued_at)
+    logger.info(f"LINE API response: {line_response}")
+
+# LINE redelivers events it thinks failed; their webhookEventId has already been queued.
+# With the SQLite store the IDs are shared, so a redelivery to another worker is caught too
+recent_events = ConversationStoreConfig().create_recent_keys()
+
+# Webhook events are queued and answered by a worker pool, in order per user
+dispatcher = KeyedDispatcher(
+    handle_line_event,
+    num_workers=int(os.getenv("WEBHOOK_WORKERS", "8")),
+    max_queue=int(os.getenv("WEBHOOK_QUEUE_SIZE", "256")),
+    enqueue_timeout=float(os.getenv("WEBHOOK_ENQUEUE_TIMEOUT", "1.0"))
+)
+
+# Component stats are exported as gauges on /metrics, read at scrape time
+registry.register_stats("queue", dispatcher.stats)
+registry.register_stats("line_api", line_client.stats)
+registry.register_stats("llm", lambda: get_llm_pool().stats())
+registry.register_stats("memory", lambda: chatbot_service.retrieval_system.memory_stats() if chatbot_service.initialized else None)
+registry.register_stats("embedding_cache", lambda: chatbot_service.retrieval_system.embedding_model.embedding_service.stats() if chatbot_service.initialized else None)
+registry.register_stats("retrieval", lambda: chatbot_service.retrieval_system.retrieval_stats() if chatbot_service.initialized else None)
+
+# With several workers a scrape lands on one of them, so each shares its samples through METRICS_DIR
+shared_metrics = SharedMetrics(registry) if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else None
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace_id = new_trace_id(request.headers.get("X-Request-ID"))
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = trace_id
+    return response
+
 @app.on_event("startup")
 async def startup_event():
+    await dispatcher.start()
+    if shared_metrics:
+        shared_metrics.start()
     try:
         await chatbot_service.initialize()
         logger.info("Chatbot service initialized successfully on startup")
+        startup_timer.log()
     except Exception as e:
         logger.error(f"Failed to initialize chatbot service on startup: {str(e)}")
         # You might want to exit the application here if initialization is critical
         # sys.exit(1)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await dispatcher.stop()
+    await line_client.aclose()
+    await get_llm_pool().aclose()
+    if shared_metrics:
+        await shared_metrics.stop()
+
 @app.post("/webhook")
 async def receive_webhook(request: Request):
     try:
-        payload = await request.json()
-        logger.info(f"Received payload: {json.dumps(payload, indent=4, ensure_ascii=False)}")
-        
-        events = payload.get("events", [])
-        for event in events:
-            if event["type"] == "message" and event["message"]["type"] == "text":
-                user_message = event["message"]["text"]
-                reply_token = event["replyToken"]
-                user_id = event["source"]["userId"]
-                
-                #Animation
-                loading_success = start_loading_animation(user_id)
-                if not loading_success:
-                    logger.warning("Failed to start loading animation")
-
+        with timed("webhook"):
+            payload = await request.json()
+            logger.info(f"Received payload: {json.dumps(payload, indent=4, ensure_ascii=False)}")
+            
+            events = [
+                event for event in payload.get("events", [])
+                if event["type"] == "message" and event["message"]["type"] == "text"
+            ]
+            # Claimed before queueing, so a redelivery racing the original is skipped
+            event_ids = [event["webhookEventId"] for event in events if event.get("webhookEventId")]
+            claimed = set(await recent_events.aclaim(event_ids)) if event_ids else set()
+            unused = set(claimed)
+            queued = False
+            try:
+                batch = []
+                for event in events:
+                    user_id = event["source"]["userId"]
+                    event_id = event.get("webhookEventId")
+                    if event_id and event_id not in unused:
+                        logger.info(f"Skipping redelivered event {event_id}")
+                        registry.counter("webhook_duplicates", "Redelivered webhook events skipped").inc()
+                        continue
+                    unused.discard(event_id)
+                    if chatbot_service.initialized:
+                        # The thread as it was on arrival: a double tap queued behind the
+                        # first message shares its answer instead of running the agent again
+                        event["threadVersion"] = await chatbot_service.retrieval_system.thread_version(user_id)
+                    logger.info(f"Queueing event {event_id} for {user_id}")
+                    batch.append((user_id, event))
 
-                # Get response from chatbot
-                bot_reply = await chatbot_service.get_response(user_id, user_message)
-                
-                # Send response back to LINE
-                line_response = send_line_message(reply_token, bot_reply)
-                logger.info(f"LINE API response: {line_response}")
+                # All of the payload's events are queued or none are, so a 503 never
+                # leaves some of them running while LINE redelivers the rest
+                if batch and not await dispatcher.submit_many(batch):
+                    # Let LINE redeliver once the backlog has drained
+                    return JSONResponse(
+                        status_code=503,
+                        content={"status": "busy", "message": "Too many pending messages, retry later"}
+                    )
+                queued = True
+            finally:
+                if claimed and not queued:
+                    # Not queued, so the redelivery must not be skipped
+                    await recent_events.arelease(list(claimed))
         
-        return {"status": "received", "message": "Webhook processed successfully"}
+        return {"status": "received", "message": "Webhook queued for processing"}
     
     except Exception as e:
         logger.error(f"Error processing webhook: {str(e)}")
         return {"status": "error", "message": str(e)}
 
-def send_line_message(reply_token: str, message: str):
-    url = "https://api.line.me/v2/bot/message/reply"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('LINE_CHANNEL_ACCESS_TOKEN')}"
-    }
-    data = {
-        "replyToken": reply_token,
-        "messages": [
-            {
-                "type": "text",
-                "text": message
-            }
-        ]
-    }
-    response = requests.post(url, headers=headers, json=data)
-    if response.status_code != 200:
-        logger.error(f"Error sending LINE message: {response.status_code} {response.text}")
-    return response.json()
-
-def start_loading_animation(chat_id: str, seconds: int = 15):
-    """Start loading animation for LINE chat."""
-    url = "https://api.line.me/v2/bot/chat/loading/start"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('LINE_CHANNEL_ACCESS_TOKEN')}"
-    }
-    data = {
-        "chatId": chat_id,
-        "loadingSeconds": seconds
-    }
-    requests.post(url, headers=headers, json=data)
-       
+class ChatRequest(BaseModel):
+    user_id: str
+    message: str
+
+# Web clients get their own thread namespace so a caller can never read or
+# extend a LINE user's conversation by posting that user's ID
+WEB_THREAD_PREFIX = "web:"
+# Every call spends LLM tokens, so the endpoint needs a key unless opened explicitly
+CHAT_STREAM_API_KEY = os.getenv("CHAT_STREAM_API_KEY")
+CHAT_STREAM_ALLOW_ANONYMOUS = os.getenv("CHAT_STREAM_ALLOW_ANONYMOUS", "false").lower() == "true"
+if not CHAT_STREAM_API_KEY:
+    if CHAT_STREAM_ALLOW_ANONYMOUS:
+        logger.warning("CHAT_STREAM_ALLOW_ANONYMOUS is set: /chat/stream accepts requests without an API key")
+    else:
+        logger.warning("CHAT_STREAM_API_KEY is not set: /chat/stream rejects every request")
+
+@app.post("/chat/stream")
+async def chat_stream(chat_request: ChatRequest, x_api_key: str = Header(default="")):
+    """Server-sent events: one `data:` event per token, then `event: done`."""
+    if CHAT_STREAM_API_KEY:
+        authorized = secrets.compare_digest(x_api_key.encode(), CHAT_STREAM_API_KEY.encode())
+    else:
+        authorized = CHAT_STREAM_ALLOW_ANONYMOUS
+    if not authorized:
+        return JSONResponse(status_code=401, content={"status": "unauthorized", "message": "Invalid API key"})
+    thread_id = WEB_THREAD_PREFIX + chat_request.user_id
+
+    async def event_stream():
+        try:
+            async for token in chatbot_service.stream_response(thread_id, chat_request.message):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'message': 'Error processing your message. Please try again.'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Add health check endpoints
 @app.get("/health")
@@ -200,9 +324,23 @@ async def health_check():
     return {
         "status": "healthy",
         "initialized": chatbot_service.initialized,
-        "llmres_path": str(LLMRES_PATH)
+        "worker_pid": os.getpid(),
+        "llmres_path": str(LLMRES_PATH),
+        "queue": dispatcher.stats(),
+        "webhook_dedupe": {"tracked_event_ids": await asyncio.to_thread(len, recent_events)},
+        "line_api": line_client.stats(),
+        "startup": startup_timer.report(),
+        "llm": get_llm_pool().stats(),
+        "memory": chatbot_service.retrieval_system.memory_stats() if chatbot_service.initialized else None,
+        "retrieval": chatbot_service.retrieval_system.retrieval_stats() if chatbot_service.initialized else None
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage latencies, LLM tokens and component stats."""
+    text = await asyncio.to_thread(shared_metrics.render) if shared_metrics else registry.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 async def root():
     return {
@@ -213,4 +351,6 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    # Each worker process imports the app itself, so several workers need the import string
+    uvicorn.run("mainFastAPI:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
\ No newline at end of file